@@ -0,0 +1,447 @@
+#! /usr/bin/env python3
+'''Micro and macro benchmarks for bqa.
+
+    python benchmarks/bench.py run results.json
+    python benchmarks/bench.py compare baseline.json results.json
+
+Every benchmark is timed over several repeats of a fixed number of
+loops with a fixed seed; the best repeat is reported, as the other
+repeats only add scheduler noise.
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from statistics import median
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bqa.cards import Card, Deck, Shoe
+from bqa.dense import DenseQTable
+from bqa.game import hand_value, play
+from bqa.hands import Hand
+from bqa.player import Account, Agent
+from bqa.policy import Policy
+from bqa.qtable import QTable
+from bqa.shared import ConcurrentQTable, play_threads
+
+
+FORMAT = 1
+WEIGHTS = [0.1, 0.3, 0.6]
+BIASES = [0.25, 0.25, 0.5]
+QVALUES = [1234.0, 5678.0, 4321.0]
+
+
+def bench_hand_value(cards, hand_type=list):
+    hand = hand_type(Card('H', face) for face in (1, 6, 9, 2, 1)[:cards])
+    def run(loops):
+        for _ in range(loops):
+            hand_value(hand)
+    return run
+
+
+def bench_hand_append():
+    cards = [Card('H', face) for face in (1, 6, 9, 2, 1)]
+    def run(loops):
+        hand = Hand()
+        for i in range(loops):
+            if i % 5 == 0:
+                hand.clear()
+            hand.append(cards[i % 5])
+    return run
+
+
+def bench_deck_draw(deck_type):
+    def run(loops):
+        deck = deck_type()
+        drawn = []
+        for _ in range(loops):
+            if len(deck) < 10:
+                deck.reshuffle(drawn)
+                drawn.clear()
+            drawn.append(deck.draw())
+    return run
+
+
+def bench_deck_reshuffle(deck_type):
+    def run(loops):
+        deck = deck_type()
+        for _ in range(loops):
+            discard = [deck.draw() for _ in range(6)]
+            deck.reshuffle(discard)
+    return run
+
+
+def bench_qtable_get_hit(size):
+    def run(loops):
+        table = QTable(db=':memory:', size=size)
+        for key in range(size):
+            table.put(key, WEIGHTS, BIASES, QVALUES)
+        for i in range(loops):
+            table.get(i % size)
+        table.close()
+    return run
+
+
+def bench_qtable_get_miss(size):
+    def run(loops):
+        table = QTable(db=':memory:', size=size, flush_size=1 << 30)
+        # every get is a new state, so every get misses and evicts
+        #  a clean entry once the cache is full
+        for key in range(loops):
+            table.get(key)
+        table.close()
+    return run
+
+
+def bench_qtable_evict(size):
+    def run(loops):
+        table = QTable(db=':memory:', size=size)
+        # every put is a new state, so every put evicts a dirty
+        #  entry to the write-behind buffer once the cache is full
+        for key in range(loops):
+            table.put(key, WEIGHTS, BIASES, QVALUES)
+        table.close()
+    return run
+
+
+def bench_qtable_cold(size, many):
+    # reads SIZE keys of a database missing from the cache, one
+    #  get at a time or with one get_many
+    # the directory lives as long as the benchmark
+    d = tempfile.TemporaryDirectory()
+    db = os.path.join(d.name, 'table.db')
+    table = QTable(db=db, size=size)
+    for key in range(size):
+        table.put(key << 2, WEIGHTS, BIASES, QVALUES)
+    table.close()
+    keys = [key << 2 for key in range(size)]
+    def run(loops, d=d):
+        for _ in range(loops):
+            table = QTable(db=db, size=size)
+            if many:
+                table.get_many(keys)
+            else:
+                for key in keys:
+                    table.get(key)
+            table.close()
+    return run
+
+
+def bench_qtable_sync(size, shards):
+    # writes SIZE dirty entries to a table split across SHARDS
+    #  files
+    d = tempfile.TemporaryDirectory()
+    table = QTable(db=os.path.join(d.name, 'table.db'), size=size, flush_size=size, shards=shards)
+    def run(loops, d=d):
+        for loop in range(loops):
+            for key in range(size):
+                table.put(key << 2 | 1, WEIGHTS, BIASES, [float(loop), 0.0, 0.0])
+            table.sync()
+    return run
+
+
+def _agent():
+    return Agent(db=':memory:', account=Account(chips=1000))
+
+
+def bench_risk():
+    agent = _agent()
+    state = {
+        'game_stage': Agent.IN_ROUND,
+        'dealer_show': Card('H', 10),
+        'agent_hand': (Card('S', 9), Card('C', 4))
+    }
+    def run(loops):
+        for i in range(loops):
+            agent._risk(state, Agent.HIT)
+    return run
+
+
+def bench_softmax():
+    agent = _agent()
+    v = [12.5, -3.25, 0.0]
+    def run(loops):
+        for _ in range(loops):
+            agent._softmax(v)
+    return run
+
+
+def bench_choose():
+    policy = Policy(temperature=0.05)
+    qvalues = [[12.5, -3.25], [0.0, 0.5], [7.0, 7.5]]
+    def run(loops):
+        for i in range(loops):
+            policy.choose(qvalues[i % 3])
+    return run
+
+
+def bench_choose_many(rows):
+    policy = Policy(temperature=0.05)
+    rng = np.random.default_rng(0)
+    qvalues = rng.normal(size=(rows, 2))
+    def run(loops):
+        for _ in range(loops):
+            policy.choose_many(qvalues, rng=rng)
+    return run
+
+
+def bench_play(backend, rounds):
+    def run(loops):
+        with tempfile.TemporaryDirectory() as d:
+            for _ in range(loops):
+                agent_args = {'db': ':memory:', 'account': Account(chips=10 ** 9)}
+                if backend == 'dense':
+                    agent_args['table'] = DenseQTable(path=os.path.join(d, 'table.dqt'))
+                play(
+                    game_args={'seed': 0, 'rounds': rounds},
+                    dealer_args={'account': Account(chips=10 ** 9)},
+                    agent_args=agent_args
+                )
+    return run
+
+
+def bench_play_threads(threads, rounds):
+    # THREADS agents learning into one ConcurrentQTable
+    def run(loops):
+        with tempfile.TemporaryDirectory() as d:
+            for loop in range(loops):
+                table = ConcurrentQTable(db=os.path.join(d, 'table{}.db'.format(loop)))
+                play_threads(threads, {'seed': 0, 'rounds': rounds}, {}, table, agent_chips=10 ** 9, dealer_chips=10 ** 9)
+                table.close()
+    return run
+
+
+# name -> (benchmark, loops per repeat, units of work per loop)
+MICRO = {
+    'hand_value[2]': (bench_hand_value(2), 100000, 1),
+    'hand_value[5]': (bench_hand_value(5), 100000, 1),
+    'hand_value[Hand,5]': (bench_hand_value(5, Hand), 100000, 1),
+    'Hand.append': (bench_hand_append(), 100000, 1),
+    'Deck.draw': (bench_deck_draw(Deck), 100000, 1),
+    'Shoe.draw': (bench_deck_draw(Shoe), 100000, 1),
+    'Deck.reshuffle': (bench_deck_reshuffle(Deck), 10000, 1),
+    'Shoe.reshuffle': (bench_deck_reshuffle(Shoe), 10000, 1),
+    'QTable.get[hit,64]': (bench_qtable_get_hit(64), 100000, 1),
+    'QTable.get[hit,4096]': (bench_qtable_get_hit(4096), 100000, 1),
+    'QTable.get[miss,64]': (bench_qtable_get_miss(64), 20000, 1),
+    'QTable.get[miss,4096]': (bench_qtable_get_miss(4096), 20000, 1),
+    'QTable.get[cold,4096]': (bench_qtable_cold(4096, False), 5, 4096),
+    'QTable.get_many[cold,4096]': (bench_qtable_cold(4096, True), 5, 4096),
+    'QTable.sync[4096,shards=1]': (bench_qtable_sync(4096, 1), 5, 4096),
+    'QTable.sync[4096,shards=4]': (bench_qtable_sync(4096, 4), 5, 4096),
+    'QTable.put[evict,64]': (bench_qtable_evict(64), 20000, 1),
+    'QTable.put[evict,4096]': (bench_qtable_evict(4096), 20000, 1),
+    'Agent._risk': (bench_risk(), 20000, 1),
+    'Agent._softmax': (bench_softmax(), 100000, 1),
+    'Policy.choose': (bench_choose(), 100000, 1),
+}
+if np is not None:
+    MICRO['Policy.choose_many[4096]'] = (bench_choose_many(4096), 100, 4096)
+MACRO = {
+    'play[sqlite]': (bench_play('sqlite', 5000), 1, 5000),
+    'play[dense]': (bench_play('dense', 5000), 1, 5000),
+    'play[shared,threads=1]': (bench_play_threads(1, 5000), 1, 5000),
+    'play[shared,threads=4]': (bench_play_threads(4, 5000), 1, 5000),
+}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        )
+        return out.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    '''Returns a description of the machine and interpreter the
+    benchmarks ran on.'''
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'commit': _git_commit()
+    }
+
+
+def measure(fn, loops, work, repeat):
+    '''Times REPEAT runs of LOOPS loops of FN.
+
+    Returns:
+        (dict): The best and median seconds per unit of work and
+        the units of work per second of the best run.
+    '''
+    times = []
+    for _ in range(repeat):
+        random.seed(0)
+        start = time.perf_counter()
+        fn(loops)
+        times.append((time.perf_counter() - start) / (loops * work))
+    best = min(times)
+    return {'best': best, 'median': median(times), 'per_sec': 1 / best if best else 0, 'repeat': repeat}
+
+
+def run(names=None, repeat=5, micro=True, macro=True):
+    '''Runs the selected benchmarks.
+
+    Args:
+        names (list): Only run the benchmarks with these names.
+        repeat (int): The number of timed runs of each benchmark.
+        micro (bool): Run the micro benchmarks.
+        macro (bool): Run the macro benchmarks.
+
+    Returns:
+        (dict): The metadata and the results by benchmark name.
+    '''
+    suites = []
+    if micro:
+        suites.append(('micro', MICRO))
+    if macro:
+        suites.append(('macro', MACRO))
+    results = dict()
+    for kind, suite in suites:
+        for name, (fn, loops, work) in suite.items():
+            if names and name not in names:
+                continue
+            result = measure(fn, loops, work, repeat)
+            result['kind'] = kind
+            results[name] = result
+            print('{:<24} {:>12.3f} us {:>14.1f}/s'.format(name, result['best'] * 1e6, result['per_sec']), file=sys.stderr)
+    return {'format': FORMAT, 'metadata': metadata(), 'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    '''Compares two result files.
+
+    Args:
+        baseline (dict): The results to compare against.
+        current (dict): The new results.
+        threshold (float): The relative slowdown flagged as a
+        regression, 0.1 for 10%.
+
+    Returns:
+        (list): A (name, baseline, current, change, regressed)
+        row for every benchmark in both files, where change is
+        the relative change of the best time. A benchmark
+        regressed if it slowed down by more than THRESHOLD and
+        beyond the baseline's median.
+    '''
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or not base['best']:
+            continue
+        change = result['best'] / base['best'] - 1
+        # a slowdown within the spread of the baseline's own
+        #  repeats is noise
+        regressed = change > threshold and result['best'] > base['median']
+        rows.append((name, base['best'], result['best'], change, regressed))
+    return rows
+
+
+def run_run(args):
+    results = run(names=args.names, repeat=args.repeat, micro=not args.macro_only, macro=not args.micro_only)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Wrote {} results to {}'.format(len(results['results']), args.output))
+
+
+def run_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline['metadata'].get('platform') != current['metadata'].get('platform'):
+        print('warning: the results come from different platforms')
+    rows = compare(baseline, current, threshold=args.threshold)
+    for name, base, new, change, regressed in rows:
+        print('{:<24} {:>12.3f} us {:>12.3f} us {:>+8.1f}%{}'.format(
+            name, base * 1e6, new * 1e6, change * 100, '  SLOWER' if regressed else ''))
+    regressions = sum(row[4] for row in rows)
+    print('{} of {} benchmarks regressed by more than {:.0f}%'.format(regressions, len(rows), args.threshold * 100))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs and compares the bqa benchmarks.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    run_parser = subparsers.add_parser(
+        'run',
+        help='Runs the benchmarks and writes their results as JSON.'
+    )
+    run_parser.add_argument(
+        'output',
+        type=str,
+        help='The JSON file to write.'
+    )
+    run_parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        default=5,
+        type=int,
+        help='The number of timed runs of each benchmark.'
+    )
+    run_parser.add_argument(
+        '--only',
+        dest='names',
+        nargs='+',
+        default=None,
+        help='Only run the benchmarks with these names.'
+    )
+    run_parser.add_argument(
+        '--micro-only',
+        dest='micro_only',
+        action='store_true',
+        help='Skip the macro benchmarks.'
+    )
+    run_parser.add_argument(
+        '--macro-only',
+        dest='macro_only',
+        action='store_true',
+        help='Skip the micro benchmarks.'
+    )
+    run_parser.set_defaults(func=run_run)
+    compare_parser = subparsers.add_parser(
+        'compare',
+        help='Flags the benchmarks that got slower between two result files. Exits with 1 on a regression.'
+    )
+    compare_parser.add_argument(
+        'baseline',
+        type=str,
+        help='The results to compare against.'
+    )
+    compare_parser.add_argument(
+        'current',
+        type=str,
+        help='The new results.'
+    )
+    compare_parser.add_argument(
+        '--threshold',
+        dest='threshold',
+        default=0.1,
+        type=float,
+        help='The relative slowdown flagged as a regression, 0.1 for 10%%.'
+    )
+    compare_parser.set_defaults(func=run_compare)
+    args = parser.parse_args()
+    args.func(args)
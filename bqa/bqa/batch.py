@@ -0,0 +1,252 @@
+from math import sqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bqa.dealer import STAND
+from bqa.dense import DEALER_VALUES, TOTALS
+
+
+# the rules mirror bqa.game.play: every hand is dealt from a
+#  freshly shuffled 52 card deck, the dealer draws while below
+#  DEALER_STAND and a draw returns half the wager
+DEALER_STAND = STAND
+PAYOUTS = {'win': 1.0, 'draw': -0.5, 'loss': -1.0}
+# a hand can hold at most 11 cards before busting
+MAX_CARDS = 11
+# 95% two-sided normal quantile
+Z = 1.959963984540054
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('the batch simulator requires numpy, install bqa[batch]')
+
+
+def threshold_policy(stand_on=17):
+    '''Returns a policy that hits every total below STAND_ON.
+
+    Returns:
+        (numpy.ndarray): A (dealer value, total, soft) boolean
+        array that is True where the agent hits.
+    '''
+    _require_numpy()
+    policy = np.zeros((DEALER_VALUES, TOTALS, 2), dtype=bool)
+    policy[:, :stand_on, :] = True
+    return policy
+
+
+def dense_policy(table, fallback=None):
+    '''Returns the greedy hit/stand policy of a DenseQTable.
+    Slots the table never visited use FALLBACK.
+
+    Args:
+        table (DenseQTable): The learned table.
+        fallback (numpy.ndarray): The policy for unvisited
+        slots, threshold_policy() by default.
+
+    Returns:
+        (numpy.ndarray): A (dealer value, total, soft) boolean
+        array that is True where the agent hits.
+    '''
+    _require_numpy()
+    policy = threshold_policy() if fallback is None else fallback.copy()
+    flat = policy.reshape(-1)
+    for slot, qvalues in enumerate(table.in_round_qvalues()):
+        if qvalues is not None:
+            # STAND is action 0 and HIT action 1
+            flat[slot] = qvalues[1] > qvalues[0]
+    return policy
+
+
+def policy_qvalues(policy):
+    '''Returns the Q-values under which a greedy chooser follows
+    POLICY, 1 for the policy's action and 0 for the other.
+
+    Args:
+        policy (numpy.ndarray): A (dealer value, total, soft)
+        boolean array that is True where the agent hits.
+
+    Returns:
+        (numpy.ndarray): A (dealer value, total, soft, action)
+        array of the STAND and HIT Q-values.
+    '''
+    _require_numpy()
+    qvalues = np.zeros(policy.shape + (2,))
+    qvalues[..., 0] = ~policy
+    qvalues[..., 1] = policy
+    return qvalues
+
+
+def dense_qvalues(table, fallback=None):
+    '''Returns the STAND and HIT Q-values of a DenseQTable.
+    Slots the table never visited hold the policy_qvalues of
+    FALLBACK.
+
+    Args:
+        table (DenseQTable): The learned table.
+        fallback (numpy.ndarray): The policy for unvisited
+        slots, threshold_policy() by default.
+
+    Returns:
+        (numpy.ndarray): A (dealer value, total, soft, action)
+        array of the STAND and HIT Q-values.
+    '''
+    _require_numpy()
+    qvalues = policy_qvalues(threshold_policy() if fallback is None else fallback)
+    flat = qvalues.reshape(-1, 2)
+    for slot, values in enumerate(table.in_round_qvalues()):
+        if values is not None:
+            flat[slot] = values[:2]
+    return qvalues
+
+
+def _best_totals(totals, aces):
+    soft = aces & (totals + 10 <= 21)
+    return np.where(soft, totals + 10, totals), soft
+
+
+class _Decks:
+    # one single deck per hand, shuffled lazily with a partial
+    #  Fisher-Yates so only the positions actually drawn from
+    #  are ever shuffled
+
+    def __init__(self, rng, hands):
+        deck = np.minimum(np.tile(np.arange(1, 14, dtype=np.int8), 4), 10)
+        self.cards = np.tile(deck, (hands, 1))
+        self._rng = rng
+        self._rows = np.arange(hands)
+        self._shuffled = 0
+
+
+    def shuffle_to(self, n):
+        cards, rows = self.cards, self._rows
+        for i in range(self._shuffled, min(n, 52)):
+            j = i + self._rng.integers(0, 52 - i, size=len(rows))
+            swapped = cards[rows, j]
+            cards[rows, j] = cards[:, i]
+            cards[:, i] = swapped
+        self._shuffled = max(self._shuffled, n)
+
+
+    def draw(self, ptr):
+        self.shuffle_to(int(ptr.max()) + 1)
+        return self.cards[self._rows, ptr]
+
+
+def simulate(policy, hands, rng, chooser=None):
+    '''Plays HANDS independent hands against POLICY at once.
+
+    Args:
+        policy (numpy.ndarray): A (dealer value, total, soft)
+        boolean array that is True where the agent hits, or the
+        (dealer value, total, soft, action) Q-values of
+        dense_qvalues when CHOOSER is given.
+        hands (int): The number of hands to play.
+        rng (numpy.random.Generator): The random generator.
+        chooser (bqa.policy.Policy): Chooses every decision
+        from the STAND and HIT Q-values in POLICY.
+
+    Returns:
+        (numpy.ndarray): The payout of each hand in wagers.
+    '''
+    _require_numpy()
+    decks = _Decks(rng, hands)
+    decks.shuffle_to(4)
+    cards = decks.cards
+    # bqa.game.play deals dealer, agent, dealer, agent
+    up = cards[:, 0]
+    dealer = cards[:, 0].astype(np.int16) + cards[:, 2]
+    dealer_aces = (cards[:, 0] == 1) | (cards[:, 2] == 1)
+    agent = cards[:, 1].astype(np.int16) + cards[:, 3]
+    agent_aces = (cards[:, 1] == 1) | (cards[:, 3] == 1)
+    ptr = np.full(hands, 4)
+    # the agent acts until it stands or busts
+    active = np.ones(hands, dtype=bool)
+    for _ in range(MAX_CARDS):
+        best, soft = _best_totals(agent, agent_aces)
+        if chooser is None:
+            active &= policy[up - 1, np.minimum(best, TOTALS - 1), soft.astype(np.int8)]
+        else:
+            # HIT is action 1
+            rows = np.flatnonzero(active)
+            qvalues = policy[up[rows] - 1, np.minimum(best[rows], TOTALS - 1), soft[rows].astype(np.int8)]
+            active[rows] = chooser.choose_many(qvalues, rng=rng) == 1
+        if not active.any():
+            break
+        card = decks.draw(ptr)
+        agent += np.where(active, card, 0)
+        agent_aces |= active & (card == 1)
+        ptr += active
+        active &= agent <= 21
+    agent_best, _ = _best_totals(agent, agent_aces)
+    agent_bust = agent > 21
+    # the dealer only draws when the agent stood
+    drawing = ~agent_bust
+    for _ in range(MAX_CARDS):
+        best, _ = _best_totals(dealer, dealer_aces)
+        drawing &= best < DEALER_STAND
+        if not drawing.any():
+            break
+        card = decks.draw(ptr)
+        dealer += np.where(drawing, card, 0)
+        dealer_aces |= drawing & (card == 1)
+        ptr += drawing
+    dealer_best, _ = _best_totals(dealer, dealer_aces)
+    dealer_bust = dealer > 21
+    win = ~agent_bust & (dealer_bust | (agent_best > dealer_best))
+    draw = ~agent_bust & ~dealer_bust & (agent_best == dealer_best)
+    payouts = np.full(hands, PAYOUTS['loss'])
+    payouts[win] = PAYOUTS['win']
+    payouts[draw] = PAYOUTS['draw']
+    return payouts
+
+
+def _interval(mean, variance, n):
+    half = Z * sqrt(variance / n) if n else 0
+    return (mean - half, mean + half)
+
+
+def evaluate(policy, hands, seed=0, chunk=1 << 18, chooser=None):
+    '''Evaluates POLICY over HANDS hands, simulated in chunks of
+    CHUNK hands to bound memory.
+
+    Args:
+        policy (numpy.ndarray): The policy or Q-values passed
+        to simulate.
+        hands (int): The number of hands to play.
+        seed (int): The seed of the random generator.
+        chunk (int): The number of hands simulated at once.
+        chooser (bqa.policy.Policy): See simulate.
+
+    Returns:
+        (dict): The expected value per wager and the win, draw
+        and loss rates, each with a 95% confidence interval.
+    '''
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    played = 0
+    total = 0.0
+    total_sq = 0.0
+    counts = {name: 0 for name in PAYOUTS}
+    while played < hands:
+        n = min(chunk, hands - played)
+        payouts = simulate(policy, n, rng, chooser=chooser)
+        total += float(payouts.sum())
+        total_sq += float(np.square(payouts).sum())
+        for name, payout in PAYOUTS.items():
+            counts[name] += int(np.count_nonzero(payouts == payout))
+        played += n
+    ev = total / played if played else 0
+    results = {
+        'hands': played,
+        'ev': ev,
+        'ev_ci': _interval(ev, max(total_sq / played - ev * ev, 0) if played else 0, played)
+    }
+    for name, count in counts.items():
+        rate = count / played if played else 0
+        results['{}_rate'.format(name)] = rate
+        results['{}_ci'.format(name)] = _interval(rate, rate * (1 - rate), played)
+    return results
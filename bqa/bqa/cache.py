@@ -0,0 +1,371 @@
+from collections import OrderedDict
+
+
+class Cache:
+    '''Base class for the QTable eviction engines. A cache maps
+    state hashes to QTable entries and decides which entry to
+    evict once it is full. Every operation is O(1) (amortized
+    for CLOCK).
+    '''
+
+    def __init__(self, size):
+        '''Returns a new cache that holds at most SIZE entries.
+
+        Args:
+            size (int): The max number of entries to cache.
+        '''
+        if size < 1:
+            raise ValueError('cache size must be at least 1')
+        self._size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __contains__(self, key):
+        raise NotImplementedError
+
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+    def clear(self):
+        '''Removes every entry from the cache. The counters are
+        left untouched.'''
+        raise NotImplementedError
+
+
+    def get(self, key):
+        '''Returns the value cached for KEY or None, updating
+        the hit/miss counters and the recency of KEY.'''
+        raise NotImplementedError
+
+
+    def items(self):
+        '''Returns a list of (key, value) tuples for every
+        cached entry.'''
+        raise NotImplementedError
+
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+
+    def peek(self, key):
+        '''Returns the value cached for KEY or None without
+        touching the counters or the recency of KEY.'''
+        raise NotImplementedError
+
+
+    def pop(self, key):
+        '''Removes KEY from the cache and returns its value, or
+        None if KEY is not cached.'''
+        raise NotImplementedError
+
+
+    def put(self, key, value):
+        '''Stores VALUE under KEY.
+
+        Returns:
+            (tuple): The evicted (key, value) pair if storing
+            KEY required an eviction, otherwise None.
+        '''
+        raise NotImplementedError
+
+
+    def stats(self):
+        '''Returns the hit/miss/eviction counters as a dict.'''
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'capacity': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0
+        }
+
+
+class LRUCache(Cache):
+    '''Least recently used eviction on top of an OrderedDict.'''
+
+    def __init__(self, size):
+        super().__init__(size)
+        self._entries = OrderedDict()
+
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+
+    def items(self):
+        return list(self._entries.items())
+
+
+    def peek(self, key):
+        return self._entries.get(key)
+
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+
+    def put(self, key, value):
+        entries = self._entries
+        if key in entries:
+            entries[key] = value
+            entries.move_to_end(key)
+            return None
+        evicted = None
+        if len(entries) >= self._size:
+            evicted = entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = value
+        return evicted
+
+
+class ClockCache(Cache):
+    '''Second chance (CLOCK) eviction. Entries live in a fixed
+    ring of slots, each with a reference bit that is set on
+    access and cleared as the hand sweeps past it.
+    '''
+
+    def __init__(self, size):
+        super().__init__(size)
+        self._keys = [None] * size
+        self._values = [None] * size
+        self._referenced = bytearray(size)
+        self._slots = dict()
+        self._free = list(range(size - 1, -1, -1))
+        self._hand = 0
+
+
+    def __contains__(self, key):
+        return key in self._slots
+
+
+    def __len__(self):
+        return len(self._slots)
+
+
+    def clear(self):
+        size = self._size
+        self._keys = [None] * size
+        self._values = [None] * size
+        self._referenced = bytearray(size)
+        self._slots.clear()
+        self._free = list(range(size - 1, -1, -1))
+        self._hand = 0
+
+
+    def get(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._referenced[slot] = 1
+        return self._values[slot]
+
+
+    def items(self):
+        return [(key, self._values[slot]) for key, slot in self._slots.items()]
+
+
+    def peek(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return self._values[slot]
+
+
+    def pop(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return None
+        value = self._values[slot]
+        self._keys[slot] = None
+        self._values[slot] = None
+        self._referenced[slot] = 0
+        self._free.append(slot)
+        return value
+
+
+    def put(self, key, value):
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._values[slot] = value
+            self._referenced[slot] = 1
+            return None
+        evicted = None
+        if self._free:
+            slot = self._free.pop()
+        else:
+            # sweep the hand until an unreferenced slot is found,
+            #  giving every referenced slot a second chance
+            referenced = self._referenced
+            hand = self._hand
+            while referenced[hand]:
+                referenced[hand] = 0
+                hand = (hand + 1) % self._size
+            slot = hand
+            self._hand = (hand + 1) % self._size
+            evicted = (self._keys[slot], self._values[slot])
+            del self._slots[evicted[0]]
+            self.evictions += 1
+        self._keys[slot] = key
+        self._values[slot] = value
+        self._referenced[slot] = 0
+        self._slots[key] = slot
+        return evicted
+
+
+class TwoQueueCache(Cache):
+    '''The full 2Q algorithm (Johnson & Shasha). New entries
+    enter a FIFO probation queue (A1in); entries that are
+    requested again after falling out of it are remembered in a
+    ghost queue (A1out) and promoted to the main LRU queue (Am)
+    on their next insertion. This keeps one-off states from
+    flushing the frequently visited ones.
+    '''
+
+    def __init__(self, size, kin=0.25, kout=0.5):
+        '''Returns a new 2Q cache.
+
+        Args:
+            size (int): The max number of entries to cache.
+            kin (float): The fraction of SIZE reserved for the
+            probation queue.
+            kout (float): The number of ghost keys to remember
+            as a fraction of SIZE.
+        '''
+        super().__init__(size)
+        self._kin = max(1, int(size * kin))
+        self._kout = max(1, int(size * kout))
+        self._a1in = OrderedDict()
+        self._a1out = OrderedDict()
+        self._am = OrderedDict()
+
+
+    def __contains__(self, key):
+        return key in self._am or key in self._a1in
+
+
+    def __len__(self):
+        return len(self._am) + len(self._a1in)
+
+
+    def _reclaim(self):
+        if self._a1in and (len(self._a1in) > self._kin or not self._am):
+            key, value = self._a1in.popitem(last=False)
+            self._a1out[key] = None
+            if len(self._a1out) > self._kout:
+                self._a1out.popitem(last=False)
+        else:
+            key, value = self._am.popitem(last=False)
+        self.evictions += 1
+        return key, value
+
+
+    def clear(self):
+        self._a1in.clear()
+        self._a1out.clear()
+        self._am.clear()
+
+
+    def get(self, key):
+        value = self._am.get(key)
+        if value is not None:
+            self.hits += 1
+            self._am.move_to_end(key)
+            return value
+        value = self._a1in.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+
+    def items(self):
+        return list(self._a1in.items()) + list(self._am.items())
+
+
+    def peek(self, key):
+        value = self._am.get(key)
+        if value is None:
+            value = self._a1in.get(key)
+        return value
+
+
+    def pop(self, key):
+        value = self._am.pop(key, None)
+        if value is None:
+            value = self._a1in.pop(key, None)
+        return value
+
+
+    def put(self, key, value):
+        if key in self._am:
+            self._am[key] = value
+            self._am.move_to_end(key)
+            return None
+        if key in self._a1in:
+            self._a1in[key] = value
+            return None
+        evicted = None
+        if len(self) >= self._size:
+            evicted = self._reclaim()
+        if key in self._a1out:
+            del self._a1out[key]
+            self._am[key] = value
+        else:
+            self._a1in[key] = value
+        return evicted
+
+
+POLICIES = {
+    'lru': LRUCache,
+    'clock': ClockCache,
+    '2q': TwoQueueCache
+}
+
+
+def make_cache(policy, size):
+    '''Returns a new cache implementing POLICY.
+
+    Args:
+        policy (str): One of 'lru', 'clock' or '2q'.
+        size (int): The max number of entries to cache.
+
+    Returns:
+        (Cache): A cache instance.
+    '''
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError('unknown eviction policy: {}'.format(policy))
+    return cls(size)
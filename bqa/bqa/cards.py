@@ -1,24 +1,51 @@
 import random
-from dataclasses import dataclass
+from array import array
+
+from bqa.counting import CardCount
+
+
+SUITS = ('H', 'S', 'D', 'C')
+_SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+# the blackjack value of each face, indexed by face
+FACE_VALUES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+
+
+def card_code(suit, face):
+    '''Returns the code 0-51 of the card with SUIT and FACE.'''
+    return _SUIT_INDEX[suit] * 13 + face - 1
 
 
-@dataclass
 class Card:
-    suit: str
-    face: int
+    '''A view of a card code. Cards are immutable and the 52
+    canonical instances are interned in CARDS, so hands and
+    decks never allocate new ones.
+    '''
+
+    __slots__ = ('suit', 'face', 'code', 'value')
+
+    def __init__(self, suit, face):
+        self.suit = suit
+        self.face = face
+        self.code = card_code(suit, face)
+        self.value = FACE_VALUES[face]
+
 
     def __hash__(self):
-        return hash((self.suit, self.face))
+        return self.code
 
 
     def __eq__(self, other):
         if not isinstance(other, Card): return False
-        return self.face == other.face and self.suit == other.suit
+        return self.code == other.code
+
+
+    def __repr__(self):
+        return 'Card(suit={!r}, face={!r})'.format(self.suit, self.face)
 
 
     def __str__(self):
         return '{} of {}'.format(
-            self.face_as_str(), 
+            self.face_as_str(),
             self.suit_as_str()
         )
 
@@ -28,14 +55,7 @@ class Card:
 
 
     def face_value(self):
-        if self.face == 11:
-            return 10
-        elif self.face == 12:
-            return 10
-        elif self.face == 13:
-            return 10
-        else:
-            return self.face
+        return self.value
 
 
     def face_as_str(self):
@@ -55,14 +75,23 @@ class Card:
         return self.suit
 
 
+# the interned cards, indexed by code
+CARDS = tuple(
+    Card(suit, face)
+    for suit in SUITS
+    for face in range(1, 14)
+)
+# the sorted card codes of a full deck
+_DECK_ORDER = array('B', range(52))
+
+
 class Deck:
 
     def __init__(self):
-        self._cards = [
-            Card(suit, face) 
-            for suit in ['H', 'S', 'D', 'C'] 
-            for face in range(1, 14)
-        ]
+        # the deck holds card codes, CARDS maps them back
+        self._cards = array('B', range(52))
+        # the cards seen since the last shuffle
+        self.count = CardCount(1)
         random.shuffle(self._cards)
 
 
@@ -70,10 +99,154 @@ class Deck:
         return len(self._cards)
 
 
-    def draw(self) -> Card:
-        return self._cards.pop()
+    def draw(self, seen=True) -> Card:
+        '''Draws the top card. Unless SEEN is False, e.g. for a
+        hole card, the card is removed from the deck's count; a
+        hidden card should be passed to count.see once revealed.
+        '''
+        card = CARDS[self._cards.pop()]
+        if seen:
+            self.count.see(card)
+        return card
+
+
+    def draw_code(self) -> int:
+        code = self._cards.pop()
+        self.count.see(CARDS[code])
+        return code
+
+
+    def get_state(self):
+        '''Returns the order of the deck and its count as a JSON
+        serializable dict.'''
+        return {'cards': list(self._cards), 'count': self.count.get_state()}
+
+
+    def reshuffle(self, discard: list):
+        self._cards.extend(card.code for card in discard)
+        self.shuffle()
+
+
+    def set_state(self, state):
+        '''Restores a deck returned by get_state.'''
+        self._cards = array('B', state['cards'])
+        self.count.set_state(state['count'])
+
+
+    def shuffle(self):
+        # start from a sorted deck so the order only depends on
+        #  the state of the random module
+        if len(self._cards) == len(_DECK_ORDER):
+            # every card is back, so the sorted deck is the
+            #  template and nothing is allocated
+            self._cards[:] = _DECK_ORDER
+        else:
+            self._cards = array('B', sorted(self._cards))
+        random.shuffle(self._cards)
+        self.count.reset()
+
+
+class Shoe:
+
+    def __init__(self, decks=6, penetration=0.75):
+        '''Returns a shuffled shoe of DECKS decks. Cards are drawn
+        by advancing a pointer over a preallocated array of card
+        codes and the shoe is only reshuffled, in place, once the
+        cut card placed after PENETRATION of the shoe comes up.
+
+        Args:
+            decks (int): The number of decks in the shoe.
+            penetration (float): The fraction of the shoe dealt
+            before the cut card comes up, in (0, 1].
+
+        Returns:
+            (Shoe): A Shoe instance.
+        '''
+        if decks < 1:
+            raise ValueError('a shoe needs at least one deck')
+        if not 0 < penetration <= 1:
+            raise ValueError('penetration must be in (0, 1]')
+        self._cards = array('B', range(52)) * decks
+        # every shuffle starts from this order so the shoe only
+        #  depends on the state of the random module
+        self._order = array('B', self._cards)
+        self._cut = max(1, int(len(self._cards) * penetration))
+        self._next = 0
+        self.decks = decks
+        self.shuffles = 0
+        # the cards seen since the last shuffle
+        self.count = CardCount(decks)
+        self.shuffle()
+
+
+    def __len__(self):
+        return len(self._cards) - self._next
+
+
+    def cut_card_reached(self):
+        return self._next >= self._cut
+
+
+    def draw(self, seen=True) -> Card:
+        '''Draws the next card. Unless SEEN is False, e.g. for a
+        hole card, the card is removed from the shoe's count; a
+        hidden card should be passed to count.see once revealed.
+        '''
+        # a round that runs past the end of the shoe is finished
+        #  from a freshly shuffled shoe
+        if self._next == len(self._cards):
+            self.shuffle()
+        card = CARDS[self._cards[self._next]]
+        self._next += 1
+        if seen:
+            self.count.see(card)
+        return card
+
+
+    def draw_code(self) -> int:
+        return self.draw().code
 
 
     def reshuffle(self, discard: list):
-        self._cards.extend(discard)
+        '''Called between rounds with the cards of the previous
+        round. The discarded cards never leave the preallocated
+        shoe, so this only shuffles once the cut card has come
+        up.
+
+        Returns:
+            (bool): True if the shoe was shuffled.
+        '''
+        if self._next < self._cut:
+            return False
+        self.shuffle()
+        return True
+
+
+    def get_state(self):
+        '''Returns the order of the shoe, the position of the next
+        card and the count as a JSON serializable dict.'''
+        return {
+            'cards': list(self._cards),
+            'next': self._next,
+            'shuffles': self.shuffles,
+            'count': self.count.get_state()
+        }
+
+
+    def set_state(self, state):
+        '''Restores a shoe returned by get_state. The shoe must
+        have the same number of decks.'''
+        if len(state['cards']) != len(self._cards):
+            raise ValueError('the state is of a shoe of {} cards'.format(len(state['cards'])))
+        self._cards[:] = array('B', state['cards'])
+        self._next = state['next']
+        self.shuffles = state['shuffles']
+        self.count.set_state(state['count'])
+
+
+    def shuffle(self):
+        self._cards[:] = self._order
         random.shuffle(self._cards)
+        self._next = 0
+        self.shuffles += 1
+        self.count.reset()
@@ -0,0 +1,158 @@
+import json
+import os
+import random
+import time
+
+from bqa.cards import CARDS
+
+
+FORMAT = 1
+# the meta name of the checkpoint generation in the Q-table database
+META_NAME = 'checkpoint'
+
+
+def _tmp(path):
+    return '{}.tmp'.format(path)
+
+
+def _write(state, path):
+    with open(path, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Checkpointer:
+
+    def __init__(self, path, every=None, interval=None):
+        '''Returns a checkpointer that saves the state of a game
+        to PATH every EVERY rounds and every INTERVAL seconds.
+
+        A checkpoint is the agent's statistics and prior state,
+        the account balances, the order and count of the deck,
+        the cards in play, the state of the random module and the
+        game loop counters. The Q-table itself is checkpointed
+        incrementally: the table holds its writes between
+        checkpoints and each checkpoint writes only the dirty
+        entries, together with the checkpoint's generation, in a
+        single sqlite transaction.
+
+        The checkpoint file is written to PATH.tmp before that
+        transaction and moved over PATH after it, so after a crash
+        either file matches the database's generation.
+
+        Args:
+            path (str): The checkpoint file.
+            every (int): Checkpoint every EVERY rounds.
+            interval (float): Checkpoint once INTERVAL seconds
+            passed since the last checkpoint.
+
+        Returns:
+            (Checkpointer): A Checkpointer instance.
+        '''
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.generation = 0
+        self.saves = 0
+        self._last_round = 0
+        self._last_time = time.monotonic()
+
+
+    def attach(self, agent):
+        '''Makes the agent's Q-table hold its writes until the
+        next checkpoint.'''
+        table = agent.get_table()
+        if not hasattr(table, 'hold'):
+            raise ValueError('checkpoints need a bqa.qtable.QTable')
+        # the shards commit separately, so no transaction covers
+        #  a checkpoint's meta and every entry
+        if table.shards() > 1:
+            raise ValueError('checkpoints do not support sharded qtables')
+        if agent.get_replay() is not None:
+            raise ValueError('checkpoints do not support experience replay')
+        table.hold()
+
+
+    def due(self, round_index):
+        '''Returns True if a checkpoint is due before round
+        ROUND_INDEX.'''
+        if round_index == self._last_round:
+            return False
+        if self.every and round_index - self._last_round >= self.every:
+            return True
+        return bool(self.interval) and time.monotonic() - self._last_time >= self.interval
+
+
+    def load(self, dealer, agent):
+        '''Restores the checkpoint matching the generation of the
+        agent's Q-table.
+
+        Returns:
+            (dict): The game loop state passed to save.
+        '''
+        table = agent.get_table()
+        generation = table.read_meta(META_NAME)
+        if generation is None:
+            raise ValueError('the Q-table database holds no checkpoint')
+        generation = int(generation)
+        for path in (self.path, _tmp(self.path)):
+            state = _read(path)
+            if state is not None and state['generation'] == generation:
+                break
+        else:
+            raise ValueError('no checkpoint of generation {} at {}'.format(generation, self.path))
+        if state['format'] != FORMAT:
+            raise ValueError('unknown checkpoint format: {}'.format(state['format']))
+        version, internal, gauss_next = state['random']
+        random.setstate((version, tuple(internal), gauss_next))
+        dealer.deck.set_state(state['deck'])
+        dealer.hand[:] = [CARDS[code] for code in state['dealer_hand']]
+        agent.hand[:] = [CARDS[code] for code in state['agent_hand']]
+        for account, chips in ((dealer.account, state['dealer_chips']), (agent.account, state['agent_chips'])):
+            account.withdraw(account.balance())
+            account.deposit(chips)
+        agent.set_state(state['agent'])
+        self.generation = generation
+        self._last_round = state['loop']['round_index']
+        self._last_time = time.monotonic()
+        return state['loop']
+
+
+    def save(self, dealer, agent, loop):
+        '''Checkpoints the game.
+
+        Args:
+            dealer (bqa.player.Dealer): The dealer.
+            agent (bqa.player.Agent): The agent.
+            loop (dict): The JSON serializable state of the game
+            loop, including its 'round_index'.
+        '''
+        self.generation += 1
+        state = {
+            'format': FORMAT,
+            'generation': self.generation,
+            'loop': loop,
+            'random': random.getstate(),
+            'deck': dealer.deck.get_state(),
+            'dealer_hand': [card.code for card in dealer.hand],
+            'agent_hand': [card.code for card in agent.hand],
+            'dealer_chips': dealer.account.balance(),
+            'agent_chips': agent.account.balance(),
+            'agent': agent.get_state()
+        }
+        tmp = _tmp(self.path)
+        _write(state, tmp)
+        agent.get_table().sync({META_NAME: str(self.generation)})
+        os.replace(tmp, self.path)
+        self.saves += 1
+        self._last_round = loop['round_index']
+        self._last_time = time.monotonic()
@@ -0,0 +1,158 @@
+# Hi-Lo tags indexed by face: 2-6 count +1, 7-9 count 0 and
+#  tens and aces count -1
+HI_LO = (0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1)
+TRUE_COUNT_LIMIT = 15
+
+
+class CardCount:
+
+    def __init__(self, decks=1):
+        '''Returns a count of the cards not yet seen in a shoe of
+        DECKS decks. The count keeps a 13 slot vector of unseen
+        faces, the matching vector of blackjack values and the
+        Hi-Lo running count, all updated in O(1) per card.
+        Probability queries are answered from prefix sums over
+        the value vector, rebuilt in O(10) only after a change.
+
+        Args:
+            decks (int): The number of decks in the shoe.
+
+        Returns:
+            (CardCount): A CardCount instance.
+        '''
+        self.decks = decks
+        self.reset()
+
+
+    def __len__(self):
+        return self.remaining
+
+
+    def _prefix(self):
+        if self._dirty:
+            total = 0
+            prefix = self._prefix_sums
+            for value in range(1, 11):
+                total += self.values[value]
+                prefix[value] = total
+            self._dirty = False
+        return self._prefix_sums
+
+
+    def at_most(self, value):
+        '''Returns the number of unseen cards worth at most VALUE,
+        counting aces as 1.'''
+        if value < 1:
+            return 0
+        return self._prefix()[min(value, 10)]
+
+
+    def p_at_most(self, value):
+        '''Returns P(the next card is worth at most VALUE).'''
+        if not self.remaining:
+            return 0
+        return self.at_most(value) / self.remaining
+
+
+    def p_dealer_up(self):
+        '''Returns the distribution of the dealer's up-card.
+
+        Returns:
+            (list): P(value) for the values 1-10 at indices 1-10.
+        '''
+        if not self.remaining:
+            return [0] * 11
+        return [0] + [self.values[value] / self.remaining for value in range(1, 11)]
+
+
+    def p_not_bust(self, hard_total):
+        '''Returns P(HARD_TOTAL plus the next card is at most 21).'''
+        return self.p_at_most(21 - hard_total)
+
+
+    def p_reach(self, total, target=21):
+        '''Returns P(TOTAL plus the next card is exactly TARGET),
+        counting an ace as 11 when that reaches TARGET.'''
+        if not self.remaining:
+            return 0
+        need = target - total
+        if 1 <= need <= 10:
+            n = self.values[need]
+        elif need == 11:
+            n = self.values[1]
+        else:
+            return 0
+        return n / self.remaining
+
+
+    def copy_from(self, count):
+        '''Makes this count equal to COUNT, of a shoe of the same
+        number of decks, without allocating.'''
+        self.faces[:] = count.faces
+        self.values[:] = count.values
+        self.remaining = count.remaining
+        self.running_count = count.running_count
+        self._dirty = True
+
+
+    def get_state(self):
+        '''Returns the count as a JSON serializable dict.'''
+        return {
+            'faces': list(self.faces),
+            'values': list(self.values),
+            'remaining': self.remaining,
+            'running_count': self.running_count
+        }
+
+
+    def p_value(self, value):
+        '''Returns P(the next card is worth VALUE).'''
+        if not self.remaining:
+            return 0
+        return self.values[value] / self.remaining
+
+
+    def reset(self):
+        '''Resets the count to a freshly shuffled shoe.'''
+        per_face = 4 * self.decks
+        self.faces = [0] + [per_face] * 13
+        self.values = [0] + [per_face] * 9 + [4 * per_face]
+        self.remaining = 52 * self.decks
+        self.running_count = 0
+        self._prefix_sums = [0] * 11
+        self._dirty = True
+
+
+    def see(self, card):
+        '''Removes CARD from the unseen cards.'''
+        face = card.face
+        self.faces[face] -= 1
+        self.values[card.value] -= 1
+        self.remaining -= 1
+        self.running_count += HI_LO[face]
+        self._dirty = True
+
+
+    def set_state(self, state):
+        '''Restores a count returned by get_state.'''
+        self.faces = list(state['faces'])
+        self.values = list(state['values'])
+        self.remaining = state['remaining']
+        self.running_count = state['running_count']
+        self._dirty = True
+
+
+    def true_count(self):
+        '''Returns the Hi-Lo running count per remaining deck.'''
+        if not self.remaining:
+            return 0
+        return self.running_count * 52 / self.remaining
+
+
+    def true_count_bucket(self):
+        '''Returns the true count rounded to an int in
+        [-TRUE_COUNT_LIMIT, TRUE_COUNT_LIMIT], as used in the
+        agent's state.'''
+        tc = round(self.true_count())
+        return max(-TRUE_COUNT_LIMIT, min(TRUE_COUNT_LIMIT, tc))
+
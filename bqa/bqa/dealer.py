@@ -0,0 +1,130 @@
+from functools import lru_cache
+
+
+# the dealer draws while below STAND, so every final total is in
+#  FINAL_TOTALS or a bust
+STAND = 16
+FINAL_TOTALS = tuple(range(STAND, 22))
+# the index of a bust in a distribution
+BUST = len(FINAL_TOTALS)
+# the max number of (total, ace, count vector) states memoized
+CACHE_SIZE = 1 << 16
+# P(value) of the next card of an infinite shoe, indexed by value
+_INFINITE = (0,) + (1 / 13,) * 9 + (4 / 13,)
+
+
+def _best(hard, ace):
+    return hard + 10 if ace and hard + 10 <= 21 else hard
+
+
+def _final(total):
+    dist = [0.0] * (BUST + 1)
+    dist[BUST if total > 21 else total - STAND] = 1.0
+    return tuple(dist)
+
+
+@lru_cache(maxsize=None)
+def _finish_infinite(hard, ace):
+    best = _best(hard, ace)
+    if best >= STAND:
+        return _final(best)
+    dist = [0.0] * (BUST + 1)
+    for value in range(1, 11):
+        sub = _finish_infinite(hard + value, ace or value == 1)
+        p = _INFINITE[value]
+        for i in range(BUST + 1):
+            dist[i] += p * sub[i]
+    return tuple(dist)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _finish(hard, ace, counts):
+    # COUNTS holds the unseen cards of each value 1-10
+    best = _best(hard, ace)
+    if best >= STAND:
+        return _final(best)
+    remaining = sum(counts)
+    if not remaining:
+        # play finishes a round from a freshly shuffled shoe
+        return _finish_infinite(hard, ace)
+    dist = [0.0] * (BUST + 1)
+    for value in range(1, 11):
+        n = counts[value - 1]
+        if not n:
+            continue
+        rest = counts[:value - 1] + (n - 1,) + counts[value:]
+        sub = _finish(hard + value, ace or value == 1, rest)
+        p = n / remaining
+        for i in range(BUST + 1):
+            dist[i] += p * sub[i]
+    return tuple(dist)
+
+
+# the distribution of the dealer's final total for each up-card
+#  value 1-10 of an infinite shoe, indexed by value - 1; generated
+#  with _finish_infinite(value, value == 1)
+INFINITE_DECK = (
+    # 16, 17, 18, 19, 20, 21, bust
+    (0.11642664991272664, 0.11642664991272664, 0.11642664991272664, 0.11642664991272664, 0.11642664991272664, 0.3471958806819574, 0.0706708697544095),
+    (0.13340715579671714, 0.12885549444032204, 0.12395370528728117, 0.11870178833759454, 0.11307281068382785, 0.1070398394185468, 0.2749692060357106),
+    (0.12901895486773396, 0.12446729351133888, 0.11991563215494379, 0.11501384300190293, 0.1097619260522163, 0.10413294839844961, 0.29768940201341465),
+    (0.12088193745984958, 0.12088193745984958, 0.1163302761034545, 0.11177861474705941, 0.10687682559401855, 0.10162490864433192, 0.3216254999914365),
+    (0.16473176691846086, 0.10556016928532475, 0.10556016928532475, 0.10100850792892965, 0.09645684657253459, 0.09155505741949371, 0.33512748258993186),
+    (0.3679068781816788, 0.13713764741244802, 0.07796604977931192, 0.07796604977931192, 0.07341438842291684, 0.06886272706652176, 0.19674625935781084),
+    (0.12795432280893587, 0.35872355357816665, 0.12795432280893587, 0.06878272517579978, 0.06878272517579978, 0.0642310638194047, 0.18357128663295744),
+    (0.11938321984565788, 0.11938321984565788, 0.35015245061488864, 0.11938321984565788, 0.060211622212521784, 0.060211622212521784, 0.17127464542309426),
+    (0.11142433852261402, 0.11142433852261402, 0.11142433852261402, 0.3421935692918448, 0.11142433852261402, 0.05225274088947793, 0.1598563357282213),
+    (0.10346545719957016, 0.10346545719957016, 0.10346545719957016, 0.10346545719957016, 0.33423468796880096, 0.10346545719957016, 0.14843802603334835),
+)
+
+
+def distribution(up_value, count=None):
+    '''Returns the distribution of the dealer's final total when
+    the dealer shows UP_VALUE and draws the hole card and every
+    further card from the unseen cards in COUNT. Distributions
+    are memoized on the count vector, so repeated lookups for
+    the same shoe are O(1).
+
+    Args:
+        up_value (int): The blackjack value (1-10) of the
+        dealer's up-card.
+        count (bqa.counting.CardCount|tuple): The unseen cards,
+        or their number for each value 1-10, or None for an
+        infinite shoe.
+
+    Returns:
+        (tuple): P(total) for each total in FINAL_TOTALS followed
+        by P(bust) at index BUST.
+    '''
+    if count is None:
+        return INFINITE_DECK[up_value - 1]
+    counts = count if isinstance(count, tuple) else tuple(count.values[1:])
+    return _finish(up_value, up_value == 1, counts)
+
+
+def stand_outcomes(total, dist):
+    '''Returns the chances of an agent standing on TOTAL against
+    a dealer whose final total is distributed as DIST. A dealer
+    bust is a win and an equal total is a draw.
+
+    Args:
+        total (int): The agent's total, at most 21.
+        dist (tuple): A distribution returned by distribution.
+
+    Returns:
+        (tuple): P(win), P(draw) and P(loss).
+    '''
+    index = total - STAND
+    win = dist[BUST] + sum(dist[:max(index, 0)])
+    draw = dist[index] if 0 <= index < BUST else 0.0
+    return win, draw, max(1.0 - win - draw, 0.0)
+
+
+def cache_info():
+    '''Returns the hits, misses and size of the memoized finite
+    shoe distributions.'''
+    return _finish.cache_info()
+
+
+def clear_cache():
+    _finish.cache_clear()
@@ -0,0 +1,220 @@
+import os
+import struct
+import sys
+from array import array
+from random import random
+
+from bqa.cards import FACE_VALUES
+from bqa.hands import values_total
+from bqa.keys import IN_ROUND, OUTCOMES, POST_ROUND, PRE_ROUND, decode_key
+from bqa.player import Agent
+
+
+WAGERS = tuple(Agent.WAGERS)
+# the number of actions stored for each game stage
+ACTIONS = {PRE_ROUND: 2, IN_ROUND: 3, POST_ROUND: 3}
+# one slot per wager plus one for any other wager
+PRE_ROUND_SLOTS = len(WAGERS) + 1
+# dealer up-card value (1-10) x agent total (0-21 or bust) x soft
+DEALER_VALUES = 10
+TOTALS = 23
+IN_ROUND_SLOTS = DEALER_VALUES * TOTALS * 2
+# outcome x the wager the chip delta was settled from
+POST_ROUND_SLOTS = len(OUTCOMES) * PRE_ROUND_SLOTS
+SLOTS = PRE_ROUND_SLOTS + IN_ROUND_SLOTS + POST_ROUND_SLOTS
+# every slot holds the weights, biases and qvalues of 3 actions
+WIDTH = 9
+
+_MAGIC = b'BQAD'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHI')
+
+
+def _wager_slot(wager):
+    return WAGERS.index(wager) if wager in WAGERS else len(WAGERS)
+
+
+def _settled_wager(outcome, chip_delta):
+    # the inverse of bqa.game.settle: a win pays twice the wager,
+    #  a loss takes it and a draw returns half of it
+    if outcome == 'WIN':
+        return chip_delta / 2
+    if outcome == 'LOSS':
+        return -chip_delta
+    return chip_delta * 2
+
+
+def state_index(state):
+    '''Returns the slot of STATE in a DenseQTable. Only the
+    features the dense layout keeps are used: the wager before
+    a round, the dealer up-card value and the agent's total and
+    softness during a round and the outcome and the wager its
+    chip delta was settled from after it. Wagers other than
+    Agent.WAGERS, and chip deltas of other wagers, share one
+    slot.
+
+    Args:
+        state (dict|int): A game state dict or its
+        bqa.keys.state_key.
+
+    Returns:
+        (tuple): The slot index and the game stage.
+    '''
+    if isinstance(state, int):
+        state = decode_key(state)
+        faces = state.get('agent_hand', ())
+        dealer_face = state.get('dealer_show', 0)
+    elif state['game_stage'] == IN_ROUND:
+        faces = [c.face for c in state['agent_hand']]
+        dealer_face = state['dealer_show'].face
+    game_stage = state['game_stage']
+    if game_stage == IN_ROUND:
+        total, soft = values_total(FACE_VALUES[face] for face in faces)
+        total = min(total, TOTALS - 1)
+        dealer_value = FACE_VALUES[dealer_face] - 1
+        slot = (dealer_value * TOTALS + total) * 2 + soft
+        return PRE_ROUND_SLOTS + slot, game_stage
+    elif game_stage == PRE_ROUND:
+        return _wager_slot(state.get('wager')), game_stage
+    elif game_stage == POST_ROUND:
+        outcome = state['outcome']
+        wager = _settled_wager(outcome, state['chip_delta'])
+        slot = OUTCOMES.index(outcome) * PRE_ROUND_SLOTS + _wager_slot(wager)
+        return PRE_ROUND_SLOTS + IN_ROUND_SLOTS + slot, game_stage
+    raise ValueError('unknown game stage: {}'.format(game_stage))
+
+
+class DenseQTable:
+
+    def __init__(self, path='table.dqt'):
+        '''Returns a Q-table that stores every state of the
+        enumerable blackjack state space in one contiguous
+        float64 array instead of a cache backed by sqlite. It
+        has the same get/put interface as bqa.qtable.QTable.
+
+        Args:
+            path (str): The file the table is loaded from and
+            saved to. A new table is created if it is missing.
+
+        Returns:
+            (DenseQTable): A DenseQTable instance.
+        '''
+        self._path = path
+        self._values = array('d', bytes(8 * SLOTS * WIDTH))
+        # slots are initialized lazily, like missing QTable rows
+        self._initialized = bytearray(SLOTS)
+        if os.path.exists(path):
+            self._load()
+
+
+    def __len__(self):
+        return sum(self._initialized)
+
+
+    def _load(self):
+        with open(self._path, 'rb') as f:
+            magic, version, width, slots = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError('{} is not a dense q-table'.format(self._path))
+            if width != WIDTH or slots != SLOTS:
+                raise ValueError('{} has an incompatible layout'.format(self._path))
+            self._initialized = bytearray(f.read(SLOTS))
+            values = array('d')
+            values.fromfile(f, SLOTS * WIDTH)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        self._values = values
+
+
+    def close(self):
+        '''Saves the table.'''
+        self.save_table()
+
+
+    def contains(self, state):
+        return bool(self._initialized[state_index(state)[0]])
+
+
+    def get(self, state):
+        slot, game_stage = state_index(state)
+        n = ACTIONS[game_stage]
+        base = slot * WIDTH
+        values = self._values
+        if not self._initialized[slot]:
+            for i in range(2 * n):
+                values[base + i] = random()
+            if game_stage == PRE_ROUND:
+                values[base + 2 * n] = 1
+            self._initialized[slot] = 1
+        return [
+            values[base:base + n].tolist(),
+            values[base + n:base + 2 * n].tolist(),
+            values[base + 2 * n:base + 3 * n].tolist()
+        ]
+
+
+    def get_many(self, states):
+        '''Returns the entries of every state in STATES like get.'''
+        return [self.get(state) for state in states]
+
+
+    def in_round_qvalues(self):
+        '''Returns the STAND and HIT qvalues of every IN_ROUND
+        slot, ordered by dealer up-card value, agent total and
+        softness.
+
+        Returns:
+            (list): A (stand, hit) tuple per slot, or None for
+            slots that were never visited.
+        '''
+        values = self._values
+        qvalues = []
+        for slot in range(PRE_ROUND_SLOTS, PRE_ROUND_SLOTS + IN_ROUND_SLOTS):
+            if not self._initialized[slot]:
+                qvalues.append(None)
+                continue
+            base = slot * WIDTH + 6
+            qvalues.append((values[base], values[base + 1]))
+        return qvalues
+
+
+    def put(self, state, weights, biases, qvalues):
+        '''Stores WEIGHTS, BIASES and QVALUES in the slot of
+        STATE.
+
+        Args:
+            state (dict|int): The state to map against, or its
+            bqa.keys.state_key.
+            weights (list): The weights for each action.
+            biases (list): The biases for each action.
+            qvalues (list): The qvalues for each action.
+        '''
+        slot, game_stage = state_index(state)
+        n = ACTIONS[game_stage]
+        base = slot * WIDTH
+        self._values[base:base + 3 * n] = array('d', [*weights, *biases, *qvalues])
+        self._initialized[slot] = 1
+
+
+    def save_table(self):
+        '''Atomically writes the table to its file.'''
+        values = self._values
+        if sys.byteorder == 'big':
+            values = array('d', values)
+            values.byteswap()
+        tmp = '{}.tmp'.format(self._path)
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, WIDTH, SLOTS))
+            f.write(self._initialized)
+            values.tofile(f)
+        os.replace(tmp, self._path)
+
+
+    def stats(self):
+        '''Returns the number of initialized and total slots.
+
+        Returns:
+            (dict): A dictionary with the table size and
+            capacity.
+        '''
+        return {'size': len(self), 'capacity': SLOTS}
@@ -1,5 +1,7 @@
 import argparse, random
 
+from bqa.dealer import STAND as DEALER_STAND
+from bqa.hands import hand_total
 from bqa.player import (
     Account, Agent, Dealer
 )
@@ -9,10 +11,10 @@ def compare_hands(hand1, hand2):
     '''Compares HAND1 with HAND2.
 
     Args:
-        hand1 (list): A Python list containing bqa.cards.Card
-        instances.
-        hand2 (list): A Python list containing bqa.cards.Card
-        instances.
+        hand1 (list): A bqa.hands.Hand or a list of
+        bqa.cards.Card instances.
+        hand2 (list): A bqa.hands.Hand or a list of
+        bqa.cards.Card instances.
 
     Returns:
         (int): -1 if HAND1 is a bust or HAND2 is greater than
@@ -24,8 +26,8 @@ def compare_hands(hand1, hand2):
     hand1_value = hand_value(hand1)
     hand2_value = hand_value(hand2)
     # check for bust
-    if hand1_value > 21: -1
-    elif hand2_value > 21: 1
+    if hand1_value > 21: return -1
+    elif hand2_value > 21: return 1
     # check for equal
     if hand1_value == hand2_value: return 0
     # check for blackjack
@@ -38,44 +40,132 @@ def compare_hands(hand1, hand2):
 
 
 def hand_value(hand):
-    '''Determines the value of HAND.
+    '''Determines the value of HAND. One ace counts as 11
+    unless that busts the hand. A bqa.hands.Hand answers in O(1)
+    from its running total.
 
     Returns:
-        (int): The value of HAND.
+        (int): The value of HAND, bqa.hands.BUST (22) for any
+        bust.
     '''
-    # split the hand into two lists, aces and non-aces
-    aces = [c for c in hand if c.face == 1]
-    non_aces = [c for c in hand if c.face != 1]
-    # generate the non-aces sum
-    hand_total = sum([c.face_value() for c in non_aces])
-    if not aces: return hand_total
-    # an ace counts as 11 unless it results in a bust
-    #  in that case it is a 1
-    for _ in aces:
-        if hand_total + 11 > 21:
-            hand_total += 1
-        else:
-            hand_total += 11
-    return hand_total
+    return hand_total(hand)[0]
+
+
+def in_round_state(dealer, agent, true_count=False):
+    '''Returns the IN_ROUND state AGENT observes at DEALER's
+    table.
+
+    Args:
+        dealer (bqa.player.Dealer): The dealer, showing its first
+        card.
+        agent (bqa.player.Agent): The agent to act.
+        true_count (bool): Add the shoe's Hi-Lo true count bucket.
+
+    Returns:
+        (dict): The game state.
+    '''
+    state = {
+        'game_stage': Agent.IN_ROUND,
+        'dealer_show': dealer.hand[0],
+        'agent_hand': tuple(agent.hand),
+        'agent_total': agent.hand.total,
+        'agent_soft': agent.hand.soft
+    }
+    if true_count:
+        state['true_count'] = dealer.deck.count.true_count_bucket()
+    return state
+
+
+def settle(dealer, agent, wager):
+    '''Pays out the WAGER AGENT placed against DEALER once both
+    hands are final. A win pays the wager twice and a draw
+    returns half of it to each side.
+
+    Returns:
+        (tuple): The outcome, one of Agent.WIN, Agent.DRAW and
+        Agent.LOSS, and the agent's chip delta.
+    '''
+    winner = compare_hands(dealer.hand, agent.hand)
+    if winner < 0: # agent won
+        dealer.account.withdraw(wager)
+        agent.account.deposit(wager * 2)
+        return Agent.WIN, wager * 2
+    elif winner > 0: # dealer won
+        dealer.account.deposit(wager)
+        return Agent.LOSS, -wager
+    # draw
+    dealer.account.deposit(wager / 2)
+    agent.account.deposit(wager / 2)
+    return Agent.DRAW, wager / 2
 
 
 def play(*args, **kwargs):
+    '''Plays rounds of blackjack between a dealer and an agent.
+
+    Args:
+        game_args (dict): The 'seed' and number of 'rounds', and
+        'true_count' to add the shoe's Hi-Lo true count to the
+        agent's IN_ROUND states.
+        dealer_args (dict): Keyword arguments for the Dealer.
+        agent_args (dict): Keyword arguments for the Agent.
+        sink (bqa.telemetry.Sink): Receives a record of every
+        round the sink samples. The sink is flushed, not closed,
+        once the game ends.
+        checkpoint (bqa.checkpoint.Checkpointer): Checkpoints the
+        game whenever it is due between rounds and once the game
+        ends.
+        resume (bool): Continue from the CHECKPOINT matching the
+        agent's database instead of starting a new game.
+
+    Returns:
+        (dict): The seed, rounds played, the agent's wins, draws,
+        losses and chip delta, and both account balances.
+    '''
     dealer = Dealer(**kwargs['dealer_args'])
     agent = Agent(**kwargs['agent_args'])
     game_kwargs = kwargs['game_args']
     total_rounds = game_kwargs['rounds']
     seed = game_kwargs['seed']
+    count_feature = game_kwargs.get('true_count', False)
+    sink = kwargs.get('sink')
+    # the record of the current round, None unless it is sampled
+    record = None
+    round_index = 0
+    checkpointer = kwargs.get('checkpoint')
     random.seed(seed)
+    # the deck was shuffled before the seed was set
+    dealer.deck.shuffle()
+    agent.observe_count(dealer.deck.count)
     game_stage = Agent.PRE_ROUND
     wager, rounds_played = 0, 0
+    if checkpointer is not None:
+        checkpointer.attach(agent)
+        if kwargs.get('resume'):
+            loop = checkpointer.load(dealer, agent)
+            seed = loop['seed']
+            game_stage = loop['game_stage']
+            wager = loop['wager']
+            rounds_played = loop['rounds_played']
+            round_index = loop['round_index']
+    loop_state = lambda: {
+        'seed': seed,
+        'game_stage': game_stage,
+        'wager': wager,
+        'rounds_played': rounds_played,
+        'round_index': round_index
+    }
     # play until the dealer or agent run out of chips or 
     #  the number of epochs is reached
     while (not dealer.account.bankrupt() and 
             not agent.account.bankrupt() and 
             rounds_played < total_rounds):
         game_state = {'game_stage': game_stage}
+        if (game_stage == Agent.PRE_ROUND and checkpointer is not None and
+                checkpointer.due(round_index)):
+            checkpointer.save(dealer, agent, loop_state())
         if game_stage == Agent.PRE_ROUND:
-            # shuffle the deck
+            # return the cards, a shoe only reshuffles once its
+            #  cut card came up
             discard = []
             discard.extend(dealer.hand)
             dealer.hand.clear()
@@ -88,9 +178,20 @@ def play(*args, **kwargs):
             agent.account.withdraw(wager)
             game_state['wager'] = wager
             agent.update_parameters(game_state)
+            if sink is not None and sink.sample(round_index):
+                record = {
+                    'seed': seed,
+                    'round': round_index,
+                    'stages': [game_stage],
+                    'wager': wager,
+                    'actions': [],
+                    'qvalues': []
+                }
+            round_index += 1
             for i in range(4):
                 if i % 2 == 0:
-                    dealer.hand.append(dealer.deck.draw())
+                    # the dealer's second card is dealt face down
+                    dealer.hand.append(dealer.deck.draw(seen=(i == 0)))
                 else:
                     agent.hand.append(dealer.deck.draw())
             game_stage = Agent.IN_ROUND
@@ -98,41 +199,68 @@ def play(*args, **kwargs):
             if hand_value(agent.hand) > 21:
                 game_stage = Agent.POST_ROUND
                 continue
-            game_state['dealer_show'] = dealer.hand[0]
-            game_state['agent_hand'] = tuple(agent.hand)
+            game_state = in_round_state(dealer, agent, true_count=count_feature)
             agent.update_parameters(game_state)
             action = agent.determine_action(game_state)
+            if record is not None:
+                record['stages'].append(game_stage)
+                record['actions'].append(action)
+                record['qvalues'].append(list(agent.get_last_qvalues()))
             if action == Agent.HIT:
                 agent.hand.append(dealer.deck.draw())
             elif action == Agent.STAND:
-                while hand_value(dealer.hand) < 16:
+                dealer.deck.count.see(dealer.hand[1])
+                while hand_value(dealer.hand) < DEALER_STAND:
                     dealer.hand.append(dealer.deck.draw())
-                game_stage == Agent.POST_ROUND
+                game_stage = Agent.POST_ROUND
         elif game_stage == Agent.POST_ROUND:
-            winner = compare_hands(dealer.hand, agent.hand)
-            if winner < 0: # agent won
-                dealer.account.withdraw(wager)
-                agent.account.deposit(wager * 2)
-                chip_delta = wager * 2
-                outcome = Agent.WIN
-            elif winner > 0: # dealer won
-                dealer.account.deposit(wager)
-                chip_delta = -wager
-                outcome = Agent.LOSS
-            else: # draw
-                dealer.account.deposit(wager / 2)
-                agent.account.deposit(wager / 2)
-                chip_delta = wager / 2
-                outcome = Agent.DRAW
+            if hand_value(agent.hand) > 21:
+                # the hole card is revealed even when the agent busts
+                dealer.deck.count.see(dealer.hand[1])
+            outcome, chip_delta = settle(dealer, agent, wager)
             game_state['outcome'] = outcome
             game_state['chip_delta'] = chip_delta
             agent.update_parameters(game_state)
+            if record is not None:
+                record['stages'].append(game_stage)
+                record['dealer_hand'] = [card.face for card in dealer.hand]
+                record['agent_hand'] = [card.face for card in agent.hand]
+                record['rewards'] = agent.get_last_rewards()
+                record['outcome'] = outcome
+                record['chip_delta'] = chip_delta
+                sink.emit(record)
+                record = None
             game_stage = Agent.PRE_ROUND
         rounds_played += 1
 
 
+    if checkpointer is not None:
+        checkpointer.save(dealer, agent, loop_state())
     agent.save_table()
-    print('Total games played: {}'.format(agent.total_games_played()))
-    print('Agent Win Rate: {}%'.format(agent.get_win_rate()*100))
-    print('Agent Draw Rate: {}%'.format(agent.get_draw_rate()*100))
-    print('Agent Loss Rate: {}%'.format(agent.get_loss_rate()*100))
+    if sink is not None:
+        sink.flush()
+    return {
+        'seed': seed,
+        'rounds': rounds_played,
+        'wins': agent.total_wins(),
+        'draws': agent.total_draws(),
+        'losses': agent.total_losses(),
+        'chip_delta': agent.get_chip_delta(),
+        'agent_chips': agent.account.balance(),
+        'dealer_chips': dealer.account.balance()
+    }
+
+
+def print_results(results):
+    '''Prints the win/draw/loss rates in RESULTS.
+
+    Args:
+        results (dict): The results returned by play.
+    '''
+    games = results['wins'] + results['draws'] + results['losses']
+    rate = lambda n: n / games * 100 if games else 0
+    print('Total games played: {}'.format(games))
+    print('Agent Win Rate: {}%'.format(rate(results['wins'])))
+    print('Agent Draw Rate: {}%'.format(rate(results['draws'])))
+    print('Agent Loss Rate: {}%'.format(rate(results['losses'])))
+    print('Agent Chip Delta: {}'.format(results['chip_delta']))
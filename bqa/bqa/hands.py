@@ -0,0 +1,130 @@
+'''Incremental blackjack hand totals.
+
+A hand is summarized by its best total and whether that total is
+soft, i.e. counts an ace as 11. Adding a card is one lookup in
+TRANSITIONS, indexed by transition_index(total, soft, value),
+which holds the next (total, soft) pair. Totals above 21 are
+collapsed into BUST.
+'''
+
+BUST = 22
+
+
+def _transition(total, soft, value):
+    if total >= BUST:
+        return BUST, False
+    total += value
+    if value == 1 and not soft and total + 10 <= 21:
+        # the first ace that fits counts as 11
+        return total + 10, True
+    if total > 21 and soft:
+        # the soft ace falls back to 1
+        total -= 10
+        soft = False
+    return min(total, BUST), soft
+
+
+def transition_index(total, soft, value):
+    '''Returns the index in TRANSITIONS of adding a card worth
+    VALUE (1-10) to a hand of TOTAL, soft if SOFT.'''
+    return (total * 2 + soft) * 11 + value
+
+
+# the (total, soft) pair reached from every (total, soft, value)
+TRANSITIONS = tuple(
+    _transition(total, bool(soft), value)
+    for total in range(BUST + 1)
+    for soft in (0, 1)
+    for value in range(11)
+)
+
+
+def add(total, soft, value):
+    '''Returns the (total, soft) pair of a hand of TOTAL, soft if
+    SOFT, once a card worth VALUE is added.'''
+    return TRANSITIONS[(total * 2 + soft) * 11 + value]
+
+
+def values_total(values):
+    '''Returns the (total, soft) pair of a hand holding cards
+    worth VALUES.'''
+    total, soft = 0, False
+    for value in values:
+        total, soft = TRANSITIONS[(total * 2 + soft) * 11 + value]
+    return total, soft
+
+
+def hand_total(cards):
+    '''Returns the (total, soft) pair of CARDS. A Hand answers
+    from its running total.'''
+    if isinstance(cards, Hand):
+        return cards.total, cards.soft
+    return values_total(card.value for card in cards)
+
+
+class Hand(list):
+    '''A list of cards that keeps its total, softness and size up
+    to date. Appending a card is O(1); the other mutations
+    recompute the total.
+    '''
+
+    __slots__ = ('total', 'soft')
+
+    def __init__(self, cards=()):
+        super().__init__(cards)
+        self._recompute()
+
+
+    def _recompute(self):
+        self.total, self.soft = values_total(card.value for card in self)
+
+
+    def append(self, card):
+        super().append(card)
+        self.total, self.soft = TRANSITIONS[(self.total * 2 + self.soft) * 11 + card.value]
+
+
+    def clear(self):
+        super().clear()
+        self.total, self.soft = 0, False
+
+
+    def extend(self, cards):
+        for card in cards:
+            self.append(card)
+
+
+    def hard_total(self):
+        '''Returns the total counting every ace as 1.'''
+        return self.total - 10 if self.soft else self.total
+
+
+    def insert(self, index, card):
+        super().insert(index, card)
+        self._recompute()
+
+
+    def pop(self, index=-1):
+        card = super().pop(index)
+        self._recompute()
+        return card
+
+
+    def remove(self, card):
+        super().remove(card)
+        self._recompute()
+
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._recompute()
+
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._recompute()
+
+
+    def __iadd__(self, cards):
+        self.extend(cards)
+        return self
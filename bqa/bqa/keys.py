@@ -0,0 +1,146 @@
+'''Canonical, process independent encoding of game states.
+
+A state key is a non-negative integer that fits in a signed
+64-bit sqlite column. The two low bits hold the game stage and
+the remaining bits depend on the stage:
+
+    PRE_ROUND:  bits 2-33   the wager
+    IN_ROUND:   bits 2-5    the face of the dealer's up-card
+                bits 6-57   the number of cards of each face
+                            (1-13) in the agent's hand, 4 bits
+                            per face
+                bits 58-62  the Hi-Lo true count plus 16, or 0
+                            when the state has no true count
+    POST_ROUND: bits 2-3    the outcome (WIN, DRAW, LOSS)
+                bits 4-35   the chip delta in half chips, as a
+                            32-bit two's complement integer
+
+Unlike hash(), the encoding does not depend on PYTHONHASHSEED,
+so keys written by one process can be read by any other.
+'''
+
+PRE_ROUND = 0
+IN_ROUND = 1
+POST_ROUND = 2
+OUTCOMES = ('WIN', 'DRAW', 'LOSS')
+
+_STAGE_MASK = 0x3
+_FACE_BITS = 4
+_FACE_MASK = 0xF
+_HAND_SHIFT = 6
+_WORD_MASK = 0xFFFFFFFF
+_COUNT_SHIFT = 58
+_COUNT_OFFSET = 16
+# the shift of the composition counter for each face
+_FACE_SHIFT = [0] + [_HAND_SHIFT + _FACE_BITS * (face - 1) for face in range(1, 14)]
+# 2^64 / golden ratio, for Fibonacci hashing
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _encode_in_round(dealer_show, agent_hand):
+    key = IN_ROUND | dealer_show.face << 2
+    for card in agent_hand:
+        key += 1 << _FACE_SHIFT[card.face]
+    # only a hand with more than 15 cards can overflow a counter
+    if len(agent_hand) > 15:
+        faces = [card.face for card in agent_hand]
+        if max(faces.count(face) for face in set(faces)) > _FACE_MASK:
+            raise ValueError('hand has more than {} cards of one face'.format(_FACE_MASK))
+    return key
+
+
+def _encode_word(value):
+    value = int(value)
+    if not -(1 << 31) <= value < 1 << 31:
+        raise ValueError('{} does not fit in a state key'.format(value))
+    return value & _WORD_MASK
+
+
+def _decode_word(word):
+    return word - (1 << 32) if word & (1 << 31) else word
+
+
+def state_key(state):
+    '''Returns the canonical key of STATE.
+
+    Args:
+        state (dict|int): A game state dict, or an already
+        computed state key which is returned unchanged.
+
+    Returns:
+        (int): The state key.
+    '''
+    if isinstance(state, int):
+        return state
+    game_stage = state['game_stage']
+    if game_stage == IN_ROUND:
+        key = _encode_in_round(state['dealer_show'], state['agent_hand'])
+        true_count = state.get('true_count')
+        if true_count is not None:
+            if not -_COUNT_OFFSET < true_count < _COUNT_OFFSET:
+                raise ValueError('true count {} does not fit in a state key'.format(true_count))
+            key |= (true_count + _COUNT_OFFSET) << _COUNT_SHIFT
+        return key
+    elif game_stage == PRE_ROUND:
+        return PRE_ROUND | _encode_word(state.get('wager', 0)) << 2
+    elif game_stage == POST_ROUND:
+        outcome = OUTCOMES.index(state['outcome'])
+        chip_delta = _encode_word(round(state['chip_delta'] * 2))
+        return POST_ROUND | outcome << 2 | chip_delta << 4
+    raise ValueError('unknown game stage: {}'.format(game_stage))
+
+
+def key_stage(key):
+    '''Returns the game stage encoded in KEY.'''
+    return key & _STAGE_MASK
+
+
+def key_bucket(key, buckets):
+    '''Returns the bucket in [0, BUCKETS) of KEY. The key is
+    scrambled by Fibonacci hashing, so keys that only differ in
+    their low bits land in different buckets, and the bucket does
+    not depend on the process like hash() would.
+
+    Args:
+        key (int): A state key.
+        buckets (int): The number of buckets.
+
+    Returns:
+        (int): The bucket of KEY.
+    '''
+    # maps the high bits of the hash onto the buckets
+    return ((key * _MIX) & _MASK64) * buckets >> 64
+
+
+def decode_key(key):
+    '''Returns the fields encoded in KEY. Cards are reported by
+    face only since suits are not part of the key.
+
+    Args:
+        key (int): A state key.
+
+    Returns:
+        (dict): The game stage plus the stage specific fields:
+        'wager' for PRE_ROUND, 'dealer_show' (int) and
+        'agent_hand' (tuple of faces) and optionally
+        'true_count' for IN_ROUND, and
+        'outcome' and 'chip_delta' for POST_ROUND.
+    '''
+    game_stage = key & _STAGE_MASK
+    fields = {'game_stage': game_stage}
+    if game_stage == PRE_ROUND:
+        fields['wager'] = _decode_word(key >> 2)
+    elif game_stage == IN_ROUND:
+        fields['dealer_show'] = key >> 2 & _FACE_MASK
+        hand = []
+        for face in range(1, 14):
+            hand.extend([face] * (key >> _FACE_SHIFT[face] & _FACE_MASK))
+        fields['agent_hand'] = tuple(hand)
+        true_count = key >> _COUNT_SHIFT
+        if true_count:
+            fields['true_count'] = true_count - _COUNT_OFFSET
+    elif game_stage == POST_ROUND:
+        fields['outcome'] = OUTCOMES[key >> 2 & 0x3]
+        fields['chip_delta'] = _decode_word(key >> 4) / 2
+    return fields
@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import permutations
+
+from bqa.keys import IN_ROUND, POST_ROUND, PRE_ROUND, key_bucket, state_key
+from bqa.qtable import QTable, _open_db, read_rows, shard_paths
+
+
+SUITS = ('H', 'S', 'D', 'C')
+
+
+class _Face:
+    # stands in for a bqa.cards.Card when encoding a state key
+    __slots__ = ('face',)
+
+    def __init__(self, face):
+        self.face = face
+
+
+def legacy_keys(max_cards=2, max_wager=100):
+    '''Enumerates the states the agent could have written before
+    states were keyed by bqa.keys.state_key and yields the old
+    hash() key of each alongside its new key. The old keys were
+    computed as hash(tuple(state.values())) where each card
+    hashed as hash((suit, face)), so they are only reproducible
+    under the PYTHONHASHSEED of the process that wrote them.
+
+    Args:
+        max_cards (int): The largest agent hand to enumerate.
+        Hands grow combinatorially, every extra card multiplies
+        the work by ~50.
+        max_wager (int): The largest wager to enumerate.
+
+    Yields:
+        (tuple): A (legacy key, state key) pair.
+    '''
+    for wager in range(max_wager + 1):
+        yield hash((PRE_ROUND, wager)), state_key({'game_stage': PRE_ROUND, 'wager': wager})
+        for chip_delta, outcome in ((wager * 2, 'WIN'), (-wager, 'LOSS'), (wager / 2, 'DRAW')):
+            state = {'game_stage': POST_ROUND, 'outcome': outcome, 'chip_delta': chip_delta}
+            yield hash(tuple(state.values())), state_key(state)
+    cards = [(suit, face) for suit in SUITS for face in range(1, 14)]
+    faces = [_Face(face) for face in range(14)]
+    for n in range(1, max_cards + 1):
+        for hand in permutations(cards, n + 1):
+            dealer_show, agent_hand = hand[0], hand[1:]
+            key = state_key({
+                'game_stage': IN_ROUND,
+                'dealer_show': faces[dealer_show[1]],
+                'agent_hand': [faces[face] for _, face in agent_hand]
+            })
+            yield hash((IN_ROUND, dealer_show, agent_hand)), key
+
+
+def rekey(src, dst, max_cards=2, max_wager=100):
+    '''Copies the rows of the legacy table SRC into DST under
+    their bqa.keys.state_key. Rows that collapse onto the same
+    key (hands that only differ by suit or card order) are
+    averaged. Rows whose state cannot be recovered are dropped.
+    Must run under the PYTHONHASHSEED that SRC was written with.
+
+    Args:
+        src (str): The legacy sqlite database.
+        dst (str): The sqlite database to write to.
+        max_cards (int): The largest agent hand to enumerate.
+        max_wager (int): The largest wager to enumerate.
+
+    Returns:
+        (tuple): The number of rows migrated and dropped.
+    '''
+    db = sqlite3.connect(src)
+    rows = dict()
+    for state_hash, weights, biases, qvalues in db.execute('select state_hash, weights, biases, qvalues from qtable'):
+        rows[state_hash] = (json.loads(weights), json.loads(biases), json.loads(qvalues))
+    db.close()
+    merged = dict()
+    migrated = 0
+    for legacy_key, key in legacy_keys(max_cards, max_wager):
+        entry = rows.pop(legacy_key, None)
+        if entry is None:
+            continue
+        migrated += 1
+        if key in merged:
+            merged[key].append(entry)
+        else:
+            merged[key] = [entry]
+        if not rows:
+            break
+    table = QTable(db=dst)
+    for key, entries in merged.items():
+        n = len(entries)
+        weights, biases, qvalues = [
+            [sum(values) / n for values in zip(*columns)]
+            for columns in zip(*entries)
+        ]
+        table.put(key, weights, biases, qvalues)
+    table.close()
+    return migrated, len(rows)
+
+
+def reshard(src, dst, shards, src_shards=1):
+    '''Copies the Q-table SRC, split across SRC_SHARDS files, into
+    a new Q-table DST split across SHARDS files, see
+    bqa.qtable.shard_paths. The rows are copied as packed blobs,
+    and the shards of both tables are read and written in
+    parallel. Meta values, such as checkpoint generations, are not
+    copied.
+
+    Args:
+        src (str): The Q-table database to read.
+        dst (str): The Q-table database to write. None of its
+        files may exist yet.
+        shards (int): The number of shards of DST.
+        src_shards (int): The number of shards of SRC.
+
+    Returns:
+        (int): The number of rows copied.
+    '''
+    src_paths = shard_paths(src, src_shards)
+    dst_paths = shard_paths(dst, shards)
+    for path in dst_paths:
+        if path in src_paths or os.path.exists(path):
+            raise ValueError('{} already exists'.format(path))
+    rows = read_rows(src, src_shards)
+    buckets = [[] for _ in range(shards)]
+    for row in rows:
+        buckets[key_bucket(row[0], shards)].append(row)
+
+    def write(shard):
+        conn = _open_db(dst_paths[shard], 'wal', 'normal', '{}/{}'.format(shard, shards) if shards > 1 else None)
+        with conn:
+            conn.executemany('insert into qtable values (?, ?)', buckets[shard])
+        conn.close()
+
+    with ThreadPoolExecutor(shards) as pool:
+        list(pool.map(write, range(shards)))
+    return len(rows)
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import sqlite3
+from multiprocessing import Pool
+
+from bqa.game import play
+from bqa.qtable import QTable, unpack_entry
+from bqa.snapshot import SnapshotTable
+
+
+def worker_seed(seed, worker):
+    '''Derives the seed of WORKER from the run SEED. The seeds
+    are reproducible and independent of the number of workers.
+
+    Returns:
+        (int): A 64-bit seed.
+    '''
+    digest = hashlib.sha256('{}:{}'.format(seed, worker).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def split_rounds(rounds, workers):
+    '''Splits ROUNDS as evenly as possible across WORKERS.
+
+    Returns:
+        (list): The number of rounds of each worker.
+    '''
+    share, extra = divmod(rounds, workers)
+    return [share + (1 if i < extra else 0) for i in range(workers)]
+
+
+def worker_db(db, worker):
+    '''Returns the name of the private database of WORKER.'''
+    root, ext = os.path.splitext(db)
+    return '{}.worker{}{}'.format(root, worker, ext or '.db')
+
+
+def _remove_db(db):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+
+
+def _copy_db(src, dst):
+    # the backup api copies a consistent image even in wal mode
+    _remove_db(dst)
+    if not os.path.exists(src):
+        return
+    source = sqlite3.connect(src)
+    target = sqlite3.connect(dst)
+    source.backup(target)
+    target.close()
+    source.close()
+
+
+def _play_worker(job):
+    game_args, dealer_args, agent_args, snapshot = job
+    agent_args = dict(agent_args)
+    if snapshot is not None:
+        agent_args['table'] = SnapshotTable(snapshot)
+    return play(game_args=game_args, dealer_args=dealer_args, agent_args=agent_args)
+
+
+def _flat_rows(db):
+    # the flattened weights, biases and qvalues of every row of DB
+    conn = sqlite3.connect(db)
+    try:
+        return {
+            key: [value for values in unpack_entry(blob) for value in values]
+            for key, blob in conn.execute('select state_hash, entry from qtable')
+        }
+    except sqlite3.OperationalError:
+        # DB has no qtable yet
+        return dict()
+    finally:
+        conn.close()
+
+
+def merge_tables(dbs, db):
+    '''Merges what the worker tables DBS learned into DB. Every
+    worker started from a copy of DB, so only the rows a worker
+    changed are merged: an entry becomes its value in DB plus the
+    mean change of the workers that changed it, and an entry
+    missing from DB the mean of the workers that created it.
+
+    Args:
+        dbs (list): The worker sqlite databases.
+        db (str): The sqlite database to merge into.
+
+    Returns:
+        (int): The number of entries written.
+    '''
+    base = _flat_rows(db) if os.path.exists(db) else dict()
+    # the summed changes against BASE and their counts
+    sums = dict()
+    for name in dbs:
+        for key, entry in _flat_rows(name).items():
+            prior = base.get(key)
+            if prior == entry:
+                continue
+            delta = entry if prior is None else [a - b for a, b in zip(entry, prior)]
+            if key in sums:
+                total, count = sums[key]
+                sums[key] = ([a + b for a, b in zip(total, delta)], count + 1)
+            else:
+                sums[key] = (delta, 1)
+    table = QTable(db=db, size=1, flush_size=4096)
+    for key, (total, count) in sums.items():
+        n = len(total) // 3
+        prior = base.get(key, [0] * len(total))
+        values = [p + value / count for p, value in zip(prior, total)]
+        table.put(key, values[:n], values[n:2 * n], values[2 * n:])
+    table.close()
+    return len(sums)
+
+
+def merge_results(results):
+    '''Merges the results returned by several calls to play.
+
+    Returns:
+        (dict): The summed rounds, outcomes, chip deltas and
+        balances.
+    '''
+    merged = dict()
+    for result in results:
+        for name, value in result.items():
+            if name == 'seed':
+                continue
+            merged[name] = merged.get(name, 0) + value
+    merged['workers'] = len(results)
+    return merged
+
+
+def play_parallel(workers, game_args, dealer_args, agent_args, snapshot=None, merge=False):
+    '''Splits the rounds of a game across a pool of WORKERS
+    processes. Every worker plays against its own dealer with
+    fresh copies of the accounts and its own seed derived from
+    the game seed. Unless SNAPSHOT is given, each worker learns
+    into a private copy of the agent's sqlite database.
+
+    Args:
+        workers (int): The number of processes.
+        game_args (dict): The 'seed' and total 'rounds'.
+        dealer_args (dict): Keyword arguments for the Dealer.
+        agent_args (dict): Keyword arguments for the Agent.
+        snapshot (str): A bqa.snapshot file that every worker
+        maps read-only instead of learning into a database.
+        merge (bool): Merge what the workers learned back into
+        the agent's database once every worker finishes, see
+        merge_tables. The worker databases are removed either
+        way.
+
+    Returns:
+        (dict): The merged results of every worker.
+    '''
+    db = agent_args.get('db', 'table.db')
+    jobs = []
+    for worker, rounds in enumerate(split_rounds(game_args['rounds'], workers)):
+        worker_game_args = dict(game_args, seed=worker_seed(game_args['seed'], worker), rounds=rounds)
+        worker_agent_args = dict(agent_args)
+        if snapshot is None:
+            worker_agent_args['db'] = worker_db(db, worker)
+            _copy_db(db, worker_agent_args['db'])
+        jobs.append((worker_game_args, dealer_args, worker_agent_args, snapshot))
+    worker_dbs = [job[2]['db'] for job in jobs] if snapshot is None else []
+    try:
+        with Pool(workers) as pool:
+            results = pool.map(_play_worker, jobs)
+        if merge and worker_dbs:
+            merge_tables(worker_dbs, db)
+    finally:
+        for name in worker_dbs:
+            _remove_db(name)
+    return merge_results(results)
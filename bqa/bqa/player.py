@@ -1,9 +1,13 @@
-from collections import Counter
-from math import exp
-from random import random
+from random import getrandbits
 
-from bqa.cards import Deck
-from bqa.qtable import QTable
+from bqa.cards import CARDS, Deck
+from bqa.counting import CardCount
+import bqa.dealer as dealer
+from bqa.hands import Hand, hand_total
+from bqa.keys import state_key
+from bqa.policy import SOFTMAX, Policy, softmax
+import bqa.qtable as qtable
+import bqa.replay as replay_buffer
 
 
 def action_as_index(action):
@@ -15,55 +19,15 @@ def action_as_index(action):
     else: return 0
 
 
-def get_pair_sum(x, y):
-    '''Returns the sum(s) from the pair sums matrix for 
-    the corresponding face cards.
-
-    Args:
-        x (int): The face for the first card.
-        y (int): The face for the second card.
-    '''
-    # the left and right cards can be 11 or 21
-    # for simplicity, treat 2 aces as a 2 (though it is also a 12)
-    pair_sums = [
-        #A, 2, 3, 4, 5, 6, 7, 8,  9, 10/J/Q/K
-        [2, 13, 14, 15, 16, 17, 18, 19, 20, 21], #A
-        [13, 4, 5, 6, 7, 8, 9, 10, 11, 12], #2
-        [14, 5, 6, 7, 8, 9, 10, 11, 12, 13], #3
-        [15, 6, 7, 8, 9, 10, 11, 12, 13, 14], #4
-        [16, 7, 8, 9, 10, 11, 12, 13, 14, 15], #5
-        [17, 8, 9, 10, 11, 12, 13, 14, 15, 16], #6
-        [18, 9, 10, 11, 12, 13, 14, 15, 16, 17], #7
-        [19, 10, 11, 12, 13, 14, 15, 16, 17, 18], #8
-        [20, 11, 12, 13, 14, 15, 16, 17, 18, 19], #9
-        [21, 12, 13, 14, 15, 16, 17, 18, 19, 20] #10/J/Q/K
-    ]
-
-    def limit(z):
-        if x == 1:
-            return 0
-        elif x >= 10:
-            return 9
-        else:
-            return z - 1
-
-    x2 = limit(x)
-    y2 = limit(y)
-    return pair_sums[x2][y2]
-
-
-def get_unknown_cards(known_cards):
-    unknown_cards = []
-    known_counts = Counter(known_cards)
-    for i in range(1, 14):
-        if i in known_counts:
-            count = known_counts[i]
-            for _ in range(4 - count):
-                unknown_cards.append(i)
-        else:
-            for _ in range(4):
-                unknown_cards.append(i)
-    return unknown_cards
+def _hand_totals(state):
+    # the hard and best totals of the agent's hand in STATE, from
+    #  the running totals play adds to IN_ROUND states if present
+    total = state.get('agent_total')
+    if total is None:
+        total, soft = hand_total(state['agent_hand'])
+    else:
+        soft = state['agent_soft']
+    return (total - 10 if soft else total), total
 
 
 class Account:
@@ -98,7 +62,7 @@ class Player:
 
     def __init__(self, account=Account()):
         self.account = account
-        self.hand = []
+        self.hand = Hand()
 
 
 class Agent(Player):
@@ -118,7 +82,7 @@ class Agent(Player):
     WAGERS = [10, 20, 50, 100]
     PAYOUT = 200
 
-    def __init__(self, db='table.db', alpha=0.05, beta=0.05, learning_rate=0.05, discount_factor=0.05, temperature=0.05, account=Account(chips=500)):
+    def __init__(self, db='table.db', alpha=0.05, beta=0.05, learning_rate=0.05, discount_factor=0.05, temperature=0.05, account=Account(chips=500), table_args=None, table=None, exact_dealer=False, policy=SOFTMAX, epsilon=0.1, replay=0, replay_every=10, replay_batch=256):
         '''Returns an instance of an Agent that implements a 
         mixed Q-Learning/Neural Network architecture for policy
         decisions.
@@ -129,9 +93,32 @@ class Agent(Player):
             in q-learning policy updates.
             discount_factor (float): The discount factor (gamma)
             used in q-learning policy updates.
+            table_args (dict): Extra keyword arguments passed to
+            the agent's bqa.qtable.QTable, such as the cache size
+            and policy or the sqlite journal mode.
+            table (object): A Q-table to use instead of creating
+            a bqa.qtable.QTable, e.g. a bqa.dense.DenseQTable.
+            DB and TABLE_ARGS are ignored when it is given.
+            exact_dealer (bool): Compute the dealer's outcomes
+            from the unseen cards instead of looking them up in
+            the infinite shoe tables of bqa.dealer.
+            policy (str): How actions are chosen from their
+            Q-values, one of the bqa.policy modes, or a
+            bqa.policy.Policy.
+            epsilon (float): The exploration rate of the
+            epsilon-greedy policy.
+            replay (int): Record transitions in a bqa.replay
+            buffer of REPLAY transitions instead of updating the
+            Q-table after every one. 0 disables replay.
+            replay_every (int): Apply a replay mini-batch every
+            REPLAY_EVERY rounds.
+            replay_batch (int): The number of transitions
+            sampled into every mini-batch.
         '''
         super().__init__(account)
-        self._table = QTable(db=db)
+        if table is None:
+            table = qtable.QTable(db=db, **(table_args or {}))
+        self._table = table
         # Q-learning/Neural Network parameters
         self._alpha = alpha
         self._beta = beta
@@ -146,10 +133,28 @@ class Agent(Player):
         self._min_chip_delta = 0
         self._max_chip_delta = 0
         self._temp = temperature
+        self._count = None
+        # the shoe's count when the prior IN_ROUND state was seen
+        self._prior_count = None
+        self._exact_dealer = exact_dealer
+        self._last_rewards = []
+        # the q-values the last action was chosen from
+        self._last_qvalues = None
+        if not isinstance(policy, Policy):
+            policy = Policy(mode=policy, temperature=temperature, epsilon=epsilon)
+        self._policy = policy
+        self._replay = None
+        if replay:
+            if not hasattr(table, 'put_many'):
+                raise ValueError('replay needs a Q-table keyed by state key, e.g. a bqa.qtable.QTable')
+            self._replay = replay_buffer.ReplayBuffer(replay)
+        self._replay_every = replay_every
+        self._replay_batch = replay_batch
+        self._replay_rounds = 0
 
 
     def _action_distribution(self, state):
-        '''Returns a sorted action distribution for STATE.
+        '''Returns the action distribution for STATE.
 
         Args:
             state (dict): A dictionary containing mappings
@@ -159,14 +164,9 @@ class Agent(Player):
             (list): A list of tuples where each tuple consists 
             of an action and a probability.
         '''
-        game_stage = state['game_stage']
-        probabilities = self._softmax(self._table.get(state)[2])
-        if game_stage == Agent.PRE_ROUND:
-            dist = list(zip(Agent.PRE_ROUND_ACTIONS, probabilities))
-        elif game_stage == Agent.IN_ROUND:
-            dist = list(zip(Agent.IN_ROUND_ACTIONS, probabilities))
-        dist.sort(key=lambda x : x[1])
-        return dist
+        actions = self._get_actions(state)
+        qvalues = self._table.get(state)[2][:len(actions)]
+        return list(zip(actions, self._policy.distribution(qvalues)))
 
 
     def _expected_payout(self, state, action):
@@ -190,26 +190,13 @@ class Agent(Player):
             risk = self._risk(state, action)
             return wager * risk
         elif game_stage == Agent.IN_ROUND:
-            agent_hand = state['agent_hand']
-            dealer_show = state['dealer_show']
-            agent_total = sum([c.face for c in agent_hand])
-            known_cards = [dealer_show.face].extend([c.face for c in agent_hand])
-            unknown_cards = get_unknown_cards(known_cards)
-            non_busting_cards = list(filter(lambda x: x + agent_total <= 21, unknown_cards))
-            face_to_blackjack = 21 - agent_total
-            cards_for_blackjack = list(filter(lambda x : x == face_to_blackjack, unknown_cards))
-            non_busting_counts = dict(Counter(non_busting_cards))
-            blackjack_counts = len(cards_for_blackjack)
-            total_unknowns = len(unknown_cards)
-            expected_payout =  200 * (blackjack_counts / total_unknowns)
-            total_unknowns = len(unknown_cards)
-            for card, count in non_busting_counts.items():
-                p = count / total_unknowns
-                expected_payout += 200 * p
-            if action == Agent.HIT:
-                return expected_payout
-            else:
+            if action != Agent.HIT:
                 return 0
+            count = self._unseen_cards(state)
+            hard_total, agent_total = _hand_totals(state)
+            p_getting_blackjack = count.p_reach(agent_total)
+            p_not_busting = count.p_not_bust(hard_total)
+            return Agent.PAYOUT * (p_getting_blackjack + p_not_busting)
         elif game_stage == Agent.POST_ROUND:
             return state['chip_delta']
 
@@ -230,6 +217,32 @@ class Agent(Player):
         elif game_stage == Agent.IN_ROUND: return Agent.IN_ROUND_ACTIONS
 
 
+    def _record_transition(self, successor):
+        '''Records the transition from the prior state to
+        SUCCESSOR in the replay buffer, with the risk, expected
+        payout and reward of every prior action.
+
+        Args:
+            successor (dict): The new state as observed by the
+            agent.
+        '''
+        state = self._prior_state
+        key, successor_key = state_key(state), state_key(successor)
+        rewards = []
+        for action in self._prior_actions:
+            reward = self._reward(state, action, successor)
+            rewards.append(reward)
+            self._replay.append(
+                key,
+                successor_key,
+                action_as_index(action),
+                self._risk(state, action),
+                self._expected_payout(state, action),
+                reward
+            )
+        self._last_rewards = rewards
+
+
     def _reward(self, state, action, successor):
         '''Determines the reward for transitioning from
         STATE to SUCCESSOR using ACTION.
@@ -293,7 +306,7 @@ class Agent(Player):
         # The risk function for IN_ROUND needs to factor in:
         #   Probability of staying at or below 21
         #   Probability of getting 21
-        #   Probability of dealer hidden card summing to 21
+        #   Probability of the dealer finishing on 21
         #   Probability of having greater sum than dealer
         game_stage = state['game_stage'] 
         if game_stage == Agent.PRE_ROUND:
@@ -302,23 +315,16 @@ class Agent(Player):
             return 0 if cd_den == 0 else 1 - (cd_num / cd_den)
         elif game_stage == Agent.IN_ROUND:
             dealer_show = state['dealer_show']
-            agent_hand = state['agent_hand']
-            agent_total = sum([c.face for c in agent_hand])
-            known_cards = [dealer_show.face]
-            known_cards.extend([c.face for c in agent_hand])
-            unknown_cards = get_unknown_cards(known_cards)
-            non_busting_cards = len(list(filter(lambda x: x + agent_total <= 21, unknown_cards)))
-            busting_cards = len(unknown_cards) - non_busting_cards
-            face_to_blackjack = 21 - agent_total
-            cards_for_blackjack = len(list(filter(lambda x : x == face_to_blackjack, unknown_cards)))
-            p_not_busting = non_busting_cards / len(unknown_cards)
-            p_getting_blackjack = cards_for_blackjack / len(unknown_cards)
-            p_dealer_blackjack = len(list(filter(lambda x : x + dealer_show.face == 21, unknown_cards))) / len(unknown_cards)
+            count = self._unseen_cards(state)
+            hard_total, agent_total = _hand_totals(state)
+            p_not_busting = count.p_not_bust(hard_total)
+            p_getting_blackjack = count.p_reach(agent_total)
+            dealer_dist = dealer.distribution(dealer_show.value, count if self._exact_dealer else None)
+            p_dealer_blackjack = dealer_dist[21 - dealer.STAND]
             p_no_dealer_blackjack = 1 - p_dealer_blackjack
-            dealer_hidden_cards = len(list(filter(lambda x: x + dealer_show.face < agent_total, unknown_cards)))
-            # TODO: Need to verify the P(AT - DT > 0) calculation
-            p_at_gt_dt = dealer_hidden_cards / len(unknown_cards)
-            if p_not_busting == 0: return 0
+            # P(AT > DT) counting a dealer bust as a lower total
+            p_at_gt_dt = dealer.stand_outcomes(agent_total, dealer_dist)[0]
+            if p_not_busting == 0 or p_no_dealer_blackjack == 0: return 0
             risk = ((p_getting_blackjack + p_at_gt_dt) * p_not_busting * p_dealer_blackjack) / (p_not_busting * p_no_dealer_blackjack)
             if action == Agent.HIT:
                 return 1 - risk
@@ -345,8 +351,31 @@ class Agent(Player):
             (list): A list containing decimals that
             sum to 1.
         '''
-        vsum = sum(map(exp, [x / self._temp for x in v]))
-        return list(map(lambda x : exp(x/self._temp) / vsum, v))
+        return softmax(v, self._temp)
+
+
+    def _unseen_cards(self, state):
+        '''Returns the count of the cards the agent has not seen.
+        Without an observed shoe count this is a single deck minus
+        the dealer's up-card and the agent's hand in STATE.
+
+        Args:
+            state (dict): An IN_ROUND state.
+
+        Returns:
+            (bqa.counting.CardCount): The unseen cards.
+        '''
+        if self._count is not None:
+            # the prior state is scored with the cards that were
+            #  unseen then, not with the ones dealt since
+            if state is self._prior_state and self._prior_count is not None:
+                return self._prior_count
+            return self._count
+        count = CardCount(1)
+        count.see(state['dealer_show'])
+        for card in state['agent_hand']:
+            count.see(card)
+        return count
 
 
     def _update_qtable(self, state):
@@ -358,58 +387,74 @@ class Agent(Player):
         '''
         successor = state
         state = self._prior_state
-        get_result = self._table.get(state)
-        prior_weights, prior_biases, prior_qvalues = get_result[0], get_result[1], get_result[2]
+        update = getattr(self._table, 'update', None)
+        if update is None:
+            get_result = self._table.get(state)
+            prior_entry = get_result[0], get_result[1], get_result[2]
         get_result = self._table.get(successor)
-        succ_weights, succ_biases, succ_qvalues = get_result[0], get_result[1], get_result[2]
+        succ_qvalues = get_result[2]
+        rewards = []
+        # (action index, risk, expected payout, reward) of every
+        #  action, computed before the entry is read for the blend
+        targets = []
         for action in self._prior_actions:
-            action_index = action_as_index(action)
-            # determine the updated weight
-            old_weight = prior_weights[action_index]
-            new_weight = self._risk(state, action)
-            prior_weights[action_index] = (1 - self._alpha) * old_weight + self._alpha * new_weight
-            # determine the updated bias
-            old_bias = prior_biases[action_index]
-            new_bias = self._expected_payout(state, action)
-            prior_biases[action_index] = (1 - self._beta) * old_bias + self._beta * new_bias
-            # determine the updated q-values
-            prior_qvalue = prior_qvalues[action_index]
-            succ_qvalue = succ_qvalues[action_index]
             reward = self._reward(state, action, successor)
-            new_qvalue = (
-                # bellman-ford minus the argmax portion    
-                prior_qvalue +
-                self._lr * (
-                    reward + 
-                    self._df * (
-                        succ_qvalue - prior_qvalue
+            rewards.append(reward)
+            targets.append((
+                action_as_index(action),
+                self._risk(state, action),
+                self._expected_payout(state, action),
+                reward
+            ))
+
+        def blend(prior_weights, prior_biases, prior_qvalues):
+            for action_index, new_weight, new_bias, reward in targets:
+                # determine the updated weight
+                old_weight = prior_weights[action_index]
+                prior_weights[action_index] = (1 - self._alpha) * old_weight + self._alpha * new_weight
+                # determine the updated bias
+                old_bias = prior_biases[action_index]
+                prior_biases[action_index] = (1 - self._beta) * old_bias + self._beta * new_bias
+                # determine the updated q-values
+                prior_qvalue = prior_qvalues[action_index]
+                succ_qvalue = succ_qvalues[action_index]
+                new_qvalue = (
+                    # bellman-ford minus the argmax portion    
+                    prior_qvalue +
+                    self._lr * (
+                        reward + 
+                        self._df * (
+                            succ_qvalue - prior_qvalue
+                        )
                     )
                 )
-            )
-            action_weight = prior_weights[action_index]
-            action_bias = prior_biases[action_index]
-            prior_qvalues[action_index] = action_weight * new_qvalue + action_bias
-        self._table.put(state, prior_weights, prior_biases, prior_qvalues)
+                action_weight = prior_weights[action_index]
+                action_bias = prior_biases[action_index]
+                prior_qvalues[action_index] = action_weight * new_qvalue + action_bias
+            return prior_weights, prior_biases, prior_qvalues
+
+        if update is None:
+            self._table.put(state, *blend(*prior_entry))
+        else:
+            # a shared table blends under the entry's lock, so
+            #  concurrent agents never lose each other's updates
+            update(state, blend)
+        self._last_rewards = rewards
 
 
     def determine_action(self, state):
-        '''Stochastically chooses an action from STATE 
-        using a weighted probability distribution for 
-        the various actions.
+        '''Chooses an action from STATE with the agent's
+        policy, by default sampling the softmax of the
+        actions' Q-values.
 
         Args:
             state (dict): A dictionary containing mappings 
             for the current game state.
         '''
-        action = None
-        dist = self._action_distribution(state)
-        p = random()
-        for a, P in dist:
-            if p > 1 - P:
-                action = a
-                break
-        if not action: action = dist[-1][0]
-        return action
+        actions = self._get_actions(state)
+        qvalues = self._table.get(state)[2]
+        self._last_qvalues = qvalues
+        return actions[self._policy.choose(qvalues[:len(actions)])]
 
 
     def determine_wager(self, state):
@@ -430,13 +475,53 @@ class Agent(Player):
             wager = 2
         else:
             wager = 3
+        # wager whatever is left once the smallest wager is
+        #  no longer affordable
         if Agent.WAGERS[0] > self.account.balance():
-            wager = self.account.balance()
+            return self.account.balance()
         while Agent.WAGERS[wager] > self.account.balance():
             wager -= 1
         return Agent.WAGERS[wager]
 
 
+    def get_chip_delta(self):
+        '''Gets the net number of chips the agent has won.
+
+        Returns:
+            (float): The sum of the chip deltas of every round.
+        '''
+        return self._chip_delta
+
+
+    def get_last_rewards(self):
+        '''Gets the rewards of the last Q-Table update.
+
+        Returns:
+            (list): The reward of each action of the prior state.
+        '''
+        return self._last_rewards
+
+
+    def get_last_qvalues(self):
+        '''Gets the q-values the last action was chosen from,
+        without another Q-Table lookup.
+
+        Returns:
+            (list): The q-value of each action, None before the
+            first action.
+        '''
+        return self._last_qvalues
+
+
+    def get_qvalues(self, state):
+        '''Gets the q-values of STATE.
+
+        Returns:
+            (list): The q-value of each action.
+        '''
+        return self._table.get(state)[2]
+
+
     def get_draw_rate(self):
         '''Gets the agents draw rate. How often the agent draws.
 
@@ -458,6 +543,40 @@ class Agent(Player):
         if games_played == 0: return 0
         return self._losses / self.total_games_played()
 
+    def get_state(self):
+        '''Gets the agent's statistics and prior state, with cards
+        as codes, as a JSON serializable dict.'''
+        prior_state = self._prior_state
+        if prior_state is not None:
+            prior_state = dict(prior_state)
+            if 'dealer_show' in prior_state:
+                prior_state['dealer_show'] = prior_state['dealer_show'].code
+            if 'agent_hand' in prior_state:
+                prior_state['agent_hand'] = [card.code for card in prior_state['agent_hand']]
+        return {
+            'wins': self._wins,
+            'draws': self._draws,
+            'losses': self._losses,
+            'chip_delta': self._chip_delta,
+            'min_chip_delta': self._min_chip_delta,
+            'max_chip_delta': self._max_chip_delta,
+            'prior_state': prior_state,
+            'prior_stage': None if prior_state is None else prior_state['game_stage'],
+            'last_rewards': list(self._last_rewards)
+        }
+
+
+    def get_replay(self):
+        '''Gets the agent's replay buffer, None unless the agent
+        replays.'''
+        return self._replay
+
+
+    def get_table(self):
+        '''Gets the agent's Q-table.'''
+        return self._table
+
+
     def get_win_rate(self):
         '''Gets the agents win rate. How often the agent wins.
 
@@ -469,20 +588,86 @@ class Agent(Player):
         return self._wins / games_played
 
 
+    def observe_count(self, count):
+        '''Makes the agent estimate probabilities from COUNT, the
+        running count of the shoe it is dealt from, instead of
+        assuming a fresh deck every round.
+
+        Args:
+            count (bqa.counting.CardCount): The shoe's count.
+        '''
+        self._count = count
+        self._prior_count = None
+
+
+    def set_state(self, state):
+        '''Restores the statistics and prior state returned by
+        get_state.'''
+        self._wins = state['wins']
+        self._draws = state['draws']
+        self._losses = state['losses']
+        self._chip_delta = state['chip_delta']
+        self._min_chip_delta = state['min_chip_delta']
+        self._max_chip_delta = state['max_chip_delta']
+        self._last_rewards = list(state['last_rewards'])
+        prior_state = state['prior_state']
+        if prior_state is not None:
+            prior_state = dict(prior_state)
+            if 'dealer_show' in prior_state:
+                prior_state['dealer_show'] = CARDS[prior_state['dealer_show']]
+            if 'agent_hand' in prior_state:
+                prior_state['agent_hand'] = tuple(CARDS[code] for code in prior_state['agent_hand'])
+        self._prior_state = prior_state
+        self._prior_actions = {
+            None: None,
+            Agent.PRE_ROUND: Agent.PRE_ROUND_ACTIONS,
+            Agent.IN_ROUND: Agent.IN_ROUND_ACTIONS,
+            Agent.POST_ROUND: Agent.POST_ROUND_ACTIONS
+        }[state['prior_stage']]
+
+
+    def replay(self):
+        '''Applies one mini-batch sampled from the replay buffer
+        to the Q-table.
+
+        Returns:
+            (int): The number of entries updated.
+        '''
+        if self._replay is None or not len(self._replay):
+            return 0
+        batch = self._replay.sample(self._replay_batch, getrandbits(64))
+        return replay_buffer.update(self._table, batch, self._alpha, self._beta, self._lr, self._df)
+
+
     def save_table(self):
         '''Saves the agents q-table.'''
         self._table.save_table()
 
 
+    def total_draws(self):
+        return self._draws
+
+
     def total_games_played(self):
         return self._wins + self._draws + self._losses
 
 
+    def total_losses(self):
+        return self._losses
+
+
+    def total_wins(self):
+        return self._wins
+
+
     def update_parameters(self, state):
         game_stage = state['game_stage']
         # always update the q-table regardless of game stage
         if self._prior_state:
-            self._update_qtable(state)
+            if self._replay is None:
+                self._update_qtable(state)
+            else:
+                self._record_transition(state)
         # update agent variables needed by other calculations
         if game_stage == Agent.PRE_ROUND:
             self._prior_actions = Agent.PRE_ROUND_ACTIONS
@@ -498,11 +683,19 @@ class Agent(Player):
             self._chip_delta += chip_delta
             self._min_chip_delta = min(self._min_chip_delta, self._chip_delta)
             self._max_chip_delta = max(self._max_chip_delta, self._chip_delta)
+            if self._replay is not None:
+                self._replay_rounds += 1
+                if self._replay_rounds % self._replay_every == 0:
+                    self.replay()
+        if game_stage == Agent.IN_ROUND and self._count is not None:
+            if self._prior_count is None:
+                self._prior_count = CardCount(self._count.decks)
+            self._prior_count.copy_from(self._count)
         self._prior_state = state
 
 
 class Dealer(Player):
 
-    def __init__(self, deck=Deck(), account=Account(chips=2000)):
+    def __init__(self, deck=None, account=Account(chips=2000)):
         super().__init__(account)
-        self.deck = Deck()
+        self.deck = Deck() if deck is None else deck
@@ -0,0 +1,195 @@
+'''Action selection from Q-values.
+
+A Policy turns a vector of Q-values into a cumulative action
+distribution and samples an action from it with a single
+uniform draw, so softmax, epsilon-greedy and greedy selection
+all share one sampling path. Distributions are not cached:
+every update of a state changes its Q-values, so a cache keyed
+on them almost never hits while an agent learns. choose picks
+one action with the random module, choose_many picks one action
+for every row of an array of Q-vectors at once and needs numpy.
+'''
+
+from bisect import bisect_right
+from itertools import accumulate
+from math import exp
+from random import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+SOFTMAX = 'softmax'
+EPSILON_GREEDY = 'epsilon'
+GREEDY = 'greedy'
+MODES = (SOFTMAX, EPSILON_GREEDY, GREEDY)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('batched action selection requires numpy, install bqa[batch]')
+
+
+def _argmax(v):
+    # the first of the maximal values, like numpy.argmax
+    best = 0
+    for i in range(1, len(v)):
+        if v[i] > v[best]:
+            best = i
+    return best
+
+
+def softmax(v, temperature=1.0):
+    '''Performs the softmax function on V. The values are shifted
+    by their max before exponentiating, so large Q-values cannot
+    overflow.
+
+    Args:
+        v (list): A list containing numeric values.
+        temperature (float): Values are divided by TEMPERATURE,
+        lower temperatures sharpen the distribution.
+
+    Returns:
+        (list): A list containing decimals that sum to 1.
+    '''
+    vmax = max(v)
+    e = [exp((x - vmax) / temperature) for x in v]
+    total = sum(e)
+    return [x / total for x in e]
+
+
+def softmax_many(v, temperature=1.0):
+    '''Performs the softmax function on every row of V.
+
+    Args:
+        v (numpy.ndarray): A (rows, actions) array of values.
+        temperature (float): See softmax.
+
+    Returns:
+        (numpy.ndarray): A (rows, actions) array whose rows sum
+        to 1.
+    '''
+    _require_numpy()
+    v = np.asarray(v, dtype=np.float64)
+    e = np.exp((v - v.max(axis=1, keepdims=True)) / temperature)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def cumulative(probabilities):
+    '''Returns the cumulative distribution of PROBABILITIES as a
+    tuple whose last value is exactly 1, so every uniform draw in
+    [0, 1) maps to an action.'''
+    cdf = list(accumulate(probabilities))
+    cdf[-1] = 1.0
+    return tuple(cdf)
+
+
+def sample(cdf, u):
+    '''Returns the index of the action a uniform draw U in [0, 1)
+    selects from the cumulative distribution CDF.'''
+    return min(bisect_right(cdf, u), len(cdf) - 1)
+
+
+class Policy:
+
+    def __init__(self, mode=SOFTMAX, temperature=1.0, epsilon=0.1):
+        '''Returns a policy that selects actions from Q-values.
+
+        Args:
+            mode (str): SOFTMAX samples actions in proportion to
+            the softmax of their Q-values, EPSILON_GREEDY takes a
+            uniformly random action with probability EPSILON and
+            the best action otherwise, GREEDY always takes the
+            best action without drawing a random number.
+            temperature (float): The softmax temperature.
+            epsilon (float): The exploration rate of
+            EPSILON_GREEDY.
+
+        Returns:
+            (Policy): A Policy instance.
+        '''
+        if mode not in MODES:
+            raise ValueError('unknown action selection mode: {}'.format(mode))
+        if temperature <= 0:
+            raise ValueError('the temperature must be positive')
+        if not 0 <= epsilon <= 1:
+            raise ValueError('epsilon must be in [0, 1]')
+        self.mode = mode
+        self.temperature = temperature
+        self.epsilon = epsilon
+
+
+    def distribution(self, qvalues):
+        '''Returns the action probabilities for QVALUES.
+
+        Args:
+            qvalues (list): The Q-value of every action.
+
+        Returns:
+            (list): The probability of every action.
+        '''
+        n = len(qvalues)
+        if self.mode == SOFTMAX:
+            return softmax(qvalues, self.temperature)
+        explore = self.epsilon / n if self.mode == EPSILON_GREEDY else 0
+        probabilities = [explore] * n
+        probabilities[_argmax(qvalues)] += 1 - explore * n
+        return probabilities
+
+
+    def cumulative(self, qvalues):
+        '''Returns the cumulative distribution for QVALUES.'''
+        return cumulative(self.distribution(qvalues))
+
+
+    def choose(self, qvalues, u=None):
+        '''Returns the index of the action chosen for QVALUES.
+
+        Args:
+            qvalues (list): The Q-value of every action.
+            u (float): A uniform draw in [0, 1). Drawn with
+            random.random when omitted.
+
+        Returns:
+            (int): The index of the chosen action.
+        '''
+        if self.mode == GREEDY:
+            return _argmax(qvalues)
+        if u is None:
+            u = random()
+        return sample(self.cumulative(qvalues), u)
+
+
+    def choose_many(self, qvalues, rng=None, u=None):
+        '''Returns the index of the action chosen for every row of
+        QVALUES, with a single uniform draw per row.
+
+        Args:
+            qvalues (numpy.ndarray): A (rows, actions) array of
+            Q-values.
+            rng (numpy.random.Generator): Draws the uniforms when
+            U is omitted. A fresh default_rng() when omitted too.
+            u (numpy.ndarray): A uniform draw in [0, 1) per row.
+
+        Returns:
+            (numpy.ndarray): The index of every row's action.
+        '''
+        _require_numpy()
+        qvalues = np.asarray(qvalues, dtype=np.float64)
+        rows, n = qvalues.shape
+        best = qvalues.argmax(axis=1)
+        if self.mode == GREEDY or rows == 0:
+            return best
+        if u is None:
+            u = (rng if rng is not None else np.random.default_rng()).random(rows)
+        if self.mode == SOFTMAX:
+            probabilities = softmax_many(qvalues, self.temperature)
+        else:
+            probabilities = np.full((rows, n), self.epsilon / n)
+            probabilities[np.arange(rows), best] += 1 - self.epsilon
+        cdf = np.cumsum(probabilities, axis=1)
+        cdf[:, -1] = 1.0
+        return np.minimum((u[:, None] >= cdf).sum(axis=1), n - 1)
+
@@ -0,0 +1,184 @@
+import functools
+import time
+
+import bqa.game as game
+from bqa.cards import Deck, Shoe
+from bqa.player import Agent
+from bqa.qtable import QTable
+
+
+STAGES = ('PRE_ROUND', 'IN_ROUND', 'POST_ROUND')
+# latencies are bucketed by powers of two nanoseconds
+BUCKETS = 40
+
+
+class Timer:
+
+    def __init__(self, label):
+        '''Returns a latency accumulator for LABEL. Every sample
+        updates a count, a total, the extremes and a log2
+        histogram, so recording is O(1) and memory is fixed.
+        '''
+        self.label = label
+        self.calls = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.histogram = [0] * BUCKETS
+
+
+    def add(self, ns):
+        self.calls += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.histogram[min(ns.bit_length(), BUCKETS - 1)] += 1
+
+
+    def mean(self):
+        return self.total / self.calls if self.calls else 0
+
+
+    def percentile(self, p):
+        '''Returns the upper bound, in ns, of the histogram bucket
+        holding the P-th percentile.'''
+        if not self.calls:
+            return 0
+        rank = p / 100 * self.calls
+        seen = 0
+        for bucket, n in enumerate(self.histogram):
+            seen += n
+            if seen >= rank:
+                return min(1 << bucket, self.max)
+        return self.max
+
+
+class Profiler:
+
+    def __init__(self):
+        '''Returns a profiler that times the hot paths of
+        bqa.game.play once installed. Methods are patched on their
+        classes, so every instance created while the profiler is
+        installed is timed, and restored by uninstall.
+
+        Returns:
+            (Profiler): A Profiler instance.
+        '''
+        self.timers = dict()
+        self.table_stats = None
+        self._patched = []
+
+
+    def __enter__(self):
+        self.install()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+    def _timer(self, label):
+        timer = self.timers.get(label)
+        if timer is None:
+            timer = self.timers[label] = Timer(label)
+        return timer
+
+
+    def _wrap(self, owner, name, label, by_stage=False):
+        fn = getattr(owner, name)
+        clock = time.perf_counter_ns
+        if by_stage:
+            timers = [self._timer('{}[{}]'.format(label, stage)) for stage in STAGES]
+            @functools.wraps(fn)
+            def wrapper(agent, state, *args, **kwargs):
+                start = clock()
+                try:
+                    return fn(agent, state, *args, **kwargs)
+                finally:
+                    timers[state['game_stage']].add(clock() - start)
+        else:
+            timer = self._timer(label)
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = clock()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    timer.add(clock() - start)
+        self._patched.append((owner, name, fn))
+        setattr(owner, name, wrapper)
+
+
+    def _capture_table_stats(self):
+        profiler = self
+        fn = Agent.save_table
+        @functools.wraps(fn)
+        def save_table(agent):
+            # the table's counters are read before it is closed
+            profiler.table_stats = agent._table.stats()
+            return fn(agent)
+        self._patched.append((Agent, 'save_table', fn))
+        Agent.save_table = save_table
+
+
+    def install(self):
+        '''Patches the timed functions.'''
+        if self._patched:
+            return
+        self._wrap(Agent, 'update_parameters', 'Agent.update_parameters', by_stage=True)
+        self._wrap(Agent, '_update_qtable', 'Agent._update_qtable')
+        self._wrap(Agent, 'determine_action', 'Agent.determine_action')
+        self._wrap(Agent, '_risk', 'Agent._risk')
+        self._wrap(Agent, '_softmax', 'Agent._softmax')
+        for name in ('get', 'put', '_evict', 'flush', '_write_entries'):
+            self._wrap(QTable, name, 'QTable.{}'.format(name))
+        for cls in (Deck, Shoe):
+            for name in ('draw', 'reshuffle'):
+                self._wrap(cls, name, '{}.{}'.format(cls.__name__, name))
+        self._wrap(game, 'hand_value', 'hand_value')
+        self._capture_table_stats()
+
+
+    def uninstall(self):
+        '''Restores the timed functions.'''
+        while self._patched:
+            owner, name, fn = self._patched.pop()
+            setattr(owner, name, fn)
+
+
+    def report(self, rounds=None, elapsed=None):
+        '''Returns the latency breakdown as a list of lines, sorted
+        by total time. Times are inclusive, e.g. _update_qtable
+        includes its QTable.get calls.
+
+        Args:
+            rounds (int): The number of rounds played.
+            elapsed (float): The wall time of the run in seconds.
+
+        Returns:
+            (list): The lines of the report.
+        '''
+        lines = []
+        if elapsed:
+            lines.append('Wall time: {:.3f}s'.format(elapsed))
+            if rounds is not None:
+                lines.append('Rounds/sec: {:.1f}'.format(rounds / elapsed))
+        if self.table_stats is not None:
+            stats = self.table_stats
+            if 'hit_ratio' in stats:
+                lines.append('Cache hit ratio: {:.2f}% ({} hits, {} misses, {} evictions)'.format(
+                    stats['hit_ratio'] * 100, stats.get('hits', 0), stats.get('misses', 0), stats.get('evictions', 0)))
+        lines.append('{:<36} {:>10} {:>11} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+            'function', 'calls', 'total ms', 'mean us', 'p50 us', 'p99 us', 'max us', '% wall'))
+        timers = sorted(self.timers.values(), key=lambda t: t.total, reverse=True)
+        for t in timers:
+            if not t.calls:
+                continue
+            share = t.total / 1e9 / elapsed * 100 if elapsed else 0
+            lines.append('{:<36} {:>10} {:>11.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f} {:>7.1f}'.format(
+                t.label, t.calls, t.total / 1e6, t.mean() / 1e3,
+                t.percentile(50) / 1e3, t.percentile(99) / 1e3, t.max / 1e3, share))
+        return lines
@@ -1,141 +1,649 @@
 import json
 import sqlite3
+import struct
+import threading
+import time
+from collections import deque
+from heapq import merge
+from concurrent.futures import ThreadPoolExecutor
 from random import random
 
-import bqa.player as player
+from bqa.cache import make_cache
+from bqa.keys import IN_ROUND, PRE_ROUND, key_bucket, key_stage, state_key
+
+
+# user_version 1: rows keyed by bqa.keys.state_key, json columns
+# user_version 2: rows keyed by bqa.keys.state_key, packed blobs
+SCHEMA_VERSION = 2
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+# the max number of keys bound to one IN (...) query, below the
+#  999 variable limit of older sqlite builds
+CHUNK_SIZE = 900
+# the number of rows fetched per fetchmany while preloading
+PRELOAD_BATCH = 4096
+# packed entries are the weights, biases and qvalues of every
+#  action as little endian float64s, one struct per action count
+_ENTRY_STRUCTS = {n: struct.Struct('<{}d'.format(3 * n)) for n in range(1, 4)}
+
+
+def pack_entry(weights, biases, qvalues):
+    '''Packs WEIGHTS, BIASES and QVALUES into a blob.
+
+    Returns:
+        (bytes): 24 bytes per action.
+    '''
+    return _ENTRY_STRUCTS[len(qvalues)].pack(*weights, *biases, *qvalues)
+
+
+def unpack_entry(blob):
+    '''Unpacks a blob created by pack_entry.
+
+    Returns:
+        (tuple): The weights, biases and qvalues lists.
+    '''
+    n = len(blob) // 24
+    values = _ENTRY_STRUCTS[n].unpack(blob)
+    return list(values[:n]), list(values[n:2 * n]), list(values[2 * n:])
+
+
+def shard_paths(db, shards=1):
+    '''Returns the database files of a Q-table split across
+    SHARDS files. An unsharded table is the single file DB, shard
+    i of a sharded one is the file DB.i.
+
+    Args:
+        db (str): The name of the Q-table database.
+        shards (int): The number of shards.
+
+    Returns:
+        (list): The file of every shard.
+    '''
+    if shards < 1:
+        raise ValueError('a qtable needs at least one shard')
+    if shards == 1:
+        return [db]
+    return ['{}.{}'.format(db, shard) for shard in range(shards)]
+
+
+def _scatter(fn, args, pool=None):
+    # FN applied to every item of ARGS, on POOL's threads if given
+    if pool is None or len(args) == 1:
+        return [fn(*arg) for arg in args]
+    return list(pool.map(lambda arg: fn(*arg), args))
+
+
+def _convert_json_rows(cursor):
+    # rewrites a user_version 1 table with packed blobs
+    cursor.execute('create table qtable_packed (state_hash integer primary key, entry blob)')
+    rows = cursor.execute('select state_hash, weights, biases, qvalues from qtable')
+    cursor.executemany('insert into qtable_packed values (?, ?)', (
+        (state_hash, pack_entry(json.loads(weights), json.loads(biases), json.loads(qvalues)))
+        for state_hash, weights, biases, qvalues in rows.fetchall()
+    ))
+    cursor.execute('drop table qtable')
+    cursor.execute('alter table qtable_packed rename to qtable')
+
+
+def _create_schema(conn, shard=None):
+    # creates or migrates the qtable of CONN. SHARD, 'i/n' for
+    #  shard i of n, is checked against the one recorded
+    cursor = conn.cursor()
+    version = cursor.execute('pragma user_version').fetchone()[0]
+    columns = [row[1] for row in cursor.execute('pragma table_info(qtable)')]
+    if version < SCHEMA_VERSION and columns:
+        if version == 0 and cursor.execute('select 1 from qtable limit 1').fetchone():
+            raise ValueError('the qtable is keyed by unstable hash() values, rekey it with `qtable-tool rekey`')
+        if 'weights' in columns:
+            _convert_json_rows(cursor)
+    cursor.execute('create table if not exists qtable (state_hash integer primary key, entry blob)')
+    cursor.execute('pragma user_version={}'.format(SCHEMA_VERSION))
+    if shard is not None:
+        cursor.execute('create table if not exists meta (name text primary key, value text)')
+        row = cursor.execute("select value from meta where name='shard'").fetchone()
+        if row is None:
+            cursor.execute("insert into meta values ('shard', ?)", (shard,))
+        elif row[0] != shard:
+            raise ValueError('the qtable shard is {}, not {}, reshard it with `qtable-tool reshard`'.format(row[0], shard))
+    conn.commit()
+
+
+def _open_db(path, journal_mode, synchronous, shard=None):
+    # returns a connection to the created or migrated PATH. Any
+    #  thread may use it, one at a time
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('pragma journal_mode={}'.format(journal_mode))
+    conn.execute('pragma synchronous={}'.format(synchronous))
+    _create_schema(conn, shard)
+    return conn
+
+
+def read_rows(db, shards=1):
+    '''Returns every row of the Q-table DB, reading the files of
+    a sharded table in parallel. Dirty entries still cached by a
+    live QTable must be synced to DB first.
+
+    Args:
+        db (str): The name of the Q-table database.
+        shards (int): The number of shards DB is split across.
+
+    Returns:
+        (list): The (state hash, packed entry) rows of every
+        shard.
+    '''
+    def read(path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute('select state_hash, entry from qtable').fetchall()
+        finally:
+            conn.close()
+    paths = [(path,) for path in shard_paths(db, shards)]
+    with ThreadPoolExecutor(len(paths)) as pool:
+        return [row for rows in _scatter(read, paths, pool) for row in rows]
+
+
+def _fetch_rows(cursor):
+    # yields the rows of CURSOR, fetched PRELOAD_BATCH at a time
+    for rows in iter(lambda: cursor.fetchmany(PRELOAD_BATCH), []):
+        yield from rows
+
+
+def _new_entry(state_hash):
+    # the initial weights, biases and qvalues of an unseen state
+    if key_stage(state_hash) == PRE_ROUND:
+        return [random(), random()], [random(), random()], [1, 0]
+    return [random(), random(), random()], [random(), random(), random()], [0, 0, 0]
+
+
+def _frozen(entry):
+    # a copy of ENTRY's values that later in-place updates of the
+    #  cached lists cannot change while it waits to be written
+    return tuple(entry[0]), tuple(entry[1]), tuple(entry[2])
+
+
+def _thawed(entry):
+    # fresh lists of a frozen ENTRY's values for the cache
+    return list(entry[0]), list(entry[1]), list(entry[2])
+
+
+def _write_rows(conn, entries, meta=None):
+    # writes ENTRIES and META in one transaction on CONN
+    rows = [
+        (state_hash, pack_entry(weights, biases, qvalues))
+        for state_hash, (weights, biases, qvalues) in entries
+    ]
+    with conn:
+        conn.executemany('insert or replace into qtable values (?, ?)', rows)
+        if meta:
+            conn.execute('create table if not exists meta (name text primary key, value text)')
+            conn.executemany('insert or replace into meta values (?, ?)', meta.items())
+
+
+class Flusher:
+
+    def __init__(self, db, journal_mode='wal', synchronous='normal', max_queued=16384):
+        '''Returns a writer thread that commits batches of
+        QTable entries to DB on its own connection.
+
+        Batches wait in a queue bounded by MAX_QUEUED entries.
+        The writer commits every batch queued at once in one
+        transaction, except that a batch with meta values ends its
+        transaction, so the meta values never describe entries
+        queued after them. Entries stay readable through get
+        until their transaction committed.
+
+        Args:
+            db (str): The sqlite database file.
+            journal_mode (str): The sqlite journal mode.
+            synchronous (str): The sqlite synchronous mode.
+            max_queued (int): The max number of queued entries.
+            Submitting more blocks until the writer caught up.
+
+        Returns:
+            (Flusher): A Flusher instance.
+        '''
+        self.max_queued = max_queued
+        self.commits = 0
+        self.written = 0
+        # the number of submits that waited for the writer
+        self.waits = 0
+        self.max_depth = 0
+        self._db = db
+        self._journal_mode = journal_mode
+        self._synchronous = synchronous
+        self._cond = threading.Condition()
+        # (entries, meta, done event) batches in submit order
+        self._batches = deque()
+        self._queued = 0
+        self._writing = False
+        self._closed = False
+        self._error = None
+        # the newest queued entry of every key
+        self._in_flight = dict()
+        self._thread = threading.Thread(target=self._run, name='qtable-flusher', daemon=True)
+        self._thread.start()
+
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError('the qtable writer failed') from self._error
+
+
+    def _run(self):
+        conn = sqlite3.connect(self._db)
+        conn.execute('pragma journal_mode={}'.format(self._journal_mode))
+        conn.execute('pragma synchronous={}'.format(self._synchronous))
+        cond = self._cond
+        while True:
+            with cond:
+                while not self._batches and not self._closed:
+                    cond.wait()
+                if not self._batches:
+                    break
+                taken = []
+                while self._batches:
+                    batch = self._batches.popleft()
+                    taken.append(batch)
+                    if batch[1]:
+                        break
+                self._writing = True
+            entries = [entry for batch in taken for entry in batch[0]]
+            error = None
+            if self._error is None:
+                try:
+                    _write_rows(conn, entries, taken[-1][1])
+                except Exception as e:
+                    error = e
+            with cond:
+                in_flight = self._in_flight
+                for state_hash, entry in entries:
+                    # a newer entry of the key may have been queued
+                    if in_flight.get(state_hash) is entry:
+                        del in_flight[state_hash]
+                self._queued -= len(entries)
+                self._writing = False
+                if error is not None:
+                    self._error = error
+                else:
+                    self.commits += 1
+                    self.written += len(entries)
+                cond.notify_all()
+            for batch in taken:
+                if batch[2] is not None:
+                    batch[2].set()
+        conn.close()
+
+
+    def close(self):
+        '''Drains the queue and stops the writer.'''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._check()
+
+
+    def drain(self):
+        '''Waits until every queued batch is committed.'''
+        with self._cond:
+            while self._batches or self._writing:
+                self._cond.wait()
+            self._check()
+
+
+    def get(self, state_hash):
+        '''Returns the queued entry of STATE_HASH or None.'''
+        with self._cond:
+            return self._in_flight.get(state_hash)
+
+
+    def stats(self):
+        '''Returns the writer's queue and commit counters.'''
+        with self._cond:
+            return {
+                'queued': self._queued,
+                'max_depth': self.max_depth,
+                'commits': self.commits,
+                'written': self.written,
+                'waits': self.waits
+            }
+
+
+    def submit(self, entries, meta=None, wait=False):
+        '''Queues ENTRIES, (state hash, (weights, biases,
+        qvalues)) pairs, and META for one transaction. Blocks while
+        the queue is full. The values are written as they are when
+        the writer gets to them, so they must not change after
+        they were submitted.
+
+        Args:
+            entries (iterable): The entries to write.
+            meta (dict): Names and string values written to the
+            meta table in the same transaction.
+            wait (bool): Return once the batch is committed.
+        '''
+        entries = list(entries)
+        done = threading.Event() if wait else None
+        with self._cond:
+            self._check()
+            if self._closed:
+                raise ValueError('the qtable writer is closed')
+            # a batch larger than the queue is let in once empty
+            while self._queued and self._queued + len(entries) > self.max_queued:
+                self.waits += 1
+                self._cond.wait()
+                self._check()
+            in_flight = self._in_flight
+            for state_hash, entry in entries:
+                in_flight[state_hash] = entry
+            self._batches.append((entries, meta, done))
+            self._queued += len(entries)
+            self.max_depth = max(self.max_depth, self._queued)
+            self._cond.notify_all()
+        if done is not None:
+            done.wait()
+            with self._cond:
+                self._check()
+
 
 class QTable:
 
-    def __init__(self, db='table.db', size=64, quantum=32):
+    def __init__(self, db='table.db', size=64, policy='lru', flush_size=256, flush_interval=5.0, journal_mode='wal', synchronous='normal', preload=None, async_writes=False, max_queued=16384, shards=1):
         '''Returns a new instance of a QTable configured with
-        the specified DB, SIZE and QUANTUM.
+        the specified DB, SIZE and eviction POLICY.
+
+        Dirty entries evicted from the cache are not written
+        immediately. They are buffered and written in a single
+        transaction once FLUSH_SIZE entries are pending, once
+        FLUSH_INTERVAL seconds have passed since the last flush,
+        or when the table is saved or closed.
 
         Args:
             db (str): The name of the backing sqlite database.
             size (int): The max number of entries to cache.
-            quantum (int): The number of accesses before each
-            entries age is reset to 0.
+            policy (str): The cache eviction policy, one of
+            'lru', 'clock' or '2q'.
+            flush_size (int): The number of pending writes that
+            triggers a flush.
+            flush_interval (float): The max number of seconds a
+            pending write waits before it is flushed.
+            journal_mode (str): The sqlite journal mode, e.g.
+            'wal' or 'delete'.
+            synchronous (str): The sqlite synchronous mode, e.g.
+            'normal' or 'full'.
+            preload (int|str): Stream this many rows, or 'all'
+            the cache can hold, into the cache on construction.
+            See preload.
+            async_writes (bool): Hand flushes to a Flusher thread
+            with its own connection instead of committing them
+            in the calling thread.
+            max_queued (int): The max number of entries queued
+            for the Flusher before flushes block.
+            shards (int): Split the table across this many
+            database files by a stable hash of the state key, see
+            shard_paths. Every shard has its own connection,
+            Flusher and write batch, and the shards are opened,
+            flushed and scanned in parallel.
 
         Returns:
             (QTable): A QTable instance.
         '''
-        # this table maps states to weights/biases/ages
-        self._table = dict()
-        self._db = sqlite3.connect(db)
-        self._connected = True
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError('unknown journal mode: {}'.format(journal_mode))
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError('unknown synchronous mode: {}'.format(synchronous))
+        # this table maps states to weights/biases/qvalues/dirty
+        self._table = make_cache(policy, size)
+        # evicted dirty entries waiting to be written
+        self._pending = dict()
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        # held writes are only flushed by flush/sync/close
+        self._held = False
+        self._journal_mode = journal_mode
+        self._synchronous = synchronous
         self._size = size
-        self._quantum = quantum
-        self._n = 0
-        self._create_db()
+        if async_writes and db == ':memory:':
+            raise ValueError('asynchronous writes need a database file')
+        if shards > 1 and db == ':memory:':
+            raise ValueError('a sharded qtable needs a database file')
+        self._shards = shards
+        self._async_writes = async_writes
+        self._max_queued = max_queued
+        self._flushers = []
+        self._pool = None
+        self._connect(db)
+        if preload == 'all':
+            self.preload()
+        elif preload:
+            self.preload(int(preload))
 
 
     def __len__(self):
         return len(self._table)
 
 
-    def _age(self):
-        '''Ages each entry in the qtable cache by 1. Will reset
-        the age of each entry to 0 each time the quantum is
-        reached.
-        '''
-        for key, value in self._table.items():
-            weights, biases, qvalues, age = value[0], value[1], value[2], value[3]
-            if self._n % self._quantum:
-                age = 0
-            self._table[key] = [weights, biases, qvalues, age + 1]
-        self._n += 1
-
-
-    def _create_db(self):
-        cursor = self._db.cursor()
-        cursor.execute('create table if not exists qtable (state_hash int primary key, weights text, biases text, qvalues text)')
-        self._db.commit()
-
-
-    def _evict(self):
-        max_age = -1
-        max_state_hash = None
-        max_weights = None
-        max_biases = None
-        max_qvalues = None
-        # if multiple elements have the same largest age, the
-        #  last element will be evicted
-        for key, value in self._table.items():
-            weights, biases, qvalues, age = value[0], value[1], value[2], value[3]
-            if age > max_age:
-                max_age = age
-                max_state_hash = key
-                max_weights = weights
-                max_biases = biases
-                max_qvalues = qvalues
-        # write out the state, weights, biases
-        self._write_entry(max_state_hash, max_weights, max_biases, max_qvalues)
-        del self._table[max_state_hash]
+    def _connect(self, db):
+        paths = shard_paths(db, self._shards)
+        if self._shards == 1:
+            self._conns = [_open_db(db, self._journal_mode, self._synchronous)]
+        else:
+            # the shards may live on different disks, so they are
+            #  opened, flushed and scanned at once
+            self._pool = ThreadPoolExecutor(self._shards, thread_name_prefix='qtable-shard')
+            self._conns = _scatter(_open_db, [
+                (path, self._journal_mode, self._synchronous, '{}/{}'.format(shard, self._shards))
+                for shard, path in enumerate(paths)
+            ], self._pool)
+        # shard 0, the only one of an unsharded table, holds the
+        #  meta values
+        self._db = self._conns[0]
+        self._connected = True
+        if self._async_writes:
+            self._flushers = [
+                Flusher(path, self._journal_mode, self._synchronous, self._max_queued)
+                for path in paths
+            ]
+
+
+    def _shard(self, state_hash):
+        return key_bucket(state_hash, self._shards) if self._shards > 1 else 0
+
+
+    def _split(self, entries):
+        # groups (state hash, value) ENTRIES by shard
+        shards = [[] for _ in range(self._shards)]
+        for entry in entries:
+            shards[self._shard(entry[0])].append(entry)
+        return shards
+
+
+    def _cache(self, state_hash, weights, biases, qvalues, dirty=True):
+        evicted = self._table.put(state_hash, [weights, biases, qvalues, dirty])
+        if evicted is not None:
+            self._evict(*evicted)
+
+
+    def _evict(self, state_hash, entry):
+        # clean entries already match the database
+        if not entry[3]:
+            return
+        self._pending[state_hash] = _frozen(entry)
+        if self._held:
+            return
+        if (len(self._pending) >= self._flush_size or
+                time.monotonic() - self._last_flush >= self._flush_interval):
+            self.flush()
 
 
     def _read_entry(self, state_hash):
-        cursor = self._db.cursor()
-        try:
-            weights, biases, qvalues = cursor.execute('select weights, biases, qvalues from qtable where state_hash=?', (state_hash,))
-        except ValueError:
+        # entries waiting to be flushed are newer than the database
+        shard = self._shard(state_hash)
+        pending = self._pending.get(state_hash)
+        if pending is None and self._flushers:
+            pending = self._flushers[shard].get(state_hash)
+        if pending is not None:
+            return _thawed(pending)
+        cursor = self._conns[shard].cursor()
+        row = cursor.execute('select entry from qtable where state_hash=?', (state_hash,)).fetchone()
+        if row is None:
             return None
-        return json.loads(weights), json.loads(biases), json.loads(qvalues)
+        return unpack_entry(row[0])
+
+
+    def _read_entries(self, state_hashes):
+        # like _read_entry for many keys, CHUNK_SIZE keys per query
+        entries = dict()
+        unread = [[] for _ in range(self._shards)]
+        for state_hash in state_hashes:
+            shard = self._shard(state_hash)
+            pending = self._pending.get(state_hash)
+            if pending is None and self._flushers:
+                pending = self._flushers[shard].get(state_hash)
+            if pending is None:
+                unread[shard].append(state_hash)
+            else:
+                entries[state_hash] = _thawed(pending)
+        for conn, keys in zip(self._conns, unread):
+            for i in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[i:i + CHUNK_SIZE]
+                cursor = conn.execute(
+                    'select state_hash, entry from qtable where state_hash in ({})'.format(','.join('?' * len(chunk))),
+                    chunk
+                )
+                for state_hash, blob in cursor:
+                    entries[state_hash] = unpack_entry(blob)
+        return entries
 
 
-    def _write_entry(self, state_hash, weights, biases, qvalues):
-        weights = json.dumps(weights)
-        biases = json.dumps(biases)
-        qvalues = json.dumps(qvalues)
-        cursor = self._db.cursor()
-        cursor.execute('insert into qtable values (?, ?, ?, ?) on conflict(state_hash) do update set weights=?, biases=?, qvalues=?', (state_hash, weights, biases, qvalues, weights, biases, qvalues,))
-        self._db.commit()
+    def _write_entries(self, entries, meta=None):
+        if self._shards == 1:
+            batches = [(0, entries, meta)]
+        else:
+            # one batch per shard, the meta values go with shard 0
+            batches = [
+                (shard, shard_entries, meta if shard == 0 else None)
+                for shard, shard_entries in enumerate(self._split(entries))
+                if shard_entries or (meta and shard == 0)
+            ]
+        if self._flushers:
+            for shard, shard_entries, shard_meta in batches:
+                # a checkpoint's meta is only durable once committed
+                self._flushers[shard].submit(shard_entries, shard_meta, wait=bool(shard_meta))
+        else:
+            _scatter(_write_rows, [
+                (self._conns[shard], shard_entries, shard_meta)
+                for shard, shard_entries, shard_meta in batches
+            ], self._pool)
 
 
     def contains(self, state):
-        state_hash = hash(tuple(state.values()))
-        return state_hash in self._table
+        '''Returns True if STATE is cached, waiting to be flushed
+        or stored in the database.'''
+        key = state_key(state)
+        return key in self._table or self._read_entry(key) is not None
 
 
     def get(self, state):
-        state_hash = hash(tuple(state.values()))
-        if state_hash in self._table: 
-            weights, biases, qvalues, _ = self._table[state_hash]
-            self._table[state_hash] = [weights, biases, qvalues, 0]
-            return [weights, biases, qvalues]
-        db_result = self._read_entry(state_hash)
+        key = state_key(state)
+        entry = self._table.get(key)
+        if entry is not None:
+            return entry[:3]
+        dirty = False
+        db_result = self._read_entry(key)
         if db_result is None:
-            game_stage = state['game_stage']
-            if game_stage == player.Agent.PRE_ROUND:
-                weights = [random(), random()]
-                biases = [random(), random()]
-                qvalues = [1, 0]
-                if self.__len__() == self._size:
-                    self._evict()
-                self._table[state_hash] = [weights, biases, qvalues, 0]
-                return [weights, biases, qvalues]
-            else:
-                weights = [random(), random(), random()]
-                biases = [random(), random(), random()]
-                qvalues = [0, 0, 0]
-                if self.__len__() == self._size:
-                    self._evict()
-                self._table[state_hash] = [weights, biases, qvalues, 0]
-                return [weights, biases, qvalues]
-        weights, biases, qvalues = db_result[0], db_result[1], db_result[2]
-        if self.__len__() == self._size:
-            self._evict()
-        self._table[state_hash] = [weights, biases, qvalues, 0]
+            dirty = True
+            weights, biases, qvalues = _new_entry(key)
+        else:
+            weights, biases, qvalues = db_result[0], db_result[1], db_result[2]
+        self._cache(key, weights, biases, qvalues, dirty)
         return [weights, biases, qvalues]
 
 
+    def get_many(self, states):
+        '''Returns the entries of every state in STATES like get.
+        The states that are neither cached nor pending are read
+        with one query per CHUNK_SIZE states instead of one query
+        each.
+
+        Args:
+            states (iterable): Game state dicts or state keys.
+
+        Returns:
+            (list): The [weights, biases, qvalues] of every state,
+            in order.
+        '''
+        keys = [state_key(state) for state in states]
+        entries = dict()
+        missing = []
+        for key in keys:
+            if key in entries:
+                continue
+            entry = self._table.get(key)
+            if entry is None:
+                missing.append(key)
+            entries[key] = None if entry is None else entry[:3]
+        rows = self._read_entries(missing)
+        for key in missing:
+            row = rows.get(key)
+            if row is None:
+                weights, biases, qvalues = _new_entry(key)
+            else:
+                weights, biases, qvalues = row[0], row[1], row[2]
+            self._cache(key, weights, biases, qvalues, row is None)
+            entries[key] = [weights, biases, qvalues]
+        return [entries[key] for key in keys]
+
+
+    def close(self):
+        '''Writes every dirty entry to the database and closes
+        the connection.'''
+        if not self._connected:
+            return
+        self.sync()
+        for flusher in self._flushers:
+            flusher.close()
+        self._flushers = []
+        for conn in self._conns:
+            conn.close()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._connected = False
+
+
+    def flush(self, meta=None):
+        '''Writes the entries evicted since the last flush to
+        the database in a single transaction, one per shard of a
+        sharded table, written in parallel.
+
+        Args:
+            meta (dict): Names and string values stored in the
+            meta table in the same transaction, shard 0's of a
+            sharded table.
+        '''
+        if self._pending or meta:
+            self._write_entries(self._pending.items(), meta)
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+
+
+    def hold(self):
+        '''Keeps evicted entries in memory until the next explicit
+        flush, sync or close, so the database only changes at
+        those points, e.g. at checkpoints.'''
+        self._held = True
+
+
     def init_table(self, db):
-        '''Initializes a new table.
+        '''Initializes a new table. Connecting creates its schema,
+        so this is load_table.
 
         Args:
             db (str): The name of the database to initialize.
         '''
-        self.load_db(db)
-        self._create_db(db)
+        self.load_table(db)
 
 
     def load_table(self, db):
@@ -146,24 +654,58 @@ class QTable:
             db (str): The name of the sqlite database to connect
             to that stores the table you want to load.
         '''
-        if self._connected:
-            self._db.close()
-        self._db = sqlite.connect(db)
+        self.close()
         self._table.clear()
-        self._n = 0
-        
+        self._connect(db)
+
+
+    def preload(self, limit=None):
+        '''Streams rows into the cache with one sequential scan
+        per shard. The PRE_ROUND and POST_ROUND rows of every
+        shard come first since every round visits them. Cached
+        and pending entries are newer than their rows and are
+        left alone.
+
+        Args:
+            limit (int): The max number of rows to load. Never
+            more than the cache holds, which is the default.
+
+        Returns:
+            (int): The number of rows loaded.
+        '''
+        limit = self._size if limit is None else min(limit, self._size)
+        query = 'select state_hash, entry from qtable order by (state_hash & 3) = 1 limit ?'
+        streams = [_fetch_rows(conn.execute(query, (limit,))) for conn in self._conns]
+        if self._shards == 1:
+            rows = streams[0]
+        else:
+            # the shards are read PRELOAD_BATCH rows at a time and
+            #  merged, so the rows of the other stages of every
+            #  shard come before the IN_ROUND rows of any shard
+            rows = merge(*streams, key=lambda row: key_stage(row[0]) == IN_ROUND)
+        loaded = 0
+        for state_hash, blob in rows:
+            if loaded >= limit:
+                break
+            if state_hash in self._table or state_hash in self._pending:
+                continue
+            weights, biases, qvalues = unpack_entry(blob)
+            self._cache(state_hash, weights, biases, qvalues, dirty=False)
+            loaded += 1
+        return loaded
+
 
     def put(self, state, weights, biases, qvalues):
         '''Stores STATE in the QTable cache such that it's
-        weights=WEIGHTS, biases=BIASES, qvalues=QVALUES and 
-        age=0. If STATE is not already in the table, this 
-        function evicts a cache entry if the cache is full 
-        and writes STATE and it's accompanying values to the 
-        cache.
+        weights=WEIGHTS, biases=BIASES and qvalues=QVALUES,
+        marking it dirty. If STATE is not already in the table,
+        this function evicts a cache entry according to the
+        cache policy if the cache is full and writes STATE and
+        it's accompanying values to the cache.
 
         Args:
-            state (int): A state hash representing the state
-            to map against.
+            state (dict|int): The state to map against, or its
+            bqa.keys.state_key.
             weights (list): A list of floating point numbers
             representing the weights for each action.
             biases (list): A list of floating point numbers 
@@ -171,18 +713,86 @@ class QTable:
             qvalues (list): A list of floating point numbers 
             representing the qvalues for each action.
         '''
-        state_hash = hash(tuple(state.values()))
-        if state_hash not in self._table:
-            if self.__len__() == self._size:
-                self._evict()
-        self._table[state_hash] = [weights, biases, qvalues, 0]
+        self._cache(state_key(state), weights, biases, qvalues)
+
+
+    def put_many(self, entries):
+        '''Stores every (state, weights, biases, qvalues) tuple in
+        ENTRIES like put. The dirty entries they evict are written
+        in at most one flush once all of them are cached.
+
+        Args:
+            entries (iterable): The (state, weights, biases,
+            qvalues) tuples, states as dicts or state keys.
+        '''
+        held = self._held
+        self._held = True
+        try:
+            for state, weights, biases, qvalues in entries:
+                self._cache(state_key(state), weights, biases, qvalues)
+        finally:
+            self._held = held
+        if not held and self._pending and (len(self._pending) >= self._flush_size or
+                time.monotonic() - self._last_flush >= self._flush_interval):
+            self.flush()
 
 
     def save_table(self):
         '''Saves the agent's qtable to file.'''
+        self.close()
+
+
+    def shards(self):
+        '''Returns the number of database files the table is split
+        across.'''
+        return self._shards
+
+
+    def stats(self):
+        '''Returns the cache hit/miss/eviction counters.
+
+        Returns:
+            (dict): A dictionary with the cache size, capacity,
+            hits, misses, evictions and hit ratio, the number of
+            'shards' of a sharded table, and the 'writer' counters
+            of the Flushers with async writes, summed over the
+            shards.
+        '''
+        stats = self._table.stats()
+        if self._shards > 1:
+            stats['shards'] = self._shards
+        if self._flushers:
+            writer = dict()
+            for flusher in self._flushers:
+                for name, value in flusher.stats().items():
+                    writer[name] = max(writer.get(name, 0), value) if name == 'max_depth' else writer.get(name, 0) + value
+            stats['writer'] = writer
+        return stats
+
+
+    def read_meta(self, name):
+        '''Returns the value stored under NAME by sync, or None.'''
+        for flusher in self._flushers:
+            flusher.drain()
+        try:
+            row = self._db.execute('select value from meta where name=?', (name,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return None if row is None else row[0]
+
+
+    def sync(self, meta=None):
+        '''Writes every dirty cached entry along with the
+        pending evictions to the database in a single
+        transaction, one per shard of a sharded table. The
+        connection is left open.
+
+        Args:
+            meta (dict): Names and string values stored in the
+            meta table in the same transaction, see flush.
+        '''
         for key, value in self._table.items():
-            state_hash = key
-            weights, biases, qvalues = value[0], value[1], value[2]
-            self._write_entry(state_hash, weights, biases, qvalues)
-        if self._connected:
-            self._db.close()
+            if value[3]:
+                self._pending[key] = _frozen(value)
+                value[3] = False
+        self.flush(meta)
@@ -0,0 +1,126 @@
+'''Experience replay for the agent's Q-table updates.
+
+Instead of updating the table after every transition, an agent in
+replay mode records each transition with the risk, expected payout
+and reward it computed at the time, into a fixed capacity ring
+buffer of numpy structured arrays. Every few rounds a mini-batch is
+sampled from the buffer, the Q-learning update of bqa.player.Agent
+is applied to the whole batch with array operations, and the
+updated entries are written back with one QTable.put_many.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# entries hold at most three actions
+ACTIONS = 3
+TRANSITION_FIELDS = [
+    ('state', '<i8'),
+    ('successor', '<i8'),
+    ('action', 'u1'),
+    ('risk', '<f8'),
+    ('payout', '<f8'),
+    ('reward', '<f8')
+]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('experience replay requires numpy, install bqa[batch]')
+
+
+def _pad(values):
+    if len(values) == ACTIONS:
+        return values
+    return list(values) + [0.0] * (ACTIONS - len(values))
+
+
+class ReplayBuffer:
+
+    def __init__(self, capacity):
+        '''Returns a ring buffer that keeps the last CAPACITY
+        transitions.
+
+        Args:
+            capacity (int): The max number of transitions kept.
+
+        Returns:
+            (ReplayBuffer): A ReplayBuffer instance.
+        '''
+        _require_numpy()
+        if capacity < 1:
+            raise ValueError('replay capacity must be at least 1')
+        self.capacity = capacity
+        self.transitions = np.zeros(capacity, dtype=TRANSITION_FIELDS)
+        # the total number of transitions ever appended
+        self.appended = 0
+
+
+    def __len__(self):
+        return min(self.appended, self.capacity)
+
+
+    def append(self, state, successor, action, risk, payout, reward):
+        '''Records the transition from the state keyed STATE to the
+        state keyed SUCCESSOR under the action at index ACTION.'''
+        self.transitions[self.appended % self.capacity] = (state, successor, action, risk, payout, reward)
+        self.appended += 1
+
+
+    def sample(self, n, seed):
+        '''Returns N transitions drawn uniformly, with replacement,
+        by a numpy generator seeded with SEED.'''
+        rng = np.random.default_rng(seed)
+        return self.transitions[rng.integers(0, len(self), size=n)]
+
+
+def update(table, batch, alpha, beta, learning_rate, discount_factor):
+    '''Applies the agent's Q-learning update to every transition in
+    BATCH at once. Every update reads the entries as they were
+    before the batch, so when a batch holds several transitions of
+    the same state and action their results are averaged.
+
+    Args:
+        table (object): A Q-table addressable by state key with
+        get_many and put_many methods, e.g. a bqa.qtable.QTable.
+        batch (numpy.ndarray): Transitions of a ReplayBuffer.
+        alpha (float): The weight blend of bqa.player.Agent.
+        beta (float): The bias blend.
+        learning_rate (float): The Q-learning rate.
+        discount_factor (float): The Q-learning discount factor.
+
+    Returns:
+        (int): The number of entries written.
+    '''
+    _require_numpy()
+    if len(batch) == 0:
+        return 0
+    n = len(batch)
+    keys, inverse = np.unique(np.concatenate([batch['state'], batch['successor']]), return_inverse=True)
+    prior, succ = inverse[:n], inverse[n:]
+    entries = table.get_many(keys.tolist())
+    sizes = [len(entry[2]) for entry in entries]
+    weights = np.array([_pad(entry[0]) for entry in entries], dtype=np.float64)
+    biases = np.array([_pad(entry[1]) for entry in entries], dtype=np.float64)
+    qvalues = np.array([_pad(entry[2]) for entry in entries], dtype=np.float64)
+    action = batch['action'].astype(np.int64)
+    new_weights = (1 - alpha) * weights[prior, action] + alpha * batch['risk']
+    new_biases = (1 - beta) * biases[prior, action] + beta * batch['payout']
+    prior_qvalues = qvalues[prior, action]
+    td = batch['reward'] + discount_factor * (qvalues[succ, action] - prior_qvalues)
+    new_qvalues = new_weights * (prior_qvalues + learning_rate * td) + new_biases
+    # average the updates of the same state and action
+    slots, slot_inverse, counts = np.unique(prior * ACTIONS + action, return_inverse=True, return_counts=True)
+    rows, columns = slots // ACTIONS, slots % ACTIONS
+    weights[rows, columns] = np.bincount(slot_inverse, weights=new_weights) / counts
+    biases[rows, columns] = np.bincount(slot_inverse, weights=new_biases) / counts
+    qvalues[rows, columns] = np.bincount(slot_inverse, weights=new_qvalues) / counts
+    touched = np.unique(rows).tolist()
+    table.put_many(
+        (int(keys[row]), w[:sizes[row]], b[:sizes[row]], q[:sizes[row]])
+        for row, w, b, q in zip(touched, weights[touched].tolist(), biases[touched].tolist(), qvalues[touched].tolist())
+    )
+    return len(touched)
@@ -0,0 +1,317 @@
+'''An asyncio server hosting many blackjack tables at once.
+
+Every table is a task that deals rounds between its own dealer and
+shoe and the agents seated at it. All agents share one Q-table, so
+what one seat learns is used by every other seat, and the table's
+write-behind buffer batches the writes of all of them. The tables
+run on a single event loop and yield after every decision, so no
+locking is needed around the agents or the Q-table.
+
+The server answers on a local socket, one command per line:
+'metrics' returns the throughput and per-table round latencies as
+a JSON line and 'stop' ends every table after its current round.
+'''
+
+import asyncio
+import json
+import os
+import random
+import time
+
+from bqa.cards import Deck, Shoe
+from bqa.dealer import STAND as DEALER_STAND
+from bqa.game import hand_value, in_round_state, settle
+from bqa.player import Account, Agent, Dealer
+from bqa.profiling import Timer
+from bqa.qtable import QTable
+
+
+COMMANDS = ('metrics', 'stop')
+
+
+class Table:
+
+    def __init__(self, index, dealer, agents, true_count=False):
+        '''Returns a table where DEALER deals to AGENTS.
+
+        Args:
+            index (int): The table number.
+            dealer (bqa.player.Dealer): The table's dealer.
+            agents (list): The bqa.player.Agent of every seat.
+            true_count (bool): Add the shoe's Hi-Lo true count to
+            the agents' IN_ROUND states.
+        '''
+        self.index = index
+        self.dealer = dealer
+        self.agents = agents
+        self.true_count = true_count
+        self.rounds = 0
+        self.hands = 0
+        self.latency = Timer('table{}'.format(index))
+        for agent in agents:
+            agent.observe_count(dealer.deck.count)
+
+
+    def seated(self):
+        '''Returns the agents that still have chips.'''
+        return [agent for agent in self.agents if not agent.account.bankrupt()]
+
+
+    async def play_round(self):
+        '''Plays one round with every seated agent. The dealer
+        deals every seat a card, then itself, twice, and the seats
+        act in order before the dealer plays out its hand.'''
+        dealer = self.dealer
+        agents = self.seated()
+        discard = list(dealer.hand)
+        dealer.hand.clear()
+        for agent in self.agents:
+            discard.extend(agent.hand)
+            agent.hand.clear()
+        dealer.deck.reshuffle(discard)
+        wagers = []
+        for agent in agents:
+            state = {'game_stage': Agent.PRE_ROUND}
+            wager = agent.determine_wager(state)
+            agent.account.withdraw(wager)
+            state['wager'] = wager
+            agent.update_parameters(state)
+            wagers.append(wager)
+        for i in range(2):
+            for agent in agents:
+                agent.hand.append(dealer.deck.draw())
+            # the dealer's second card is dealt face down
+            dealer.hand.append(dealer.deck.draw(seen=(i == 0)))
+        stood = False
+        for agent in agents:
+            while hand_value(agent.hand) <= 21:
+                state = in_round_state(dealer, agent, true_count=self.true_count)
+                agent.update_parameters(state)
+                action = agent.determine_action(state)
+                # let the other tables play between decisions
+                await asyncio.sleep(0)
+                if action == Agent.STAND:
+                    stood = True
+                    break
+                agent.hand.append(dealer.deck.draw())
+        dealer.deck.count.see(dealer.hand[1])
+        # the dealer only draws when a seat stood
+        if stood:
+            while hand_value(dealer.hand) < DEALER_STAND:
+                dealer.hand.append(dealer.deck.draw())
+        for agent, wager in zip(agents, wagers):
+            outcome, chip_delta = settle(dealer, agent, wager)
+            agent.update_parameters({
+                'game_stage': Agent.POST_ROUND,
+                'outcome': outcome,
+                'chip_delta': chip_delta
+            })
+        self.rounds += 1
+        self.hands += len(agents)
+
+
+    def metrics(self):
+        '''Returns the table's round counters and latencies.'''
+        latency = self.latency
+        return {
+            'table': self.index,
+            'seats': len(self.agents),
+            'seated': len(self.seated()),
+            'rounds': self.rounds,
+            'hands': self.hands,
+            'dealer_chips': self.dealer.account.balance(),
+            'latency_ms': {
+                'mean': latency.mean() / 1e6,
+                'p50': latency.percentile(50) / 1e6,
+                'p99': latency.percentile(99) / 1e6,
+                'max': latency.max / 1e6
+            }
+        }
+
+
+    def results(self):
+        '''Returns the wins, draws, losses and chip delta of every
+        seat.'''
+        return [{
+            'wins': agent.total_wins(),
+            'draws': agent.total_draws(),
+            'losses': agent.total_losses(),
+            'chip_delta': agent.get_chip_delta(),
+            'agent_chips': agent.account.balance()
+        } for agent in self.agents]
+
+
+class TableServer:
+
+    def __init__(self, tables=4, seats=2, rounds=None, seed=0, db='table.db', table_args=None, table=None, agent_args=None, agent_chips=500, dealer_chips=2000, decks=None, penetration=0.75, true_count=False, socket_path=None, port=None, round_delay=0):
+        '''Returns a server hosting TABLES tables of SEATS agents
+        each.
+
+        Args:
+            tables (int): The number of tables.
+            seats (int): The number of agents at every table.
+            rounds (int): Stop every table after ROUNDS rounds.
+            Tables play until stopped or bankrupt when None.
+            seed (int): The seed of the random module.
+            db (str): The sqlite database of the shared Q-table.
+            table_args (dict): Keyword arguments of the shared
+            bqa.qtable.QTable.
+            table (object): A Q-table shared by every agent, used
+            instead of DB and TABLE_ARGS.
+            agent_args (dict): Extra keyword arguments for every
+            Agent, such as its learning rates or policy.
+            agent_chips (int): Every agent's starting chips.
+            dealer_chips (int): Every dealer's starting chips.
+            decks (int): Deal from shoes of DECKS decks, reshuffled
+            at PENETRATION, instead of a fresh deck every round.
+            penetration (float): See bqa.cards.Shoe.
+            true_count (bool): Add the shoe's Hi-Lo true count to
+            the agents' IN_ROUND states.
+            socket_path (str): Serve the commands on this unix
+            socket.
+            port (int): Serve the commands on this localhost TCP
+            port.
+            round_delay (float): Seconds every table waits between
+            rounds, to pace interactive clients.
+
+        Returns:
+            (TableServer): A TableServer instance.
+        '''
+        if tables < 1 or seats < 1:
+            raise ValueError('a server needs at least one table and seat')
+        self.rounds = rounds
+        self.seed = seed
+        self.socket_path = socket_path
+        self.port = port
+        self.round_delay = round_delay
+        if table is None:
+            table = QTable(db=db, **(table_args or {}))
+        self.table = table
+        # seed before the shoes shuffle so a seeded server deals
+        #  the same cards
+        random.seed(seed)
+        self.tables = []
+        for i in range(tables):
+            deck = Shoe(decks=decks, penetration=penetration) if decks else Deck()
+            dealer = Dealer(deck=deck, account=Account(chips=dealer_chips))
+            agents = [
+                Agent(table=table, account=Account(chips=agent_chips), **(agent_args or {}))
+                for _ in range(seats)
+            ]
+            self.tables.append(Table(i, dealer, agents, true_count=true_count))
+        self._stopping = False
+        self._started = None
+
+
+    async def _run_table(self, table):
+        clock = time.perf_counter_ns
+        while not self._stopping and (self.rounds is None or table.rounds < self.rounds):
+            if table.dealer.account.bankrupt() or not table.seated():
+                break
+            start = clock()
+            await table.play_round()
+            table.latency.add(clock() - start)
+            await asyncio.sleep(self.round_delay)
+
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip().lower()
+                if command == 'metrics':
+                    reply = self.metrics()
+                elif command == 'stop':
+                    self.stop()
+                    reply = {'stopping': True}
+                else:
+                    reply = {'error': 'unknown command: {}'.format(command), 'commands': list(COMMANDS)}
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+    async def _listen(self):
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            return await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        if self.port is not None:
+            return await asyncio.start_server(self._handle, host='127.0.0.1', port=self.port)
+        return None
+
+
+    def metrics(self):
+        '''Returns the server's throughput, the metrics of every
+        table and the counters of the shared Q-table.'''
+        elapsed = time.perf_counter() - self._started if self._started else 0
+        hands = sum(table.hands for table in self.tables)
+        return {
+            'uptime': elapsed,
+            'rounds': sum(table.rounds for table in self.tables),
+            'hands': hands,
+            'hands_per_sec': hands / elapsed if elapsed else 0,
+            'tables': [table.metrics() for table in self.tables],
+            'qtable': self.table.stats()
+        }
+
+
+    def results(self):
+        '''Returns the results of every seat by table.'''
+        return [table.results() for table in self.tables]
+
+
+    async def serve(self):
+        '''Plays every table until it finishes its rounds, runs out
+        of chips or the server is stopped, then saves the shared
+        Q-table.
+
+        Returns:
+            (dict): The final metrics with the 'results' of every
+            seat.
+        '''
+        self._started = time.perf_counter()
+        listener = await self._listen()
+        try:
+            await asyncio.gather(*(self._run_table(table) for table in self.tables))
+        finally:
+            if listener is not None:
+                listener.close()
+                await listener.wait_closed()
+                if self.socket_path is not None and os.path.exists(self.socket_path):
+                    os.remove(self.socket_path)
+            self.table.save_table()
+        metrics = self.metrics()
+        metrics['results'] = self.results()
+        return metrics
+
+
+    def stop(self):
+        '''Stops every table once its current round is over.'''
+        self._stopping = True
+
+
+async def query(command='metrics', socket_path=None, port=None):
+    '''Sends COMMAND to a TableServer and returns its JSON reply.
+
+    Args:
+        command (str): One of COMMANDS.
+        socket_path (str): The server's unix socket.
+        port (int): The server's localhost TCP port.
+
+    Returns:
+        (dict): The server's reply.
+    '''
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(command.encode() + b'\n')
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
@@ -0,0 +1,381 @@
+'''A Q-table many agents can learn into at once.
+
+A QTable belongs to one agent: its cache is an unsynchronized
+dict and it writes through a single sqlite connection. A
+ConcurrentQTable splits the key space into stripes by a stable
+hash of the state key. Every stripe has its own lock, cache and
+write-behind buffer, so agents working on states of different
+stripes never wait for each other, and every thread reads and
+writes the database on a connection of its own.
+
+update applies a read-modify-write to one entry while holding its
+stripe's lock. bqa.player.Agent blends an entry's weights, biases
+and qvalues through it when its table provides update, so no
+agent's blend overwrites another's.
+'''
+
+import sqlite3
+import threading
+import time
+
+from bqa.cache import make_cache
+from bqa.cards import Deck, Shoe
+from bqa.game import play
+from bqa.keys import key_bucket, state_key
+from bqa.parallel import merge_results, split_rounds, worker_seed
+from bqa.player import Account
+from bqa.qtable import JOURNAL_MODES, SYNCHRONOUS_MODES, QTable, _new_entry, _write_rows, unpack_entry
+
+
+class _Stripe:
+
+    def __init__(self, policy, size):
+        self.lock = threading.Lock()
+        # maps state hashes to weights/biases/qvalues/dirty
+        self.cache = make_cache(policy, size)
+        # evicted dirty entries waiting to be written
+        self.pending = dict()
+        self.acquisitions = 0
+        # the number of acquisitions that found the lock taken
+        self.contended = 0
+        self.wait_ns = 0
+        self.flushes = 0
+
+
+class ConcurrentQTable:
+
+    def __init__(self, db='table.db', size=4096, stripes=16, policy='lru', flush_size=256, journal_mode='wal', synchronous='normal', timeout=30.0):
+        '''Returns a Q-table that any number of threads can read
+        and update at once.
+
+        Args:
+            db (str): The sqlite database file. Every thread opens
+            its own connection to it, so it cannot be ':memory:'.
+            size (int): The max number of entries cached, split
+            evenly between the stripes.
+            stripes (int): The number of independently locked
+            slices of the key space.
+            policy (str): The eviction policy of every stripe's
+            cache, see bqa.cache.make_cache.
+            flush_size (int): The number of evicted dirty entries a
+            stripe buffers before writing them in one transaction.
+            journal_mode (str): The sqlite journal mode. 'wal' lets
+            readers proceed while another thread writes.
+            synchronous (str): The sqlite synchronous mode.
+            timeout (float): Seconds a connection waits for another
+            thread's write transaction.
+
+        Returns:
+            (ConcurrentQTable): A ConcurrentQTable instance.
+        '''
+        if db == ':memory:':
+            raise ValueError('a shared qtable needs a database file')
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError('unknown journal mode: {}'.format(journal_mode))
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError('unknown synchronous mode: {}'.format(synchronous))
+        if stripes < 1:
+            raise ValueError('a shared qtable needs at least one stripe')
+        # creates or migrates the schema
+        QTable(db=db, size=1, journal_mode=journal_mode, synchronous=synchronous).close()
+        self._db = db
+        self._journal_mode = journal_mode
+        self._synchronous = synchronous
+        self._timeout = timeout
+        self._flush_size = flush_size
+        self._stripes = [_Stripe(policy, max(1, size // stripes)) for _ in range(stripes)]
+        self._local = threading.local()
+        # every thread's connection, closed by close
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._connected = True
+        self._started = time.monotonic()
+
+
+    def __len__(self):
+        return sum(len(stripe.cache) for stripe in self._stripes)
+
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self._connected:
+                raise ValueError('the shared qtable is closed')
+            # close may run on another thread than the owner
+            conn = sqlite3.connect(self._db, timeout=self._timeout, check_same_thread=False)
+            conn.execute('pragma journal_mode={}'.format(self._journal_mode))
+            conn.execute('pragma synchronous={}'.format(self._synchronous))
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+
+    def _acquire(self, key):
+        # returns the locked stripe of KEY
+        stripe = self._stripes[key_bucket(key, len(self._stripes))]
+        lock = stripe.lock
+        if not lock.acquire(blocking=False):
+            start = time.perf_counter_ns()
+            lock.acquire()
+            stripe.contended += 1
+            stripe.wait_ns += time.perf_counter_ns() - start
+        stripe.acquisitions += 1
+        return stripe
+
+
+    def _cache(self, stripe, state_hash, entry):
+        evicted = stripe.cache.put(state_hash, entry)
+        if evicted is None or not evicted[1][3]:
+            return
+        value = evicted[1]
+        stripe.pending[evicted[0]] = (value[0], value[1], value[2])
+        if len(stripe.pending) >= self._flush_size:
+            self._flush(stripe)
+
+
+    def _entry(self, stripe, state_hash):
+        # the cached entry of STATE_HASH, read or created on a miss
+        entry = stripe.cache.get(state_hash)
+        if entry is not None:
+            return entry
+        row = stripe.pending.get(state_hash)
+        if row is None:
+            row = self._read_entry(state_hash)
+        if row is None:
+            entry = list(_new_entry(state_hash)) + [True]
+        else:
+            entry = [row[0], row[1], row[2], False]
+        self._cache(stripe, state_hash, entry)
+        return entry
+
+
+    def _flush(self, stripe):
+        if stripe.pending:
+            _write_rows(self._connection(), stripe.pending.items())
+            stripe.pending.clear()
+            stripe.flushes += 1
+
+
+    def _read_entry(self, state_hash):
+        row = self._connection().execute('select entry from qtable where state_hash=?', (state_hash,)).fetchone()
+        return None if row is None else unpack_entry(row[0])
+
+
+    def contains(self, state):
+        '''Returns True if STATE is cached, waiting to be flushed
+        or stored in the database.'''
+        key = state_key(state)
+        stripe = self._acquire(key)
+        try:
+            if key in stripe.cache or key in stripe.pending:
+                return True
+        finally:
+            stripe.lock.release()
+        return self._read_entry(key) is not None
+
+
+    def get(self, state):
+        '''Returns the [weights, biases, qvalues] of STATE, read
+        from the database or initialized on a miss. Updates never
+        change the returned lists in place, so they stay a
+        consistent snapshot.'''
+        key = state_key(state)
+        stripe = self._acquire(key)
+        try:
+            return self._entry(stripe, key)[:3]
+        finally:
+            stripe.lock.release()
+
+
+    def get_many(self, states):
+        '''Returns the entries of every state in STATES like get.'''
+        return [self.get(state) for state in states]
+
+
+    def put(self, state, weights, biases, qvalues):
+        '''Stores STATE with WEIGHTS, BIASES and QVALUES, marking
+        it dirty. Concurrent puts of one state keep the last one,
+        use update to build on the stored values instead.'''
+        key = state_key(state)
+        stripe = self._acquire(key)
+        try:
+            self._cache(stripe, key, [weights, biases, qvalues, True])
+        finally:
+            stripe.lock.release()
+
+
+    def put_many(self, entries):
+        '''Stores every (state, weights, biases, qvalues) tuple in
+        ENTRIES like put.'''
+        for state, weights, biases, qvalues in entries:
+            self.put(state, weights, biases, qvalues)
+
+
+    def update(self, state, fn):
+        '''Replaces the entry of STATE with FN applied to it, while
+        no other thread can read or write the entry.
+
+        Args:
+            state (dict|int): The state, or its bqa.keys.state_key.
+            fn (callable): Takes copies of the weights, biases and
+            qvalues lists and returns the new (weights, biases,
+            qvalues).
+
+        Returns:
+            (list): The new [weights, biases, qvalues].
+        '''
+        key = state_key(state)
+        stripe = self._acquire(key)
+        try:
+            entry = self._entry(stripe, key)
+            weights, biases, qvalues = fn(list(entry[0]), list(entry[1]), list(entry[2]))
+            self._cache(stripe, key, [weights, biases, qvalues, True])
+            return [weights, biases, qvalues]
+        finally:
+            stripe.lock.release()
+
+
+    def flush(self):
+        '''Writes the evicted entries of every stripe.'''
+        for stripe in self._stripes:
+            with stripe.lock:
+                self._flush(stripe)
+
+
+    def sync(self):
+        '''Writes every dirty cached entry along with the pending
+        evictions, one transaction per stripe.'''
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key, value in stripe.cache.items():
+                    if value[3]:
+                        stripe.pending[key] = (value[0], value[1], value[2])
+                        value[3] = False
+                self._flush(stripe)
+
+
+    def save_table(self):
+        '''Writes every dirty entry. Unlike QTable.save_table the
+        table stays open, since other agents may still use it.'''
+        self.sync()
+
+
+    def close(self):
+        '''Writes every dirty entry and closes the connection of
+        every thread.'''
+        if not self._connected:
+            return
+        self.sync()
+        self._connected = False
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+    def stats(self):
+        '''Returns the cache counters summed over every stripe, and
+        the lock and throughput counters.
+
+        Returns:
+            (dict): The cache size, capacity, hits, misses,
+            evictions and hit ratio, the 'stripes', the
+            'operations' on the table and 'ops_per_sec' since it
+            was created, the operations that found their stripe
+            locked and the 'contention' ratio, the 'lock_wait_ms'
+            they spent waiting, the 'flushes' and the number of
+            'connections'.
+        '''
+        stats = {'size': 0, 'capacity': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        operations = contended = wait_ns = flushes = 0
+        for stripe in self._stripes:
+            for name, value in stripe.cache.stats().items():
+                if name in stats:
+                    stats[name] += value
+            operations += stripe.acquisitions
+            contended += stripe.contended
+            wait_ns += stripe.wait_ns
+            flushes += stripe.flushes
+        lookups = stats['hits'] + stats['misses']
+        elapsed = time.monotonic() - self._started
+        stats.update({
+            'hit_ratio': stats['hits'] / lookups if lookups else 0,
+            'stripes': len(self._stripes),
+            'operations': operations,
+            'ops_per_sec': operations / elapsed if elapsed else 0,
+            'contended': contended,
+            'contention': contended / operations if operations else 0,
+            'lock_wait_ms': wait_ns / 1e6,
+            'flushes': flushes,
+            'connections': len(self._connections)
+        })
+        return stats
+
+
+def _play_thread(table, game_args, dealer_args, agent_args, results, index):
+    results[index] = play(
+        game_args=game_args,
+        dealer_args=dealer_args,
+        agent_args=dict(agent_args, table=table)
+    )
+
+
+def play_threads(threads, game_args, agent_args, table, agent_chips=500, dealer_chips=2000, decks=None, penetration=0.75):
+    '''Splits the rounds of a game across THREADS agents that all
+    learn into TABLE at once. Every thread plays against its own
+    dealer with its own seed derived from the game seed. The
+    threads share the random module, so a run is not repeatable.
+
+    Args:
+        threads (int): The number of threads.
+        game_args (dict): The 'seed' and total 'rounds'.
+        agent_args (dict): Keyword arguments for the Agent, without
+        the account and table.
+        table (ConcurrentQTable): The table every agent learns
+        into.
+        agent_chips (int): Every agent's starting chips.
+        dealer_chips (int): Every dealer's starting chips.
+        decks (int): Deal every thread from its own shoe of DECKS
+        decks, reshuffled at PENETRATION, instead of a fresh deck
+        every round.
+        penetration (float): See bqa.cards.Shoe.
+
+    Returns:
+        (dict): The merged results of every thread, the seconds
+        they took in 'elapsed', 'rounds_per_sec' and the table's
+        'qtable' stats.
+    '''
+    results = [None] * threads
+    workers = []
+    for thread, rounds in enumerate(split_rounds(game_args['rounds'], threads)):
+        workers.append(threading.Thread(
+            target=_play_thread,
+            name='agent-{}'.format(thread),
+            args=(
+                table,
+                dict(game_args, seed=worker_seed(game_args['seed'], thread), rounds=rounds),
+                {
+                    'deck': Shoe(decks=decks, penetration=penetration) if decks else Deck(),
+                    'account': Account(chips=dealer_chips)
+                },
+                dict(agent_args, account=Account(chips=agent_chips)),
+                results,
+                thread
+            )
+        ))
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    if None in results:
+        raise RuntimeError('an agent thread failed')
+    merged = merge_results(results)
+    merged['threads'] = merged.pop('workers')
+    merged['elapsed'] = elapsed
+    merged['rounds_per_sec'] = merged['rounds'] / elapsed if elapsed else 0
+    merged['qtable'] = table.stats()
+    return merged
@@ -0,0 +1,221 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from random import random
+
+from bqa.keys import PRE_ROUND, key_stage, state_key
+from bqa.qtable import read_rows, unpack_entry
+
+
+# A snapshot is laid out as
+#   header:  magic, version, byte order, entry count
+#   index:   the sorted int64 state keys
+#   actions: the uint8 action count of each entry, padded to 8
+#   values:  9 float64s per entry, the weights, biases and
+#            qvalues of up to 3 actions
+_MAGIC = b'BQAS'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHQ')
+_BYTE_ORDERS = {'little': 0, 'big': 1}
+WIDTH = 9
+
+
+def _pad(n):
+    return (n + 7) // 8 * 8
+
+
+def write_snapshot(entries, path):
+    '''Writes ENTRIES to a snapshot file and publishes it by
+    atomically renaming it over PATH. Readers that already
+    mapped the previous snapshot keep reading it until they
+    reload.
+
+    Args:
+        entries (iterable): (key, weights, biases, qvalues)
+        tuples, keyed by bqa.keys.state_key.
+        path (str): The snapshot file to publish.
+
+    Returns:
+        (int): The number of entries written.
+    '''
+    entries = sorted(entries, key=lambda entry: entry[0])
+    count = len(entries)
+    keys = array('q', [entry[0] for entry in entries])
+    actions = bytearray(_pad(count))
+    values = array('d', bytes(8 * WIDTH * count))
+    for i, (_, weights, biases, qvalues) in enumerate(entries):
+        n = len(qvalues)
+        actions[i] = n
+        base = i * WIDTH
+        values[base:base + 3 * n] = array('d', [*weights, *biases, *qvalues])
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, _BYTE_ORDERS[sys.byteorder], count))
+        keys.tofile(f)
+        f.write(actions)
+        values.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def snapshot_db(db, path, shards=1):
+    '''Writes every row of the sqlite Q-table DB to a snapshot.
+    Dirty entries still cached by a live QTable must be synced
+    to DB first.
+
+    Args:
+        db (str): The sqlite database to read.
+        path (str): The snapshot file to publish.
+        shards (int): The number of shards DB is split across.
+
+    Returns:
+        (int): The number of entries written.
+    '''
+    rows = read_rows(db, shards)
+    return write_snapshot(
+        ((key, *unpack_entry(blob)) for key, blob in rows),
+        path
+    )
+
+
+class SnapshotTable:
+
+    def __init__(self, path):
+        '''Returns a read-only Q-table backed by a memory mapped
+        snapshot. Any number of processes can map the same
+        snapshot and share its pages. Entries missing from the
+        snapshot and entries passed to put are kept in a private
+        in-memory overlay that is never written back, so the
+        table can be handed to an Agent for policy evaluation.
+
+        Args:
+            path (str): The snapshot file to map.
+
+        Returns:
+            (SnapshotTable): A SnapshotTable instance.
+        '''
+        self._path = path
+        self._overlay = dict()
+        self._mmap = None
+        self._map()
+
+
+    def __len__(self):
+        return self._count
+
+
+    def _map(self):
+        with open(self._path, 'rb') as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byte_order, count = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError('{} is not a q-table snapshot'.format(self._path))
+        if byte_order != _BYTE_ORDERS[sys.byteorder]:
+            self.close()
+            raise ValueError('{} was written on a host with a different byte order'.format(self._path))
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._keys = view[offset:offset + 8 * count].cast('q')
+        offset += 8 * count
+        self._actions = view[offset:offset + count]
+        offset += _pad(count)
+        self._values = view[offset:offset + 8 * WIDTH * count].cast('d')
+        self._count = count
+
+
+    def close(self):
+        '''Unmaps the snapshot.'''
+        if self._mmap is None:
+            return
+        for name in ('_keys', '_actions', '_values'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        self._mmap.close()
+        self._mmap = None
+
+
+    def contains(self, state):
+        key = state_key(state)
+        i = bisect_left(self._keys, key)
+        return (i < self._count and self._keys[i] == key) or key in self._overlay
+
+
+    def get(self, state):
+        key = state_key(state)
+        entry = self._overlay.get(key)
+        if entry is not None:
+            return entry
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < self._count and keys[i] == key:
+            n = self._actions[i]
+            base = i * WIDTH
+            values = self._values
+            return [
+                list(values[base:base + n]),
+                list(values[base + n:base + 2 * n]),
+                list(values[base + 2 * n:base + 3 * n])
+            ]
+        if key_stage(key) == PRE_ROUND:
+            entry = [[random(), random()], [random(), random()], [1, 0]]
+        else:
+            entry = [[random(), random(), random()], [random(), random(), random()], [0, 0, 0]]
+        self._overlay[key] = entry
+        return entry
+
+
+    def get_many(self, states):
+        '''Returns the entries of every state in STATES like get.'''
+        return [self.get(state) for state in states]
+
+
+    def put(self, state, weights, biases, qvalues):
+        '''Stores WEIGHTS, BIASES and QVALUES for STATE in the
+        private overlay. The snapshot itself is never modified.
+        '''
+        self._overlay[state_key(state)] = [weights, biases, qvalues]
+
+
+    def put_many(self, entries):
+        '''Stores every (state, weights, biases, qvalues) tuple in
+        ENTRIES in the private overlay.'''
+        for state, weights, biases, qvalues in entries:
+            self._overlay[state_key(state)] = [weights, biases, qvalues]
+
+
+    def reload(self):
+        '''Maps the latest published snapshot if the writer
+        replaced the file since it was mapped.
+
+        Returns:
+            (bool): True if a new snapshot was mapped.
+        '''
+        if os.stat(self._path).st_ino == self._inode:
+            return False
+        self.close()
+        self._map()
+        return True
+
+
+    def save_table(self):
+        '''Unmaps the snapshot, the overlay is discarded.'''
+        self.close()
+
+
+    def stats(self):
+        '''Returns the number of snapshot and overlay entries.
+
+        Returns:
+            (dict): A dictionary with the snapshot size and the
+            overlay size.
+        '''
+        return {'size': self._count, 'overlay': len(self._overlay)}
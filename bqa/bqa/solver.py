@@ -0,0 +1,398 @@
+import csv
+import sqlite3
+from itertools import combinations_with_replacement
+from math import factorial
+
+from bqa.batch import PAYOUTS
+from bqa.cards import CARDS, card_code
+import bqa.dealer as dealer
+from bqa.hands import values_total
+from bqa.keys import IN_ROUND, decode_key
+
+
+STAND = 0
+HIT = 1
+ACTIONS = ('STAND', 'HIT')
+# the faces of the ten-valued cards, which state keys tell apart
+TEN_FACES = (10, 11, 12, 13)
+# P(value) of the next card of an infinite shoe, used when a hand
+#  runs past the end of the shoe
+_INFINITE = dealer._INFINITE
+
+
+def _card(face, suit='H'):
+    return CARDS[card_code(suit, face)]
+
+
+def _fresh_counts(decks):
+    return (4 * decks,) * 9 + (16 * decks,)
+
+
+def _remove(counts, values):
+    counts = list(counts)
+    for value in values:
+        if not counts[value - 1]:
+            return None
+        counts[value - 1] -= 1
+    return tuple(counts)
+
+
+def _falling(n, k):
+    # the number of ordered draws of K of N cards
+    ways = 1
+    for i in range(k):
+        ways *= n - i
+    return ways
+
+
+def _stand_value(total, dist):
+    win, draw, loss = dealer.stand_outcomes(total, dist)
+    return win * PAYOUTS['win'] + draw * PAYOUTS['draw'] + loss * PAYOUTS['loss']
+
+
+class Solver:
+
+    def __init__(self, db=None, decks=1, flush_size=4096):
+        '''Returns a solver for the expected value of standing and
+        hitting in every (agent hand, dealer up-card, unseen cards)
+        state under the rules of bqa.game.play. The solver is a
+        dynamic program over the agent's hand composition: the
+        values of every state are memoized and, when DB is given,
+        cached in a sqlite database shared between runs.
+
+        Args:
+            db (str): The sqlite database of cached solutions.
+            decks (int): The number of decks of the shoe assumed
+            when a state comes without the unseen cards.
+            flush_size (int): The number of new solutions kept in
+            memory before they are written to DB.
+
+        Returns:
+            (Solver): A Solver instance.
+        '''
+        self.decks = decks
+        self._memo = dict()
+        self._pending = []
+        self._flush_size = flush_size
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        if db is not None:
+            self._conn = sqlite3.connect(db)
+            self._conn.execute('create table if not exists solutions (state text primary key, stand real, hit real)')
+            self._conn.commit()
+
+
+    def _load(self, key):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            'select stand, hit from solutions where state = ?',
+            (','.join(map(str, key)),)
+        ).fetchone()
+        return row
+
+
+    def _store(self, key, values):
+        if self._conn is None:
+            return
+        self._pending.append((','.join(map(str, key)),) + values)
+        if len(self._pending) >= self._flush_size:
+            self.flush()
+
+
+    def _values(self, hard, ace, up, counts):
+        # the stand and hit values of an agent holding HARD (plus
+        #  10 with a usable ACE) against UP with COUNTS unseen
+        key = (hard, int(ace), up) + counts
+        values = self._memo.get(key)
+        if values is not None:
+            self.hits += 1
+            return values
+        values = self._load(key)
+        if values is not None:
+            self.hits += 1
+            self._memo[key] = values
+            return values
+        self.misses += 1
+        best = hard + 10 if ace and hard + 10 <= 21 else hard
+        stand = _stand_value(best, dealer.distribution(up, counts))
+        remaining = sum(counts)
+        hit = 0.0
+        for value in range(1, 11):
+            n = counts[value - 1]
+            if remaining:
+                if not n:
+                    continue
+                p = n / remaining
+                rest = counts[:value - 1] + (n - 1,) + counts[value:]
+            else:
+                p = _INFINITE[value]
+                rest = counts
+            if hard + value > 21:
+                hit += p * PAYOUTS['loss']
+            else:
+                hit += p * max(self._values(hard + value, ace or value == 1, up, rest))
+        values = (stand, hit)
+        self._memo[key] = values
+        self._store(key, values)
+        return values
+
+
+    def close(self):
+        '''Writes the new solutions to the database and closes it.'''
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+    def flush(self):
+        '''Writes the new solutions to the database.'''
+        if self._conn is None or not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany('insert or replace into solutions values (?, ?, ?)', self._pending)
+        self._pending.clear()
+
+
+    def solve(self, state, count=None):
+        '''Solves an IN_ROUND STATE.
+
+        Args:
+            state (dict|int): An IN_ROUND game state or its
+            bqa.keys.state_key.
+            count (bqa.counting.CardCount): The cards the agent
+            has not seen, including the dealer's hole card. By
+            default a fresh shoe of the solver's decks minus the
+            dealer's up-card and the agent's hand.
+
+        Returns:
+            (dict): The expected payout per wager of standing
+            ('stand') and of hitting then playing optimally
+            ('hit'), the best 'action' and its value 'ev'.
+        '''
+        if isinstance(state, int):
+            state = decode_key(state)
+            up_face, faces = state.get('dealer_show'), state.get('agent_hand')
+        elif state['game_stage'] == IN_ROUND:
+            up_face = state['dealer_show'].face
+            faces = [card.face for card in state['agent_hand']]
+        if state['game_stage'] != IN_ROUND:
+            raise ValueError('only IN_ROUND states can be solved')
+        up = min(up_face, 10)
+        hand = [min(face, 10) for face in faces]
+        if count is None:
+            counts = _remove(_fresh_counts(self.decks), [up] + hand)
+            if counts is None:
+                raise ValueError('the state holds more cards than a {} deck shoe'.format(self.decks))
+        else:
+            counts = count if isinstance(count, tuple) else tuple(count.values[1:])
+        hard = sum(hand)
+        if hard > 21:
+            return {'stand': PAYOUTS['loss'], 'hit': PAYOUTS['loss'], 'action': ACTIONS[STAND], 'ev': PAYOUTS['loss']}
+        stand, hit = self._values(hard, 1 in hand, up, counts)
+        action = HIT if hit > stand else STAND
+        return {'stand': stand, 'hit': hit, 'action': ACTIONS[action], 'ev': max(stand, hit)}
+
+
+    def stats(self):
+        '''Returns the memo hits and misses and the number of
+        memoized states.'''
+        return {'hits': self.hits, 'misses': self.misses, 'states': len(self._memo)}
+
+
+def in_round_state(up, faces):
+    '''Returns an IN_ROUND state with the dealer showing a card of
+    face UP and the agent holding cards of FACES. A value of 10
+    stands for a 10, use face_variants for the other faces.'''
+    suits = ('H', 'S', 'D', 'C')
+    return {
+        'game_stage': IN_ROUND,
+        'dealer_show': _card(up, 'H'),
+        'agent_hand': tuple(_card(face, suits[i % 4]) for i, face in enumerate(faces))
+    }
+
+
+def face_variants(up, values, decks=1):
+    '''Yields the faces a dealer up-card of value UP and agent
+    cards of VALUES can show. State keys tell the faces of the
+    ten-valued cards apart, so every 10 is a 10, jack, queen or
+    king.
+
+    Args:
+        up (int): The value of the dealer's up-card.
+        values (tuple): The values of the agent's cards.
+        decks (int): The number of decks of the shoe.
+
+    Yields:
+        (tuple): The up-card face, the agent's faces and the
+        probability of these faces among the deals of the values.
+    '''
+    low = tuple(value for value in values if value != 10)
+    tens = len(values) - len(low)
+    drawn = tens + (up == 10)
+    total = _falling(16 * decks, drawn)
+    for up_face in (TEN_FACES if up == 10 else (up,)):
+        for faces in combinations_with_replacement(TEN_FACES, tens):
+            # the orders of the agent's tens times the draws of
+            #  every face, the up-card included
+            ways = factorial(tens)
+            for face in TEN_FACES:
+                n = faces.count(face)
+                ways = ways // factorial(n) * _falling(4 * decks, n + (up_face == face))
+            if ways:
+                yield up_face, low + faces, ways / total
+
+
+def deals(decks=1):
+    '''Yields every opening deal of a fresh shoe of DECKS decks.
+
+    Yields:
+        (tuple): The dealer's up-card value, the values of the
+        agent's two cards and the probability of the deal.
+    '''
+    fresh = _fresh_counts(decks)
+    total = sum(fresh)
+    for up in range(1, 11):
+        p_up = fresh[up - 1] / total
+        counts = _remove(fresh, [up])
+        pairs = (total - 1) * (total - 2)
+        for a, b in combinations_with_replacement(range(1, 11), 2):
+            if a == b:
+                ways = counts[a - 1] * (counts[a - 1] - 1)
+            else:
+                ways = 2 * counts[a - 1] * counts[b - 1]
+            if ways:
+                yield up, (a, b), p_up * ways / pairs
+
+
+def chart(solver, decks=1):
+    '''Solves every opening deal of a fresh shoe and averages the
+    values of the deals with the same up-card and agent total.
+
+    Args:
+        solver (Solver): The solver.
+        decks (int): The number of decks of the shoe.
+
+    Returns:
+        (list): A (up, total, soft, stand, hit, action) row for
+        each up-card and agent total, sorted.
+    '''
+    sums = dict()
+    for up, hand, p in deals(decks):
+        solution = solver.solve(in_round_state(up, hand), _remove(_fresh_counts(decks), (up,) + hand))
+        total, soft = values_total(hand)
+        row = sums.setdefault((up, total, soft), [0.0, 0.0, 0.0])
+        row[0] += p
+        row[1] += p * solution['stand']
+        row[2] += p * solution['hit']
+    rows = []
+    for (up, total, soft), (p, stand, hit) in sorted(sums.items()):
+        stand, hit = stand / p, hit / p
+        rows.append((up, total, soft, stand, hit, ACTIONS[HIT if hit > stand else STAND]))
+    return rows
+
+
+def write_chart(path, solver, decks=1):
+    '''Writes the chart of a fresh shoe of DECKS decks to the CSV
+    file PATH.
+
+    Returns:
+        (int): The number of rows written.
+    '''
+    rows = chart(solver, decks)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('up', 'total', 'soft', 'stand', 'hit', 'action'))
+        for up, total, soft, stand, hit, action in rows:
+            writer.writerow((up, total, int(soft), '{:.6f}'.format(stand), '{:.6f}'.format(hit), action))
+    return len(rows)
+
+
+def regret(table, solver, decks=1):
+    '''Measures how much a table's greedy hit/stand policy loses
+    against optimal play on the opening deals of a fresh shoe. The
+    greedy action of a state is the larger of its STAND and HIT
+    qvalues. Every face of the ten-valued cards of a deal is a
+    state of its own, see face_variants. States the table never
+    visited are skipped.
+
+    Args:
+        table (object): A Q-table, e.g. a bqa.qtable.QTable.
+        solver (Solver): The solver.
+        decks (int): The number of decks of the shoe.
+
+    Returns:
+        (dict): The mean 'regret' per wager over the visited
+        deals, the probability mass of the visited deals
+        ('coverage'), the number of 'states' compared and of
+        'mistakes', and the 'worst' (regret, up, faces) states.
+    '''
+    total_regret = 0.0
+    coverage = 0.0
+    states = 0
+    mistakes = []
+    for up, hand, p in deals(decks):
+        solution = None
+        for up_face, faces, p_faces in face_variants(up, hand, decks):
+            state = in_round_state(up_face, faces)
+            if not table.contains(state):
+                continue
+            if solution is None:
+                solution = solver.solve(state, _remove(_fresh_counts(decks), (up,) + hand))
+            qvalues = table.get(state)[2]
+            chosen = solution['hit'] if qvalues[HIT] > qvalues[STAND] else solution['stand']
+            loss = solution['ev'] - chosen
+            states += 1
+            coverage += p * p_faces
+            total_regret += p * p_faces * loss
+            if loss > 0:
+                mistakes.append((loss, up_face, faces))
+    mistakes.sort(reverse=True)
+    return {
+        'regret': total_regret / coverage if coverage else 0.0,
+        'coverage': coverage,
+        'states': states,
+        'mistakes': len(mistakes),
+        'worst': mistakes[:10]
+    }
+
+
+def warm_start(table, solver, decks=1, max_cards=3, scale=1.0):
+    '''Seeds the STAND and HIT qvalues of TABLE with the solver's
+    values scaled by SCALE, for every agent hand of up to MAX_CARDS
+    cards against every up-card of a fresh shoe, with every face
+    of their ten-valued cards. Weights and biases are left as they
+    are.
+
+    Args:
+        table (object): A Q-table, e.g. a bqa.qtable.QTable.
+        solver (Solver): The solver.
+        decks (int): The number of decks of the shoe.
+        max_cards (int): The largest agent hand to seed.
+        scale (float): The qvalue of a payout of one wager.
+
+    Returns:
+        (int): The number of states seeded.
+    '''
+    seeded = 0
+    fresh = _fresh_counts(decks)
+    for up in range(1, 11):
+        for n in range(2, max_cards + 1):
+            for hand in combinations_with_replacement(range(1, 11), n):
+                if sum(hand) > 21:
+                    continue
+                counts = _remove(fresh, (up,) + hand)
+                if counts is None:
+                    continue
+                solution = solver.solve(in_round_state(up, hand), counts)
+                for up_face, faces, _ in face_variants(up, hand, decks):
+                    state = in_round_state(up_face, faces)
+                    weights, biases, qvalues = table.get(state)
+                    qvalues = list(qvalues)
+                    qvalues[STAND] = solution['stand'] * scale
+                    qvalues[HIT] = solution['hit'] * scale
+                    table.put(state, weights, biases, qvalues)
+                    seeded += 1
+    return seeded
@@ -0,0 +1,192 @@
+import csv
+import json
+import os
+import sqlite3
+
+
+# the fields of every round record, in column order
+FIELDS = (
+    'seed', 'round', 'stages', 'wager', 'dealer_hand', 'agent_hand',
+    'actions', 'qvalues', 'rewards', 'outcome', 'chip_delta'
+)
+# the fields holding lists, stored as JSON by the flat formats
+LIST_FIELDS = ('stages', 'dealer_hand', 'agent_hand', 'actions', 'qvalues', 'rewards')
+
+
+class Sink:
+    '''Base class for the round record sinks of bqa.game.play.
+    Records are buffered and handed to write in batches of at
+    most BUFFER_SIZE, so memory stays bounded however long the
+    run is.
+    '''
+
+    def __init__(self, every=1, buffer_size=1024):
+        '''Returns a sink that keeps one round in EVERY.
+
+        Args:
+            every (int): Record every Nth round only.
+            buffer_size (int): The max number of records held
+            before they are written.
+        '''
+        if every < 1:
+            raise ValueError('every must be at least 1')
+        if buffer_size < 1:
+            raise ValueError('buffer size must be at least 1')
+        self.every = every
+        self._buffer_size = buffer_size
+        self._buffer = []
+        self.emitted = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        '''Writes the buffered records and releases the sink.'''
+        self.flush()
+
+
+    def emit(self, record):
+        '''Buffers RECORD, writing the buffer once it is full.'''
+        self._buffer.append(record)
+        self.emitted += 1
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+
+    def flush(self):
+        '''Writes the buffered records.'''
+        if self._buffer:
+            self.write(self._buffer)
+            self._buffer = []
+
+
+    def sample(self, round_index):
+        '''Returns True if round ROUND_INDEX should be recorded.'''
+        return round_index % self.every == 0
+
+
+    def write(self, records):
+        '''Writes a batch of RECORDS.'''
+        raise NotImplementedError
+
+
+class CallbackSink(Sink):
+
+    def __init__(self, callback, every=1, buffer_size=1):
+        '''Returns a sink that passes every record to CALLBACK,
+        e.g. a function or the send method of a primed generator.
+        '''
+        super().__init__(every=every, buffer_size=buffer_size)
+        self._callback = callback
+
+
+    def write(self, records):
+        for record in records:
+            self._callback(record)
+
+
+class JsonlSink(Sink):
+
+    def __init__(self, path, every=1, buffer_size=1024):
+        '''Returns a sink that appends one JSON object per round
+        to the file PATH.'''
+        super().__init__(every=every, buffer_size=buffer_size)
+        self._file = open(path, 'a')
+
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+    def write(self, records):
+        self._file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self._file.flush()
+
+
+class CsvSink(Sink):
+
+    def __init__(self, path, every=1, buffer_size=1024):
+        '''Returns a sink that appends one row per round to the
+        CSV file PATH. List fields are stored as JSON.'''
+        super().__init__(every=every, buffer_size=buffer_size)
+        header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if header:
+            self._writer.writerow(FIELDS)
+
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+    def write(self, records):
+        self._writer.writerows(_row(record) for record in records)
+        self._file.flush()
+
+
+class SqliteSink(Sink):
+
+    def __init__(self, path, every=1, buffer_size=1024):
+        '''Returns a sink that inserts one row per round into the
+        rounds table of the sqlite database PATH, one column per
+        field. List fields are stored as JSON.'''
+        super().__init__(every=every, buffer_size=buffer_size)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'create table if not exists rounds ('
+            'seed integer, round integer, stages text, wager real, '
+            'dealer_hand text, agent_hand text, actions text, '
+            'qvalues text, rewards text, outcome text, chip_delta real)'
+        )
+        self._db.commit()
+
+
+    def close(self):
+        super().close()
+        self._db.close()
+
+
+    def write(self, records):
+        with self._db:
+            self._db.executemany(
+                'insert into rounds values ({})'.format(', '.join('?' * len(FIELDS))),
+                [_row(record) for record in records]
+            )
+
+
+def _row(record):
+    return [
+        json.dumps(record.get(name), separators=(',', ':')) if name in LIST_FIELDS else record.get(name)
+        for name in FIELDS
+    ]
+
+
+def make_sink(path, every=1, buffer_size=1024):
+    '''Returns the sink matching the extension of PATH: .jsonl,
+    .csv, or .db/.sqlite.
+
+    Args:
+        path (str): The file to write.
+        every (int): Record every Nth round only.
+        buffer_size (int): The max number of buffered records.
+
+    Returns:
+        (Sink): A JsonlSink, CsvSink or SqliteSink.
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.json'):
+        return JsonlSink(path, every=every, buffer_size=buffer_size)
+    elif ext == '.csv':
+        return CsvSink(path, every=every, buffer_size=buffer_size)
+    elif ext in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteSink(path, every=every, buffer_size=buffer_size)
+    raise ValueError('unknown telemetry format: {}'.format(path))
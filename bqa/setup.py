@@ -27,7 +27,7 @@ REQUIRED = [
 
 # What packages are optional?
 EXTRAS = {
-    # 'fancy feature': ['django'],
+    'batch': ['numpy'],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -128,6 +128,6 @@ setup(
     cmdclass={
         'upload': UploadCommand,
     },
-    scripts=['bin/game-runner']
+    scripts=['bin/game-runner', 'bin/qtable-tool', 'bin/table-server']
 )
 
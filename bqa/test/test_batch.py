@@ -0,0 +1,51 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import unittest
+
+
+@unittest.skipIf(np is None, 'the batch simulator requires numpy')
+class TestBatch(unittest.TestCase):
+
+
+    def test_reproducible(self):
+        from bqa.batch import evaluate, threshold_policy
+        policy = threshold_policy(15)
+        self.assertEqual(evaluate(policy, 5000, seed=3), evaluate(policy, 5000, seed=3))
+
+
+    def test_never_hit(self):
+        from bqa.batch import PAYOUTS, simulate, threshold_policy
+        payouts = simulate(threshold_policy(0), 20000, np.random.default_rng(0))
+        self.assertEqual(len(payouts), 20000)
+        self.assertTrue(set(np.unique(payouts)) <= set(PAYOUTS.values()))
+
+
+    def test_rates(self):
+        from bqa.batch import evaluate, threshold_policy
+        results = evaluate(threshold_policy(), 20000, seed=1, chunk=4096)
+        self.assertEqual(results['hands'], 20000)
+        total = results['win_rate'] + results['draw_rate'] + results['loss_rate']
+        self.assertAlmostEqual(total, 1)
+        low, high = results['ev_ci']
+        self.assertTrue(low < results['ev'] < high)
+        # hitting below 17 loses to the house
+        self.assertTrue(results['ev'] < 0)
+
+
+    def test_chooser(self):
+        from bqa.batch import evaluate, policy_qvalues, threshold_policy
+        from bqa.policy import EPSILON_GREEDY, GREEDY, Policy
+        policy = threshold_policy()
+        qvalues = policy_qvalues(policy)
+        greedy = evaluate(qvalues, 5000, seed=2, chooser=Policy(GREEDY))
+        self.assertEqual(greedy, evaluate(policy, 5000, seed=2))
+        # exploring hits and stands at random, which costs
+        explore = evaluate(qvalues, 20000, seed=2, chooser=Policy(EPSILON_GREEDY, epsilon=1))
+        self.assertTrue(explore['ev'] < greedy['ev'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+from bqa.cache import ClockCache, LRUCache, TwoQueueCache, make_cache
+
+import unittest
+
+
+class TestCache(unittest.TestCase):
+
+
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        cache.get(1)
+        evicted = cache.put(3, 'c')
+        self.assertEqual(evicted, (2, 'b'))
+        self.assertTrue(1 in cache)
+        self.assertTrue(3 in cache)
+        self.assertEqual(cache.evictions, 1)
+
+
+    def test_clock_eviction(self):
+        cache = ClockCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        cache.get(1)
+        evicted = cache.put(3, 'c')
+        self.assertEqual(evicted, (2, 'b'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.pop(1), 'a')
+        self.assertIsNone(cache.put(4, 'd'))
+
+
+    def test_two_queue_promotion(self):
+        cache = TwoQueueCache(4)
+        for key in range(5):
+            cache.put(key, str(key))
+        # key 0 fell out of the probation queue into the ghost
+        #  queue, so reinserting it promotes it to the main queue
+        self.assertFalse(0 in cache)
+        cache.put(0, '0')
+        for key in range(5, 12):
+            cache.put(key, str(key))
+        self.assertTrue(0 in cache)
+        self.assertEqual(len(cache), 4)
+
+
+    def test_counters(self):
+        for policy in ('lru', 'clock', '2q'):
+            cache = make_cache(policy, 8)
+            cache.put(1, 'a')
+            cache.get(1)
+            cache.get(2)
+            self.assertEqual(cache.peek(1), 'a')
+            stats = cache.stats()
+            self.assertEqual(stats['hits'], 1)
+            self.assertEqual(stats['misses'], 1)
+            self.assertEqual(stats['hit_ratio'], 0.5)
+
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, make_cache, 'fifo', 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
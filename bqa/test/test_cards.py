@@ -1,10 +1,25 @@
-from bqa.cards import Card, Deck
+from bqa.cards import CARDS, Card, Deck, Shoe
+
+from collections import Counter
 
 import unittest
 
 
 class TestCard(unittest.TestCase):
-    pass
+
+
+    def test_codes(self):
+        self.assertEqual(len(set(card.code for card in CARDS)), 52)
+        for code, card in enumerate(CARDS):
+            self.assertEqual(card.code, code)
+            self.assertEqual(Card(card.suit, card.face), card)
+            self.assertEqual(hash(card), code)
+
+
+    def test_face_value(self):
+        self.assertEqual(Card('H', 1).face_value(), 1)
+        self.assertEqual(Card('S', 9).face_value(), 9)
+        self.assertEqual(Card('D', 13).face_value(), 10)
 
 
 class TestDeck(unittest.TestCase):
@@ -34,3 +49,33 @@ class TestDeck(unittest.TestCase):
         self.assertEqual(len(deck), 42)
         deck.reshuffle(discard)
         self.assertEqual(len(deck), 52)
+        self.assertEqual(len(set(deck.draw() for _ in range(52))), 52)
+
+
+class TestShoe(unittest.TestCase):
+
+
+    def test_draw(self):
+        shoe = Shoe(decks=2, penetration=1)
+        cards = Counter(shoe.draw() for _ in range(104))
+        self.assertEqual(len(shoe), 0)
+        self.assertEqual(len(cards), 52)
+        self.assertTrue(all(count == 2 for count in cards.values()))
+
+
+    def test_cut_card(self):
+        shoe = Shoe(decks=1, penetration=0.5)
+        discard = [shoe.draw() for _ in range(25)]
+        self.assertFalse(shoe.reshuffle(discard))
+        self.assertEqual(len(shoe), 27)
+        discard = [shoe.draw()]
+        self.assertTrue(shoe.cut_card_reached())
+        self.assertTrue(shoe.reshuffle(discard))
+        self.assertEqual(len(shoe), 52)
+
+
+    def test_exhausted(self):
+        shoe = Shoe(decks=1, penetration=1)
+        for _ in range(60):
+            self.assertTrue(isinstance(shoe.draw(), Card))
+        self.assertEqual(shoe.shuffles, 2)
@@ -0,0 +1,85 @@
+from bqa.cards import Shoe
+from bqa.checkpoint import Checkpointer
+from bqa.game import play
+from bqa.player import Account, Agent
+from bqa.qtable import QTable
+from bqa.telemetry import CallbackSink
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+class Crash(Exception):
+    pass
+
+
+def _play(db, rounds=3000, **kwargs):
+    return play(
+        game_args={'seed': 5, 'rounds': rounds},
+        dealer_args={'deck': Shoe(decks=2), 'account': Account(chips=100000)},
+        agent_args={'db': db, 'account': Account(chips=100000), 'table_args': {'size': 16}},
+        **kwargs
+    )
+
+
+def _rows(db):
+    conn = sqlite3.connect(db)
+    rows = conn.execute('select state_hash, entry from qtable order by state_hash').fetchall()
+    conn.close()
+    return rows
+
+
+class TestCheckpoint(unittest.TestCase):
+
+
+    def test_resume_after_crash(self):
+        with tempfile.TemporaryDirectory() as d:
+            expected = _play(os.path.join(d, 'a.db'))
+            db = os.path.join(d, 'b.db')
+            path = os.path.join(d, 'game.ckpt')
+            def crash(record):
+                if record['round'] == 437:
+                    raise Crash()
+            with self.assertRaises(Crash):
+                _play(db, checkpoint=Checkpointer(path, every=50), sink=CallbackSink(crash))
+            checkpointer = Checkpointer(path, every=50)
+            results = _play(db, checkpoint=checkpointer, resume=True)
+            self.assertGreater(checkpointer.saves, 1)
+            self.assertEqual(results, expected)
+            self.assertEqual(_rows(db), _rows(os.path.join(d, 'a.db')))
+
+
+    def test_interrupted_checkpoint(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            path = os.path.join(d, 'game.ckpt')
+            _play(db, rounds=500, checkpoint=Checkpointer(path, every=40))
+            # a crash between the database commit and the rename
+            #  leaves the matching checkpoint in the tmp file
+            os.replace(path, path + '.tmp')
+            with open(path, 'w') as f:
+                f.write('{"generation": 0}')
+            expected = _play(os.path.join(d, 'a.db'), rounds=800)
+            results = _play(db, rounds=800, checkpoint=Checkpointer(path), resume=True)
+            self.assertEqual(results, expected)
+
+
+    def test_missing_checkpoint(self):
+        with tempfile.TemporaryDirectory() as d:
+            with self.assertRaises(ValueError):
+                _play(os.path.join(d, 'table.db'), checkpoint=Checkpointer(os.path.join(d, 'game.ckpt')), resume=True)
+
+
+    def test_sharded_table(self):
+        with tempfile.TemporaryDirectory() as d:
+            table = QTable(db=os.path.join(d, 'table.db'), shards=2)
+            agent = Agent(table=table, account=Account(chips=1000))
+            with self.assertRaises(ValueError):
+                Checkpointer(os.path.join(d, 'game.ckpt')).attach(agent)
+            table.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
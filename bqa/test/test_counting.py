@@ -0,0 +1,79 @@
+from bqa.cards import Card, Shoe
+from bqa.counting import HI_LO, CardCount
+from bqa.player import Account, Agent
+
+import unittest
+
+
+class TestCardCount(unittest.TestCase):
+
+
+    def test_probabilities(self):
+        count = CardCount(1)
+        self.assertEqual(count.p_value(10), 16 / 52)
+        # a hard 12 busts on any ten
+        self.assertEqual(count.p_not_bust(12), 36 / 52)
+        # a 10 reaches 21 with an ace counted as 11
+        self.assertEqual(count.p_reach(10), 4 / 52)
+        self.assertEqual(count.p_reach(21), 0)
+        self.assertAlmostEqual(sum(count.p_dealer_up()), 1)
+        count.see(Card('H', 1))
+        count.see(Card('S', 12))
+        self.assertEqual(count.remaining, 50)
+        self.assertEqual(count.p_reach(10), 3 / 50)
+        self.assertEqual(count.p_at_most(1), 3 / 50)
+
+
+    def test_hi_lo(self):
+        count = CardCount(2)
+        for face in (2, 3, 4, 7, 13):
+            count.see(Card('D', face))
+        self.assertEqual(count.running_count, 2)
+        self.assertAlmostEqual(count.true_count(), 2 * 52 / 99)
+        self.assertEqual(count.true_count_bucket(), 1)
+
+
+    def test_shoe_count(self):
+        shoe = Shoe(decks=2, penetration=0.5)
+        hole = shoe.draw(seen=False)
+        seen = [shoe.draw() for _ in range(10)]
+        self.assertEqual(shoe.count.remaining, 94)
+        shoe.count.see(hole)
+        self.assertEqual(shoe.count.remaining, 93)
+        self.assertEqual(shoe.count.running_count, sum(HI_LO[c.face] for c in seen + [hole]))
+        shoe.shuffle()
+        self.assertEqual(shoe.count.remaining, 104)
+
+
+    def test_copy_from(self):
+        count = CardCount(2)
+        count.see(Card('H', 5))
+        copy = CardCount(2)
+        copy.copy_from(count)
+        self.assertEqual(copy.get_state(), count.get_state())
+        self.assertEqual(copy.p_value(5), count.p_value(5))
+
+
+    def test_prior_state_count(self):
+        # the prior state's risk is computed from the cards that
+        #  were unseen when it was observed
+        shoe = Shoe(decks=1)
+        agent = Agent(db=':memory:', account=Account(chips=1000))
+        agent.observe_count(shoe.count)
+        state = {
+            'game_stage': Agent.IN_ROUND,
+            'dealer_show': Card('H', 10),
+            'agent_hand': (Card('S', 9), Card('C', 4))
+        }
+        risk = agent._risk(state, Agent.HIT)
+        agent.update_parameters(state)
+        for face in (8, 7, 6, 5, 4, 3, 2, 2):
+            shoe.count.see(Card('D', face))
+        self.assertEqual(agent._risk(state, Agent.HIT), risk)
+        # any other state sees the current count
+        other = dict(state)
+        self.assertNotEqual(agent._risk(other, Agent.HIT), risk)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+from bqa.cards import Card
+from bqa.counting import CardCount
+from bqa import dealer
+
+import unittest
+
+
+class TestDealer(unittest.TestCase):
+
+
+    def test_infinite_deck_tables(self):
+        # the shipped tables match the recursive computation
+        for value in range(1, 11):
+            expected = dealer._finish_infinite(value, value == 1)
+            for p, q in zip(dealer.distribution(value), expected):
+                self.assertAlmostEqual(p, q, places=15)
+            self.assertAlmostEqual(sum(dealer.distribution(value)), 1)
+
+
+    def test_finite_shoe(self):
+        count = CardCount(1)
+        count.see(Card('H', 6))
+        dist = dealer.distribution(6, count)
+        self.assertAlmostEqual(sum(dist), 1)
+        # a 6 busts more often than a ten
+        self.assertGreater(dist[dealer.BUST], dealer.distribution(10, count)[dealer.BUST])
+        # repeated lookups for the same shoe are memoized
+        hits = dealer.cache_info().hits
+        self.assertEqual(dealer.distribution(6, count), dist)
+        self.assertEqual(dealer.cache_info().hits, hits + 1)
+
+
+    def test_depleted_shoe(self):
+        # only tens left, a dealer showing a 6 always stands on 16
+        count = CardCount(1)
+        for face in range(1, 10):
+            for suit in ('H', 'S', 'D', 'C'):
+                count.see(Card(suit, face))
+        dist = dealer.distribution(6, count)
+        self.assertEqual(dist[0], 1.0)
+        self.assertEqual(dealer.stand_outcomes(17, dist), (1.0, 0.0, 0.0))
+        self.assertEqual(dealer.stand_outcomes(16, dist), (0.0, 1.0, 0.0))
+        self.assertEqual(dealer.stand_outcomes(12, dist), (0.0, 0.0, 1.0))
+
+
+    def test_stand_outcomes(self):
+        dist = dealer.distribution(10)
+        win, draw, loss = dealer.stand_outcomes(20, dist)
+        self.assertAlmostEqual(win, dist[dealer.BUST] + sum(dist[:4]))
+        self.assertEqual(draw, dist[4])
+        self.assertAlmostEqual(win + draw + loss, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from bqa.cards import Card
+from bqa.dense import SLOTS, DenseQTable, state_index
+from bqa.keys import IN_ROUND, POST_ROUND, PRE_ROUND, state_key
+
+import os
+import tempfile
+import unittest
+
+
+class TestDenseQTable(unittest.TestCase):
+
+
+    TEST_STATE = {
+        'game_stage': IN_ROUND,
+        'dealer_show': Card('H', 13),
+        'agent_hand': (Card('S', 1), Card('D', 6))
+    }
+    TEST_WEIGHTS = [0.1, 0.3, 0.6]
+    TEST_BIASES = [0.25, 0.25, 0.5]
+    TEST_QVALUES = [1234, 5678, 4321]
+
+
+    def test_state_index(self):
+        index = state_index(TestDenseQTable.TEST_STATE)
+        self.assertEqual(index, state_index(state_key(TestDenseQTable.TEST_STATE)))
+        # a soft 17 against a ten is the same slot regardless of
+        #  the cards that make it up
+        other = {
+            'game_stage': IN_ROUND,
+            'dealer_show': Card('C', 10),
+            'agent_hand': (Card('H', 3), Card('S', 1), Card('C', 3))
+        }
+        self.assertEqual(index, state_index(other))
+        slots = set()
+        for wager in (10, 20, 50, 100, 7):
+            slots.add(state_index({'game_stage': PRE_ROUND, 'wager': wager})[0])
+        self.assertEqual(len(slots), 5)
+        self.assertTrue(all(0 <= slot < SLOTS for slot in slots))
+        # post round states keep the wager their chip delta was
+        #  settled from
+        slots = set()
+        for outcome, chip_delta in (('WIN', 20), ('WIN', 200), ('LOSS', -10), ('LOSS', -100), ('DRAW', 5), ('DRAW', 50)):
+            state = {'game_stage': POST_ROUND, 'outcome': outcome, 'chip_delta': chip_delta}
+            index = state_index(state)
+            self.assertEqual(index, state_index(state_key(state)))
+            slots.add(index[0])
+        self.assertEqual(len(slots), 6)
+        self.assertTrue(all(0 <= slot < SLOTS for slot in slots))
+
+
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'table.dqt')
+            table = DenseQTable(path)
+            weights, biases, qvalues = table.get({'game_stage': PRE_ROUND, 'wager': 10})
+            self.assertEqual(len(weights), 2)
+            self.assertEqual(qvalues, [1, 0])
+            table.put(
+                TestDenseQTable.TEST_STATE,
+                TestDenseQTable.TEST_WEIGHTS,
+                TestDenseQTable.TEST_BIASES,
+                TestDenseQTable.TEST_QVALUES
+            )
+            table.save_table()
+            table = DenseQTable(path)
+            self.assertEqual(len(table), 2)
+            self.assertEqual(table.get(TestDenseQTable.TEST_STATE), [
+                TestDenseQTable.TEST_WEIGHTS,
+                TestDenseQTable.TEST_BIASES,
+                TestDenseQTable.TEST_QVALUES
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
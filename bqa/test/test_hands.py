@@ -0,0 +1,61 @@
+from bqa.cards import Card
+from bqa.game import compare_hands, hand_value
+from bqa.hands import BUST, Hand, add, hand_total, values_total
+
+from itertools import product
+import unittest
+
+
+def _best_total(values):
+    total = sum(values)
+    if 1 in values and total + 10 <= 21:
+        return total + 10, True
+    return min(total, BUST), False
+
+
+class TestHands(unittest.TestCase):
+
+
+    def test_transitions(self):
+        for n in range(1, 5):
+            for values in product(range(1, 11), repeat=n):
+                self.assertEqual(values_total(values), _best_total(values), values)
+        self.assertEqual(add(21, True, 10), (21, False))
+        self.assertEqual(add(BUST, False, 1), (BUST, False))
+
+
+    def test_hand(self):
+        hand = Hand()
+        hand.append(Card('H', 1))
+        self.assertEqual((hand.total, hand.soft, len(hand)), (11, True, 1))
+        hand.extend([Card('S', 1), Card('D', 13)])
+        self.assertEqual((hand.total, hand.soft), (12, False))
+        self.assertEqual(hand.hard_total(), 12)
+        hand[2] = Card('D', 9)
+        self.assertEqual((hand.total, hand.soft), (21, True))
+        self.assertEqual(hand.hard_total(), 11)
+        hand.pop()
+        self.assertEqual(hand_total(hand), (12, True))
+        hand.clear()
+        self.assertEqual((hand.total, hand.soft, len(hand)), (0, False, 0))
+
+
+    def test_hand_value(self):
+        # aces count as 11 only while that does not bust the hand
+        self.assertEqual(hand_value([Card('H', 1), Card('S', 1), Card('D', 10)]), 12)
+        self.assertEqual(hand_value((Card('H', 1), Card('S', 9))), 20)
+        self.assertEqual(hand_value(Hand([Card('H', 10), Card('S', 9), Card('D', 5)])), BUST)
+
+
+    def test_compare_hands(self):
+        twenty = Hand([Card('H', 10), Card('S', 13)])
+        soft_twenty = [Card('H', 1), Card('S', 9)]
+        bust = [Card('H', 10), Card('S', 9), Card('D', 5)]
+        self.assertEqual(compare_hands(twenty, soft_twenty), 0)
+        self.assertEqual(compare_hands(bust, twenty), -1)
+        self.assertEqual(compare_hands(twenty, bust), 1)
+        self.assertEqual(compare_hands([Card('H', 10), Card('S', 7)], twenty), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+from bqa.cards import Card
+from bqa.keys import IN_ROUND, POST_ROUND, PRE_ROUND, decode_key, key_bucket, key_stage, state_key
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+class TestKeys(unittest.TestCase):
+
+
+    IN_ROUND_STATE = {
+        'game_stage': IN_ROUND,
+        'dealer_show': Card('H', 12),
+        'agent_hand': (Card('S', 1), Card('D', 7), Card('C', 1))
+    }
+
+
+    def test_decode(self):
+        key = state_key(TestKeys.IN_ROUND_STATE)
+        self.assertEqual(key_stage(key), IN_ROUND)
+        self.assertEqual(decode_key(key), {
+            'game_stage': IN_ROUND,
+            'dealer_show': 12,
+            'agent_hand': (1, 1, 7)
+        })
+        key = state_key({'game_stage': POST_ROUND, 'outcome': 'LOSS', 'chip_delta': -12.5})
+        self.assertEqual(decode_key(key)['chip_delta'], -12.5)
+        key = state_key({'game_stage': PRE_ROUND, 'wager': 50})
+        self.assertEqual(decode_key(key), {'game_stage': PRE_ROUND, 'wager': 50})
+
+
+    def test_true_count(self):
+        state = dict(TestKeys.IN_ROUND_STATE, true_count=-3)
+        key = state_key(state)
+        self.assertNotEqual(key, state_key(TestKeys.IN_ROUND_STATE))
+        self.assertTrue(key < 1 << 63)
+        self.assertEqual(decode_key(key)['true_count'], -3)
+        state['true_count'] = 16
+        self.assertRaises(ValueError, state_key, state)
+
+
+    def test_suit_and_order_independent(self):
+        state = {
+            'game_stage': IN_ROUND,
+            'dealer_show': Card('C', 12),
+            'agent_hand': (Card('H', 1), Card('H', 1), Card('S', 7))
+        }
+        self.assertEqual(state_key(state), state_key(TestKeys.IN_ROUND_STATE))
+
+
+    def test_no_collisions(self):
+        keys = set()
+        for up in range(1, 14):
+            for first in range(1, 14):
+                for second in range(first, 14):
+                    keys.add(state_key({
+                        'game_stage': IN_ROUND,
+                        'dealer_show': Card('H', up),
+                        'agent_hand': (Card('H', first), Card('S', second))
+                    }))
+        self.assertEqual(len(keys), 13 * 13 * 14 // 2)
+
+
+    def test_bucket(self):
+        # the IN_ROUND keys of every two card hand spread over
+        #  every bucket
+        buckets = [0] * 8
+        for up in range(1, 14):
+            for first in range(1, 14):
+                for second in range(first, 14):
+                    key = state_key({
+                        'game_stage': IN_ROUND,
+                        'dealer_show': Card('H', up),
+                        'agent_hand': (Card('H', first), Card('S', second))
+                    })
+                    bucket = key_bucket(key, 8)
+                    self.assertEqual(bucket, key_bucket(key, 8))
+                    buckets[bucket] += 1
+        self.assertTrue(min(buckets) > 0.8 * sum(buckets) / 8)
+
+
+    def test_stable_across_processes(self):
+        code = (
+            'from bqa.cards import Card; from bqa.keys import state_key; '
+            'print(state_key({"game_stage": 1, "dealer_show": Card("H", 3), "agent_hand": (Card("S", 9),)}))'
+        )
+        keys = set()
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            keys.add(subprocess.check_output([sys.executable, '-c', code], env=env))
+        self.assertEqual(len(keys), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+from bqa.parallel import _copy_db, merge_results, merge_tables, play_parallel, split_rounds, worker_seed
+from bqa.player import Account
+from bqa.qtable import QTable
+
+import os
+import tempfile
+import unittest
+
+
+class TestParallel(unittest.TestCase):
+
+
+    def test_worker_seed(self):
+        self.assertEqual(worker_seed(0, 1), worker_seed(0, 1))
+        seeds = set(worker_seed(0, worker) for worker in range(8))
+        self.assertEqual(len(seeds), 8)
+        self.assertNotEqual(worker_seed(0, 0), worker_seed(1, 0))
+
+
+    def test_split_rounds(self):
+        self.assertEqual(split_rounds(10, 4), [3, 3, 2, 2])
+        self.assertEqual(sum(split_rounds(1001, 7)), 1001)
+
+
+    def test_merge_results(self):
+        merged = merge_results([
+            {'seed': 1, 'rounds': 10, 'wins': 2, 'chip_delta': 5},
+            {'seed': 2, 'rounds': 20, 'wins': 3, 'chip_delta': -1}
+        ])
+        self.assertEqual(merged, {'rounds': 30, 'wins': 5, 'chip_delta': 4, 'workers': 2})
+
+
+    def test_merge_tables(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dbs = [os.path.join(tmp, 'w{}.db'.format(i)) for i in range(2)]
+            for i, db in enumerate(dbs):
+                table = QTable(db=db)
+                table.put(5, [i, i, i], [0, 0, 0], [2 * i, 0, 0])
+                table.put(9 + i, [1, 1, 1], [1, 1, 1], [1, 1, 1])
+                table.close()
+            db = os.path.join(tmp, 'table.db')
+            self.assertEqual(merge_tables(dbs, db), 3)
+            table = QTable(db=db)
+            self.assertEqual(table.get(5), [[0.5, 0.5, 0.5], [0, 0, 0], [1, 0, 0]])
+            self.assertEqual(table.get(10)[0], [1, 1, 1])
+            table.close()
+
+
+    def test_merge_deltas(self):
+        # workers start from copies of the table, so only their
+        #  changes are averaged
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, 'table.db')
+            table = QTable(db=db)
+            table.put(5, [1, 1, 1], [0, 0, 0], [10, 0, 0])
+            table.put(9, [1, 1, 1], [0, 0, 0], [4, 0, 0])
+            table.close()
+            dbs = [os.path.join(tmp, 'w{}.db'.format(i)) for i in range(3)]
+            for i, name in enumerate(dbs):
+                _copy_db(db, name)
+                table = QTable(db=name)
+                if i < 2:
+                    table.put(5, [1, 1, 1], [0, 0, 0], [10 + 2 * (i + 1), 0, 0])
+                if i == 0:
+                    table.put(9, [1, 1, 1], [0, 0, 0], [8, 0, 0])
+                table.close()
+            self.assertEqual(merge_tables(dbs, db), 2)
+            table = QTable(db=db)
+            self.assertEqual(table.get(5)[2], [13, 0, 0])
+            # one worker's update is not diluted by the others
+            self.assertEqual(table.get(9)[2], [8, 0, 0])
+            table.close()
+
+
+    def test_play_parallel_cleanup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, 'table.db')
+            results = play_parallel(
+                2,
+                {'seed': 0, 'rounds': 50},
+                {'account': Account(chips=10 ** 6)},
+                {'db': db, 'account': Account(chips=10 ** 6)},
+                merge=True
+            )
+            self.assertEqual(results['rounds'], 50)
+            self.assertEqual(os.listdir(tmp), ['table.db'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bqa.policy import EPSILON_GREEDY, GREEDY, SOFTMAX, Policy, cumulative, sample, softmax
+
+import random
+import unittest
+
+
+class TestPolicy(unittest.TestCase):
+
+
+    def test_softmax(self):
+        self.assertEqual(softmax([1e6, 1e6]), [0.5, 0.5])
+        p = softmax([1, 2, 3], temperature=2)
+        self.assertAlmostEqual(sum(p), 1)
+        self.assertTrue(p[0] < p[1] < p[2])
+
+
+    def test_sample(self):
+        cdf = cumulative([0.25, 0.5, 0.25])
+        self.assertEqual(cdf[-1], 1.0)
+        self.assertEqual([sample(cdf, u) for u in (0, 0.2499, 0.25, 0.74, 0.75, 0.9999)], [0, 0, 1, 1, 2, 2])
+
+
+    def test_modes(self):
+        qvalues = [1.0, 3.0, 2.0]
+        self.assertEqual(Policy(GREEDY).choose(qvalues), 1)
+        p = Policy(EPSILON_GREEDY, epsilon=0.3).distribution(qvalues)
+        for a, b in zip(p, [0.1, 0.8, 0.1]):
+            self.assertAlmostEqual(a, b)
+        with self.assertRaises(ValueError):
+            Policy('boltzmann')
+
+
+    def test_frequencies(self):
+        policy = Policy(SOFTMAX)
+        random.seed(0)
+        chosen = [policy.choose([0.0, 1.0]) for _ in range(4000)]
+        # the softmax of (0, 1) picks the second action 73% of the time
+        self.assertAlmostEqual(sum(chosen) / len(chosen), 0.731, delta=0.03)
+
+
+    @unittest.skipIf(np is None, 'batched action selection requires numpy')
+    def test_choose_many(self):
+        qvalues = np.array([[1.0, 3.0, 2.0], [0.5, -1.0, 0.0], [2.0, 2.0, 2.0]])
+        u = np.array([0.3, 0.9, 0.5])
+        for mode in (SOFTMAX, EPSILON_GREEDY, GREEDY):
+            policy = Policy(mode, temperature=0.7, epsilon=0.2)
+            single = [policy.choose(list(row), u=x) for row, x in zip(qvalues, u)]
+            self.assertEqual(policy.choose_many(qvalues, u=u).tolist(), single)
+        choices = Policy(SOFTMAX).choose_many(np.zeros((30000, 2)), rng=np.random.default_rng(1))
+        self.assertAlmostEqual(choices.mean(), 0.5, delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import bqa.game as game
+from bqa.game import play
+from bqa.player import Account
+from bqa.profiling import Profiler, Timer
+from bqa.qtable import QTable
+
+import unittest
+
+
+class TestProfiling(unittest.TestCase):
+
+
+    def test_install(self):
+        get, hand_value = QTable.get, game.hand_value
+        with Profiler() as profiler:
+            self.assertIsNot(QTable.get, get)
+            results = play(
+                game_args={'seed': 1, 'rounds': 100},
+                dealer_args={'account': Account(chips=100000)},
+                agent_args={'db': ':memory:', 'account': Account(chips=100000)}
+            )
+        self.assertIs(QTable.get, get)
+        self.assertIs(game.hand_value, hand_value)
+        timers = profiler.timers
+        stages = sum(timers['Agent.update_parameters[{}]'.format(s)].calls for s in ('PRE_ROUND', 'IN_ROUND', 'POST_ROUND'))
+        self.assertEqual(stages, results['rounds'])
+        self.assertGreater(timers['QTable.get'].calls, 0)
+        self.assertGreater(timers['hand_value'].calls, 0)
+        self.assertIn('hit_ratio', profiler.table_stats)
+        self.assertTrue(profiler.report(rounds=results['rounds'], elapsed=1.0))
+
+
+    def test_timer(self):
+        timer = Timer('t')
+        for ns in (100, 200, 300, 100000):
+            timer.add(ns)
+        self.assertEqual(timer.calls, 4)
+        self.assertEqual(timer.min, 100)
+        self.assertEqual(timer.max, 100000)
+        self.assertEqual(timer.percentile(50), 256)
+        self.assertEqual(timer.percentile(100), 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
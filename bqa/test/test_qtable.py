@@ -1,5 +1,12 @@
-from bqa.qtable import QTable
+from bqa.keys import key_bucket
+from bqa.migrate import reshard
+from bqa.qtable import Flusher, QTable, pack_entry, read_rows, shard_paths, unpack_entry
 
+import json
+import os
+import sqlite3
+import tempfile
+import threading
 import unittest
 
 
@@ -13,7 +20,71 @@ class TestQTable(unittest.TestCase):
 
 
     def test_eviction(self):
-        pass
+        for policy in ('lru', 'clock', '2q'):
+            table = QTable(db=':memory:', size=2, policy=policy)
+            for state in range(3):
+                table.put(
+                    state,
+                    TestQTable.TEST_WEIGHTS,
+                    TestQTable.TEST_BIASES,
+                    TestQTable.TEST_QVALUES
+                )
+            self.assertEqual(len(table), 2)
+            self.assertEqual(table.stats()['evictions'], 1)
+
+
+    def test_write_behind(self):
+        table = QTable(db=':memory:', size=1, flush_size=2, flush_interval=60)
+        for state in range(2):
+            table.put(
+                state,
+                TestQTable.TEST_WEIGHTS,
+                TestQTable.TEST_BIASES,
+                TestQTable.TEST_QVALUES
+            )
+        count = 'select count(*) from qtable'
+        # the evicted entry is buffered rather than written
+        self.assertEqual(table._db.execute(count).fetchone()[0], 0)
+        weights, _, _ = table.get(0)
+        self.assertEqual(weights, TestQTable.TEST_WEIGHTS)
+        table.sync()
+        self.assertEqual(table._db.execute(count).fetchone()[0], 2)
+
+
+    def test_pack_entry(self):
+        blob = pack_entry(
+            TestQTable.TEST_WEIGHTS,
+            TestQTable.TEST_BIASES,
+            TestQTable.TEST_QVALUES
+        )
+        self.assertEqual(len(blob), 72)
+        self.assertEqual(unpack_entry(blob), (
+            TestQTable.TEST_WEIGHTS,
+            TestQTable.TEST_BIASES,
+            TestQTable.TEST_QVALUES
+        ))
+
+
+    def test_convert_json_table(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, 'table.db')
+            conn = sqlite3.connect(db)
+            conn.execute('create table qtable (state_hash int primary key, weights text, biases text, qvalues text)')
+            conn.execute('insert into qtable values (?, ?, ?, ?)', (
+                TestQTable.TEST_STATE,
+                json.dumps(TestQTable.TEST_WEIGHTS),
+                json.dumps(TestQTable.TEST_BIASES),
+                json.dumps(TestQTable.TEST_QVALUES)
+            ))
+            conn.execute('pragma user_version=1')
+            conn.commit()
+            conn.close()
+            table = QTable(db=db)
+            weights, biases, qvalues = table.get(TestQTable.TEST_STATE)
+            table.close()
+        self.assertEqual(weights, TestQTable.TEST_WEIGHTS)
+        self.assertEqual(biases, TestQTable.TEST_BIASES)
+        self.assertEqual(qvalues, TestQTable.TEST_QVALUES)
 
 
     def test_get(self):
@@ -32,6 +103,187 @@ class TestQTable(unittest.TestCase):
         self.assertEqual(qvalues, TestQTable.TEST_QVALUES)
 
 
+    def test_get_many(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = QTable(db=db, size=4096)
+            # more keys than fit in one IN (...) query
+            keys = [(i << 2) | 2 for i in range(2000)]
+            for key in keys:
+                table.put(key, [0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [float(key), 0.0, 1.0])
+            table.close()
+            table = QTable(db=db, size=16, flush_size=1)
+            # evicted pending entries are newer than their rows
+            table.put(keys[0], [0.0] * 3, [0.0] * 3, [-1.0] * 3)
+            for key in range(100, 116):
+                table.get(key << 2)
+            entries = table.get_many([keys[0]] + keys[1:1500] + [keys[1], 7 << 2])
+            self.assertEqual(len(entries), 1502)
+            self.assertEqual(entries[0][2], [-1.0] * 3)
+            self.assertEqual([entry[2][0] for entry in entries[1:1500]], [float(key) for key in keys[1:1500]])
+            self.assertEqual(entries[1500], entries[1])
+            # an unseen PRE_ROUND state is initialized like get
+            self.assertEqual(entries[-1][2], [1, 0])
+            table.close()
+
+
+    def test_preload(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = QTable(db=db, size=256)
+            for key in range(200):
+                table.put(key, [0.1, 0.2], [0.3, 0.4], [0.5, float(key)])
+            table.close()
+            table = QTable(db=db, size=64, preload='all')
+            self.assertEqual(len(table), 64)
+            # the PRE_ROUND and POST_ROUND rows come first
+            self.assertTrue(all(key & 3 != 1 for key in table._table.keys()))
+            self.assertEqual(table.get(8)[2], [0.5, 8.0])
+            self.assertEqual(table.stats()['misses'], 0)
+            table.close()
+            table = QTable(db=db, size=64, preload=10)
+            self.assertEqual(len(table), 10)
+            table.close()
+
+
+    def test_async_writes(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = QTable(db=db, size=8, flush_size=4, async_writes=True, max_queued=8)
+            for key in range(0, 400, 4):
+                table.put(key, [0.1, 0.2], [0.3, 0.4], [float(key), 1.0])
+                # evicted entries are readable before, while and
+                #  after they are written
+                earlier = key // 8 * 4
+                self.assertEqual(table.get(earlier)[2][0], float(earlier))
+            table.sync({'checkpoint': '3'})
+            # a meta sync returns once committed
+            self.assertEqual(table.read_meta('checkpoint'), '3')
+            stats = table.stats()['writer']
+            self.assertTrue(stats['commits'] > 0)
+            self.assertTrue(stats['max_depth'] <= 8)
+            table.save_table()
+            conn = sqlite3.connect(db)
+            rows = dict(conn.execute('select state_hash, entry from qtable'))
+            conn.close()
+            self.assertEqual(len(rows), 100)
+            self.assertEqual(unpack_entry(rows[396])[2], [396.0, 1.0])
+
+
+    def test_queued_entries_are_copies(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = QTable(db=db, size=8, async_writes=True)
+            # keep the writer from committing the synced entry
+            lock = sqlite3.connect(db)
+            lock.execute('begin exclusive')
+            table.put(4, [0.1, 0.2], [0.3, 0.4], [1.0, 2.0])
+            table.sync()
+            entry = table.get(4)
+            # blend the cached entry in place like an agent
+            entry[0][0] = entry[1][0] = entry[2][0] = 9.0
+            lock.rollback()
+            lock.close()
+            for flusher in table._flushers:
+                flusher.drain()
+            conn = sqlite3.connect(db)
+            row = conn.execute('select entry from qtable where state_hash=4').fetchone()
+            conn.close()
+            self.assertEqual(unpack_entry(row[0]), ([0.1, 0.2], [0.3, 0.4], [1.0, 2.0]))
+            table.close()
+
+
+    def test_flusher_backpressure(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            QTable(db=db).close()
+            flusher = Flusher(db, max_queued=10)
+            # keep the writer busy so the queue fills up
+            lock = sqlite3.connect(db)
+            lock.execute('begin exclusive')
+            submitted = threading.Event()
+            def submit():
+                for i in range(4):
+                    flusher.submit([((i * 5 + j) << 2, ([0.0, 0.0], [0.0, 0.0], [1.0, 0.0])) for j in range(5)])
+                submitted.set()
+            thread = threading.Thread(target=submit)
+            thread.start()
+            self.assertFalse(submitted.wait(0.3))
+            self.assertTrue(flusher.stats()['waits'] > 0)
+            self.assertEqual(flusher.get(0), ([0.0, 0.0], [0.0, 0.0], [1.0, 0.0]))
+            lock.rollback()
+            lock.close()
+            thread.join()
+            flusher.close()
+            self.assertEqual(flusher.stats()['written'], 20)
+            self.assertEqual(flusher.get(0), None)
+
+
+    def test_shards(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = QTable(db=db, size=16, flush_size=8, shards=4)
+            for key in range(200):
+                table.put(key, [0.1, 0.2], [0.3, 0.4], [0.5, float(key)])
+            self.assertEqual(table.get_many([3, 150])[1][2], [0.5, 150.0])
+            self.assertEqual(table.stats()['shards'], 4)
+            table.save_table()
+            self.assertFalse(os.path.exists(db))
+            # every row is stored in the shard of its key
+            for shard, path in enumerate(shard_paths(db, 4)):
+                conn = sqlite3.connect(path)
+                keys = [row[0] for row in conn.execute('select state_hash from qtable')]
+                conn.close()
+                self.assertTrue(keys)
+                self.assertTrue(all(key_bucket(key, 4) == shard for key in keys))
+            table = QTable(db=db, size=64, shards=4, preload='all')
+            self.assertEqual(len(table), 64)
+            self.assertTrue(all(key & 3 != 1 for key in table._table.keys()))
+            self.assertEqual(table.get(101)[2], [0.5, 101.0])
+            table.close()
+            table = QTable(db=db, size=64, shards=4, preload=10)
+            self.assertEqual(len(table), 10)
+            table.close()
+            with self.assertRaises(ValueError):
+                QTable(db=db, shards=2)
+
+
+    def test_preload_uneven_shards(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            # 40 IN_ROUND rows in shard 0, 10 PRE_ROUND rows in
+            #  shard 1 and none in the others
+            in_round = [key for key in range(1, 4000, 4) if key_bucket(key, 4) == 0][:40]
+            pre_round = [key for key in range(0, 4000, 4) if key_bucket(key, 4) == 1][:10]
+            table = QTable(db=db, size=64, shards=4)
+            for key in in_round + pre_round:
+                table.put(key, [0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.0, 0.0, 0.0])
+            table.close()
+            table = QTable(db=db, size=20, shards=4, preload='all')
+            self.assertEqual(len(table), 20)
+            self.assertTrue(all(key in table._table for key in pre_round))
+            table.close()
+
+
+    def test_reshard(self):
+        with tempfile.TemporaryDirectory() as d:
+            src = os.path.join(d, 'table.db')
+            table = QTable(db=src, size=256)
+            for key in range(100):
+                table.put(key, [0.1, 0.2], [0.3, 0.4], [0.5, float(key)])
+            table.close()
+            sharded = os.path.join(d, 'sharded.db')
+            self.assertEqual(reshard(src, sharded, 3), 100)
+            with self.assertRaises(ValueError):
+                reshard(src, sharded, 3)
+            self.assertEqual(sorted(read_rows(sharded, 3)), sorted(read_rows(src)))
+            merged = os.path.join(d, 'merged.db')
+            self.assertEqual(reshard(sharded, merged, 1, src_shards=3), 100)
+            table = QTable(db=merged)
+            self.assertEqual(table.get(42)[2], [0.5, 42.0])
+            table.close()
+
+
     def test_put(self):
         table = QTable()
         table.put(
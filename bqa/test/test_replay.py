@@ -0,0 +1,78 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bqa.cards import Card
+from bqa.game import play
+from bqa.player import Account, Agent
+from bqa.qtable import QTable
+
+import os
+import random
+import tempfile
+import unittest
+
+
+@unittest.skipIf(np is None, 'experience replay requires numpy')
+class TestReplay(unittest.TestCase):
+
+
+    def test_ring(self):
+        from bqa.replay import ReplayBuffer
+        buffer = ReplayBuffer(4)
+        for i in range(6):
+            buffer.append(i, i + 1, i % 2, 0.5, 1.0, float(i))
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(sorted(buffer.transitions['state'].tolist()), [2, 3, 4, 5])
+        batch = buffer.sample(100, 0)
+        self.assertEqual(len(batch), 100)
+        self.assertTrue(set(batch['state'].tolist()) <= {2, 3, 4, 5})
+
+
+    def test_update_matches_agent(self):
+        # a batch of distinct transitions updates the table exactly
+        #  like the agent's scalar update
+        from bqa.replay import ReplayBuffer, update
+        scalar = Agent(db=':memory:', account=Account(chips=1000), alpha=0.3, beta=0.2, learning_rate=0.4, discount_factor=0.6)
+        batched = Agent(db=':memory:', account=Account(chips=1000), alpha=0.3, beta=0.2, learning_rate=0.4, discount_factor=0.6, replay=16)
+        state = {'game_stage': Agent.IN_ROUND, 'dealer_show': Card('H', 10), 'agent_hand': (Card('S', 9), Card('C', 4))}
+        successor = {'game_stage': Agent.IN_ROUND, 'dealer_show': Card('H', 10), 'agent_hand': (Card('S', 9), Card('C', 4), Card('D', 2))}
+        for agent in (scalar, batched):
+            # both tables draw the same random initial entries
+            random.seed(1)
+            agent.get_qvalues(state)
+            agent.get_qvalues(successor)
+            agent.update_parameters(state)
+            agent.update_parameters(successor)
+        buffer = batched.get_replay()
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(update(batched.get_table(), buffer.transitions[:2], 0.3, 0.2, 0.4, 0.6), 1)
+        for a, b in zip(scalar.get_table().get(state), batched.get_table().get(state)):
+            np.testing.assert_allclose(a, b)
+
+
+    def test_play(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            results = play(
+                game_args={'seed': 3, 'rounds': 3000},
+                dealer_args={'account': Account(chips=10 ** 6)},
+                agent_args={'db': db, 'account': Account(chips=10 ** 6), 'replay': 1000, 'replay_every': 5, 'replay_batch': 64}
+            )
+            self.assertEqual(results['rounds'], 3000)
+            table = QTable(db=db)
+            self.assertTrue(table.contains({'game_stage': Agent.PRE_ROUND, 'wager': 10}))
+            table.close()
+
+
+    def test_put_many(self):
+        table = QTable(db=':memory:', size=2, flush_size=1)
+        table.put_many((key, [0.5, 0.5], [0.1, 0.1], [float(key), 0.0]) for key in (0, 4, 8, 12))
+        self.assertEqual(table.stats()['evictions'], 2)
+        for key in (0, 4, 8, 12):
+            self.assertEqual(table.get(key)[2], [float(key), 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
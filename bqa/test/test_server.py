@@ -0,0 +1,61 @@
+from bqa.server import TableServer, query
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+class TestServer(unittest.TestCase):
+
+
+    def test_tables(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            server = TableServer(tables=3, seats=2, rounds=40, db=db, agent_chips=10 ** 6, dealer_chips=10 ** 6)
+            metrics = asyncio.run(server.serve())
+            self.assertEqual(metrics['rounds'], 120)
+            self.assertEqual(metrics['hands'], 240)
+            for table in metrics['tables']:
+                self.assertEqual(table['rounds'], 40)
+                self.assertTrue(table['latency_ms']['p50'] > 0)
+            for seats in metrics['results']:
+                for seat in seats:
+                    self.assertEqual(seat['wins'] + seat['draws'] + seat['losses'], 40)
+            conn = sqlite3.connect(db)
+            self.assertTrue(conn.execute('select count(*) from qtable').fetchone()[0] > 0)
+            conn.close()
+
+
+    def test_reproducible(self):
+        with tempfile.TemporaryDirectory() as d:
+            results = []
+            for name in ('a.db', 'b.db'):
+                server = TableServer(tables=2, seats=3, rounds=30, seed=4, db=os.path.join(d, name))
+                results.append(asyncio.run(server.serve())['results'])
+            self.assertEqual(results[0], results[1])
+
+
+    def test_socket(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'server.sock')
+            server = TableServer(tables=2, seats=1, db=os.path.join(d, 'table.db'), agent_chips=10 ** 9, dealer_chips=10 ** 9, socket_path=path)
+            async def client():
+                while server.metrics()['rounds'] < 20:
+                    await asyncio.sleep(0.01)
+                metrics = await query('metrics', socket_path=path)
+                reply = await query('stop', socket_path=path)
+                return metrics, reply
+            async def run():
+                return await asyncio.gather(server.serve(), client())
+            final, (metrics, reply) = asyncio.run(run())
+            self.assertEqual(reply, {'stopping': True})
+            self.assertEqual(len(metrics['tables']), 2)
+            self.assertTrue(metrics['hands_per_sec'] > 0)
+            self.assertTrue(final['rounds'] >= metrics['rounds'])
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+from bqa.cards import Card
+from bqa.player import Account, Agent
+from bqa.qtable import QTable
+from bqa.shared import ConcurrentQTable, play_threads
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+
+class TestShared(unittest.TestCase):
+
+
+    def test_memory(self):
+        with self.assertRaises(ValueError):
+            ConcurrentQTable(db=':memory:')
+
+
+    def test_persist(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            # a tiny cache evicts and flushes most entries
+            table = ConcurrentQTable(db=db, size=8, stripes=4, flush_size=4)
+            for key in range(100):
+                table.put(key << 2 | 1, [0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [float(key), 0.0, 0.0])
+            for key in range(100):
+                self.assertEqual(table.get(key << 2 | 1)[2][0], float(key))
+            self.assertTrue(table.contains(7 << 2 | 1))
+            self.assertEqual(table.stats()['operations'], 201)
+            table.close()
+            table = QTable(db=db)
+            for key in range(100):
+                self.assertEqual(table.get(key << 2 | 1)[2][0], float(key))
+            table.close()
+
+
+    def test_update_atomic(self):
+        # concurrent increments of a few entries lose no update
+        with tempfile.TemporaryDirectory() as d:
+            table = ConcurrentQTable(db=os.path.join(d, 'table.db'), stripes=2)
+            keys = [key << 2 | 1 for key in range(4)]
+            for key in keys:
+                table.put(key, [0.0] * 3, [0.0] * 3, [0.0] * 3)
+
+            def increment(weights, biases, qvalues):
+                qvalues[0] += 1
+                return weights, biases, qvalues
+
+            def worker():
+                for i in range(2000):
+                    table.update(keys[i % 4], increment)
+
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for key in keys:
+                self.assertEqual(table.get(key)[2][0], 4000)
+            stats = table.stats()
+            self.assertEqual(stats['stripes'], 2)
+            table.close()
+
+
+    def test_agent_update(self):
+        # an agent blends through update exactly like it blends
+        #  through get and put
+        state = {'game_stage': Agent.IN_ROUND, 'dealer_show': Card('H', 10), 'agent_hand': (Card('S', 9), Card('C', 4))}
+        successor = {'game_stage': Agent.IN_ROUND, 'dealer_show': Card('H', 10), 'agent_hand': (Card('S', 9), Card('C', 4), Card('D', 2))}
+        with tempfile.TemporaryDirectory() as d:
+            shared = ConcurrentQTable(db=os.path.join(d, 'table.db'))
+            entries = []
+            for table in (QTable(db=':memory:'), shared):
+                agent = Agent(table=table, account=Account(chips=1000), alpha=0.3, beta=0.2, learning_rate=0.4, discount_factor=0.6)
+                random.seed(1)
+                agent.get_qvalues(state)
+                agent.get_qvalues(successor)
+                agent.update_parameters(state)
+                agent.update_parameters(successor)
+                entries.append(table.get(state))
+            self.assertEqual(entries[0], entries[1])
+            shared.close()
+
+
+    def test_play_threads(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'table.db')
+            table = ConcurrentQTable(db=db, size=256, stripes=4)
+            results = play_threads(4, {'seed': 0, 'rounds': 400}, {}, table, agent_chips=10 ** 6, dealer_chips=10 ** 6)
+            self.assertEqual(results['threads'], 4)
+            self.assertEqual(results['rounds'], 400)
+            stats = results['qtable']
+            self.assertEqual(stats['connections'], 4)
+            self.assertTrue(stats['operations'] > 400)
+            self.assertTrue(0 <= stats['contention'] <= 1)
+            table.close()
+            conn = sqlite3.connect(db)
+            self.assertEqual(conn.execute('select count(*) from qtable').fetchone()[0], stats['size'])
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
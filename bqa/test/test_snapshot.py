@@ -0,0 +1,61 @@
+from bqa.qtable import QTable
+from bqa.snapshot import SnapshotTable, snapshot_db, write_snapshot
+
+import os
+import tempfile
+import unittest
+
+
+class TestSnapshot(unittest.TestCase):
+
+
+    TEST_WEIGHTS = [0.1, 0.3, 0.6]
+    TEST_BIASES = [0.25, 0.25, 0.5]
+    TEST_QVALUES = [1234, 5678, 4321]
+
+
+    def test_get(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, 'table.db')
+            path = os.path.join(tmp, 'table.snap')
+            table = QTable(db=db)
+            for key in (5, 9, 13):
+                table.put(
+                    key,
+                    TestSnapshot.TEST_WEIGHTS,
+                    TestSnapshot.TEST_BIASES,
+                    TestSnapshot.TEST_QVALUES
+                )
+            table.put(4, [0.5, 0.5], [0.1, 0.2], [1, 0])
+            table.close()
+            self.assertEqual(snapshot_db(db, path), 4)
+            snapshot = SnapshotTable(path)
+            self.assertEqual(len(snapshot), 4)
+            self.assertTrue(snapshot.contains(9))
+            self.assertEqual(snapshot.get(9), [
+                TestSnapshot.TEST_WEIGHTS,
+                TestSnapshot.TEST_BIASES,
+                TestSnapshot.TEST_QVALUES
+            ])
+            self.assertEqual(snapshot.get(4), [[0.5, 0.5], [0.1, 0.2], [1, 0]])
+            # misses and puts only touch the private overlay
+            self.assertFalse(snapshot.contains(17))
+            snapshot.get(17)
+            self.assertTrue(snapshot.contains(17))
+            snapshot.close()
+
+
+    def test_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'table.snap')
+            write_snapshot([(1, [0.0] * 3, [0.0] * 3, [1.0] * 3)], path)
+            snapshot = SnapshotTable(path)
+            self.assertFalse(snapshot.reload())
+            write_snapshot([(1, [0.0] * 3, [0.0] * 3, [2.0] * 3)], path)
+            self.assertTrue(snapshot.reload())
+            self.assertEqual(snapshot.get(1)[2], [2.0] * 3)
+            snapshot.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+from bqa.batch import PAYOUTS
+from bqa.keys import state_key
+from bqa.qtable import QTable
+from bqa.solver import Solver, deals, face_variants, in_round_state, regret, warm_start
+
+import os
+import tempfile
+import unittest
+
+
+class TestSolver(unittest.TestCase):
+
+
+    def test_solve(self):
+        solver = Solver()
+        # a soft 21 stands and a hard 4 hits
+        solution = solver.solve(in_round_state(10, (1, 10)))
+        self.assertEqual(solution['action'], 'STAND')
+        self.assertGreater(solution['ev'], 0)
+        solution = solver.solve(in_round_state(6, (2, 2)))
+        self.assertEqual(solution['action'], 'HIT')
+        # hitting a hard 20 busts unless an ace comes
+        solution = solver.solve(in_round_state(10, (10, 10)))
+        self.assertLess(solution['hit'], solution['stand'])
+        self.assertGreater(solution['hit'], PAYOUTS['loss'])
+        # state keys solve to the same values
+        state = in_round_state(7, (9, 4))
+        self.assertEqual(solver.solve(state_key(state)), solver.solve(state))
+        self.assertGreater(solver.stats()['hits'], 0)
+
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            db = os.path.join(d, 'solver.db')
+            solver = Solver(db=db)
+            expected = solver.solve(in_round_state(5, (8, 5)))
+            solver.close()
+            solver = Solver(db=db)
+            self.assertEqual(solver.solve(in_round_state(5, (8, 5))), expected)
+            self.assertEqual(solver.stats()['misses'], 0)
+            solver.close()
+
+
+    def test_deals(self):
+        self.assertAlmostEqual(sum(p for _, _, p in deals(2)), 1)
+
+
+    def test_regret(self):
+        solver = Solver()
+        table = QTable(db=':memory:')
+        state = in_round_state(10, (10, 10))
+        weights, biases, qvalues = table.get(state)
+        # prefer hitting a hard 20
+        table.put(state, weights, biases, [0, 1, 0])
+        results = regret(table, solver)
+        solution = solver.solve(state)
+        self.assertEqual(results['states'], 1)
+        self.assertEqual(results['mistakes'], 1)
+        self.assertAlmostEqual(results['regret'], solution['stand'] - solution['hit'])
+
+
+    def test_face_variants(self):
+        variants = list(face_variants(10, (10, 10, 6)))
+        # 4 up-cards times 10 pairs of faces
+        self.assertEqual(len(variants), 40)
+        self.assertAlmostEqual(sum(p for _, _, p in variants), 1)
+        self.assertEqual(list(face_variants(5, (8, 6))), [(5, (8, 6), 1.0)])
+        # a single deck holds four kings
+        self.assertFalse([faces for up, faces, _ in face_variants(10, (10,) * 4) if up == 13 and faces == (13,) * 4])
+
+
+    def test_warm_start(self):
+        # solving every deal takes long, the seeding is the same
+        #  for any values
+        class Solved:
+            def solve(self, state, count=None):
+                return {'stand': 0.25, 'hit': -0.5, 'action': 'STAND', 'ev': 0.25}
+        solver = Solved()
+        table = QTable(db=':memory:', size=1 << 16)
+        seeded = warm_start(table, solver, max_cards=2)
+        self.assertEqual(seeded, len(table))
+        # the jacks, queens and kings are seeded like the tens
+        expected = table.get(in_round_state(10, (10, 6)))[2]
+        for up, hand in ((13, (13, 6)), (12, (11, 6)), (7, (12, 13)), (11, (1, 10))):
+            self.assertTrue(table.contains(in_round_state(up, hand)))
+        self.assertEqual(table.get(in_round_state(13, (12, 6)))[2], expected)
+        results = regret(table, solver)
+        self.assertAlmostEqual(results['coverage'], 1)
+        self.assertEqual(results['mistakes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from bqa.game import play
+from bqa.player import Account
+from bqa.qtable import QTable
+from bqa.telemetry import FIELDS, CallbackSink, make_sink
+
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+def _play(rounds, sink=None):
+    return play(
+        game_args={'seed': 3, 'rounds': rounds},
+        dealer_args={'account': Account(chips=100000)},
+        agent_args={'db': ':memory:', 'account': Account(chips=100000)},
+        sink=sink
+    )
+
+
+class TestTelemetry(unittest.TestCase):
+
+
+    def test_callback(self):
+        records = []
+        sink = CallbackSink(records.append, every=2)
+        results = _play(200, sink)
+        # recording a run does not change it
+        self.assertEqual(results, _play(200))
+        self.assertEqual(len(records), sink.emitted)
+        self.assertTrue(records)
+        for record in records:
+            self.assertEqual(record['round'] % 2, 0)
+            self.assertEqual(record['stages'][0], 0)
+            self.assertEqual(record['stages'][-1], 2)
+            self.assertEqual(len(record['actions']), len(record['qvalues']))
+            self.assertIn(record['outcome'], ('WIN', 'DRAW', 'LOSS'))
+
+
+    def test_no_extra_lookups(self):
+        # the recorded q-values are the ones the actions were
+        #  chosen from, not another lookup
+        stats = []
+        for sink in (None, CallbackSink(lambda record: None)):
+            table = QTable(db=':memory:', size=4096)
+            play(
+                game_args={'seed': 3, 'rounds': 200},
+                dealer_args={'account': Account(chips=100000)},
+                agent_args={'table': table, 'account': Account(chips=100000)},
+                sink=sink
+            )
+            stats.append(table.stats())
+        self.assertEqual(stats[0], stats[1])
+
+
+    def test_bounded_buffer(self):
+        batches = []
+        sink = CallbackSink(batches.append, buffer_size=4)
+        sink.write = lambda records: batches.append(len(records))
+        for i in range(10):
+            sink.emit({'round': i})
+        self.assertEqual(batches, [4, 4])
+        sink.close()
+        self.assertEqual(batches, [4, 4, 2])
+
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as d:
+            for name in ('rounds.jsonl', 'rounds.csv', 'rounds.db'):
+                path = os.path.join(d, name)
+                with make_sink(path, buffer_size=8) as sink:
+                    _play(100, sink)
+                if name.endswith('.jsonl'):
+                    with open(path) as f:
+                        rows = [json.loads(line) for line in f]
+                elif name.endswith('.csv'):
+                    with open(path, newline='') as f:
+                        rows = list(csv.DictReader(f))
+                    self.assertEqual(tuple(rows[0].keys()), FIELDS)
+                else:
+                    conn = sqlite3.connect(path)
+                    rows = conn.execute('select * from rounds').fetchall()
+                    conn.close()
+                self.assertEqual(len(rows), sink.emitted)
+        with self.assertRaises(ValueError):
+            make_sink('rounds.parquet')
+
+
+if __name__ == '__main__':
+    unittest.main()